@@ -8,18 +8,20 @@ license: TODO
 import difflib as diff
 import logging as log
 import time
+from collections import namedtuple
 
-import cv2
 import numpy as np
-import numpy.ma as ma
 import pyrealsense2 as rs
 
 # CONSTANTS
 METER_TO_FEET = 3.28084
 
+# cached description of a single pyrealsense2.option
+OptionInfo = namedtuple('OptionInfo', ['option', 'min', 'max', 'step', 'default', 'read_only'])
+
 
 class Camera():
-    def __init__(self, config: dict, width=848, height=480, framerate=0, metric=False):
+    def __init__(self, config: dict, width=848, height=480, framerate=0, metric=False, serial=None):
         """create a Camera object to interface with camera. 
         Creating a Camera object also creates a CameraOptions object
         used for setting and getting camera settings
@@ -32,12 +34,17 @@ class Camera():
         :type height: int, optional
         :param framerate: depth stream framerate, defaults to auto-negotiation
         :type framerate: int, optional
+        :param serial: serial number of the camera to use, defaults to the
+        first camera found
+        :type serial: string, optional
         """
         # connect to camera
         self.__context = rs.context()
         self.__context.set_devices_changed_callback(self.__disconnect_callback)
         self.__pipeline = rs.pipeline()
         self.__pipeline_config = rs.config()
+        if serial:
+            self.__pipeline_config.enable_device(serial)
         # depth stream
         self.__pipeline_config.enable_stream(rs.stream.depth,
                                              width,
@@ -46,20 +53,46 @@ class Camera():
                                              framerate)
         self.__profile = self.__pipeline.start(self.__pipeline_config)
         self.__pipeline.stop()
-        self.__depth_sensor = self.__profile.get_device().first_depth_sensor()
+        self.__device = self.__profile.get_device()
+        self.__depth_sensor = self.__device.first_depth_sensor()
         self.__depth_scale = self.__depth_sensor.get_depth_scale()
 
         # options object used to alter camera settings. all settings must
         #   be configured before calling the start() method of the camera
         self.options = CameraOptions(self.__profile, config)
 
+        self._init_frame_state(serial, self.__depth_scale, width, height, metric)
+
+    def _init_frame_state(self, serial, depth_scale: float, width: int, height: int,
+                          metric: bool) -> None:
+        """set the attributes used for frame handling and statistics. Split
+        from __init__ so a camera without a device can set them too
+
+        :param serial: serial number of the camera, None for the first found
+        :type serial: string
+        :param depth_scale: meters per depth unit
+        :type depth_scale: float
+        :param width: depth stream width
+        :type width: int
+        :param height: depth stream height
+        :type height: int
+        :param metric: report meters instead of feet
+        :type metric: bool
+        """
         # camera attributes
-        self.__conversion = METER_TO_FEET * self.__depth_scale
+        self.__serial = serial
+        self.__depth_scale = depth_scale
+        self.__conversion = METER_TO_FEET * depth_scale
         if metric:
-            self.__conversion = self.__depth_scale
+            self.__conversion = depth_scale
         self.__depth_frame = None
         self.__connected = False
         self.__frame_number = 0
+        self.__publisher = None
+        self.__spatial_filters = {}
+        self.__last_frame = (0, 0.0)
+        self.__last_roi_stats = None
+        self.__last_robust_stats = None
         # roi attributes
         self.__height = height
         self.__width = width
@@ -73,6 +106,11 @@ class Camera():
         """
         self.__depth_frame = fs.as_frameset().get_depth_frame()
         self.__frame_number = self.__depth_frame.frame_number
+        publisher = self.__publisher
+        if publisher is not None:
+            publisher.publish(np.asanyarray(self.__depth_frame.get_data()),
+                              self.__frame_number,
+                              self.__depth_frame.timestamp)
 
     def start(self):
         """start pipeline and setup new frameset callback"""
@@ -121,79 +159,75 @@ class Camera():
         :param info: rs.event
         :type info: rs.event
         """
+        if self.__serial:
+            # other cameras may come and go, only our own removal matters
+            if info.was_removed(self.__device):
+                self.__connected = False
+            return
         devs = info.get_new_devices()
         if devs.size() < 1:
             self.__connected = False
 
-    def roi_data(self, polygons: list, roi_select: int, filter_level=0):
-        """compute average of n-number of polygons"""
+    def roi_data(self, model, roi_select, filter_level=0, select_bits=None, per_roi=False,
+                 robust=False):
+        """compute depth, invalid percentage and deviation of the regions of
+        interest selected by 'roi_select'. The frame that was used is kept in
+        'last_frame'
+
+        :param model: compiled regions of interest
+        :type model: roi.RoiModel
+        :param roi_select: server select value, bit mask or array
+        :type roi_select: int or list
+        :param filter_level: spatial filter hole filling level (0-5), defaults to 0
+        :type filter_level: int, optional
+        :param select_bits: select mask width, defaults to a width that fits
+        every roi
+        :type select_bits: int, optional
+        :param per_roi: also compute every roi on its own and keep the
+        result in 'last_roi_stats', defaults to False
+        :type per_roi: bool, optional
+        :param robust: also compute median, p5, p95 and trimmed mean of the
+        selected rois and keep them in 'last_robust_stats', defaults to False
+        :type robust: bool, optional
+        :return: depth, invalid, deviation
+        :rtype: tuple
+        """
 
         ret = float(0), float(100), float(0)
+        self.__last_roi_stats = None
+        self.__last_robust_stats = None
         depth_frame = self.__depth_frame
         if isinstance(depth_frame, rs.depth_frame):
+            self.__last_frame = (depth_frame.frame_number, depth_frame.timestamp)
             filter_level = min(max(int(filter_level), 0), 5)
+            selection = model.select(roi_select, select_bits)
 
-            # clamp roi_select to 8 bit integer
-            roi_select = min(max(int(roi_select), 0), 255)
-
-            # build select list (ex. 137 -> [1, 0, 0, 0, 1, 0, 0, 1])
-            select_list = []
-            for bit in format(roi_select, '08b'):
-                select_list.append(bool(int(bit)))
-
-            # build polygon list ( [[x1, y1, x2, y2], [x1, y1, x2, y2]] )
-            polygon_list = []
-            for i in range(len(polygons)):
-                if select_list[i]:
-                    polygon_list.append(np.array(polygons[i]))
-            polygon_list = np.asanyarray(polygon_list)
-
-            if len(polygon_list) > 0:
-                blank_image = np.zeros((self.__height, self.__width))
-
+            if len(selection) > 0 or per_roi:
                 # create depth image and filter if necessary
                 if filter_level == 0:
                     depth_image = np.asanyarray(depth_frame.get_data())
                 else:
-                    spatial = rs.spatial_filter()
-                    spatial.set_option(rs.option.holes_fill, filter_level)
-                    depth_image = spatial.process(depth_frame)
+                    depth_image = self.__spatial_filter(filter_level).process(depth_frame)
                     depth_image = np.asanyarray(depth_image.get_data())
 
-                # Compute mask from polygon vertices
-                mask = blank_image
-                for polygon in polygon_list:
-                    if len(polygon) > 0:
-                        mask += cv2.fillPoly(blank_image, pts=[polygon], color=1)
-                mask = mask.astype('bool')
-                mask = np.invert(mask)
-
-                # Apply mask to depth data
-                depth_mask = ma.array(depth_image, mask=mask, fill_value=0)
-
-                # calculate standard deviation and percentage of invalid pixels
-                total = ma.count(depth_mask)
-                if total > 0:
-                    invalid = (depth_mask == 0).sum()
-                    invalid = (invalid / total) * 100
-                    deviation = depth_mask.std() * self.__conversion
-                else:
-                    deviation = float(0)
-                    invalid = float(100)
-
-                # filter out invalid and 0 distances
-                depth_mask = ma.masked_invalid(depth_mask)
-                depth_mask = ma.masked_equal(depth_mask, 0)
-
-                # Compute average distance of the region of interest
-                ROI_depth = depth_mask.mean() * self.__conversion
-
-                if isinstance(ROI_depth, np.float64):
-                    ret = ROI_depth.item(), invalid, deviation
-                else:
-                    ret = float(0), invalid, deviation
+                if len(selection) > 0:
+                    ret = model.statistics(depth_image, selection, self.__conversion)
+                    if robust:
+                        self.__last_robust_stats = model.robust_statistics(
+                            depth_image, selection, self.__conversion)
+                if per_roi:
+                    self.__last_roi_stats = model.roi_statistics(depth_image, self.__conversion)
         return ret
 
+    def __spatial_filter(self, filter_level: int):
+        """spatial filter for 'filter_level', created once per level"""
+        spatial = self.__spatial_filters.get(filter_level)
+        if spatial is None:
+            spatial = rs.spatial_filter()
+            spatial.set_option(rs.option.holes_fill, filter_level)
+            self.__spatial_filters[filter_level] = spatial
+        return spatial
+
     @property
     def asic_temperature(self):
         """asic temperature in degrees celcius. Raises RunTimeError
@@ -242,6 +276,54 @@ class Camera():
         """
         return self.__connected
 
+    @property
+    def width(self) -> int:
+        """depth stream width"""
+        return self.__width
+
+    @property
+    def height(self) -> int:
+        """depth stream height"""
+        return self.__height
+
+    @property
+    def depth_scale(self):
+        """depth sensor scale in meters per depth unit
+
+        :return: depth scale
+        :rtype: float
+        """
+        return self.__depth_scale
+
+    @property
+    def publisher(self):
+        """frame bus publisher every new depth frame is written to, None
+        if frames are not published
+
+        :return: publisher
+        :rtype: framebus.FramePublisher or None
+        """
+        return self.__publisher
+
+    @publisher.setter
+    def publisher(self, publisher):
+        """set frame bus publisher
+
+        :param publisher: publisher or None to stop publishing
+        :type publisher: framebus.FramePublisher or None
+        """
+        self.__publisher = publisher
+
+    @property
+    def serial(self):
+        """serial number requested for this camera, None if the first
+        camera found was used
+
+        :return: serial number
+        :rtype: string or None
+        """
+        return self.__serial
+
     @property
     def frame_number(self) -> int:
         """return frame number from last depth callback
@@ -251,6 +333,24 @@ class Camera():
         """
         return self.__frame_number
 
+    @property
+    def last_frame(self) -> tuple:
+        """frame number and timestamp (ms) of the frame used by the last
+        roi_data() call"""
+        return self.__last_frame
+
+    @property
+    def last_roi_stats(self):
+        """per roi (depth, invalid, deviation) arrays of the last
+        roi_data(per_roi=True) call, None otherwise"""
+        return self.__last_roi_stats
+
+    @property
+    def last_robust_stats(self):
+        """(median, p5, p95, trimmed mean) of the selected rois of the last
+        roi_data(robust=True) call, None otherwise"""
+        return self.__last_robust_stats
+
 
 class CameraOptions():
     def __init__(self, profile, config):
@@ -264,6 +364,7 @@ class CameraOptions():
         self.__profile = profile
         self.__config = config
         self.__camera_options = []
+        self.__option_index = {}
         self.__user_options = []
         self.__depth_sensor = self.__profile.get_device().first_depth_sensor()
 
@@ -276,15 +377,24 @@ class CameraOptions():
         self.set_all_options()
 
     def get_camera_options(self):
-        """queries depth sensor and retrieves all supported options
+        """queries depth sensor once and builds an index of every supported
+        option (pyrealsense2.option, range, default and read only flag). All
+        later option lookups use the index and do not reach the device
 
         :return: camera options
         :rtype: list
         """
-        cam_ops = self.__depth_sensor.get_supported_options()
-        for op in cam_ops:
-            op = op.name
-            self.__camera_options.append(op)
+        self.__option_index = {}
+        for op in self.__depth_sensor.get_supported_options():
+            try:
+                value_range = self.__depth_sensor.get_option_range(op)
+                read_only = self.__depth_sensor.is_option_read_only(op)
+                info = OptionInfo(op, value_range.min, value_range.max,
+                                  value_range.step, value_range.default, read_only)
+            except RuntimeError:
+                info = OptionInfo(op, None, None, None, None, True)
+            self.__option_index[op.name] = info
+        self.__camera_options = list(self.__option_index)
         return self.__camera_options
 
     def get_user_options(self):
@@ -294,10 +404,10 @@ class CameraOptions():
         which do not pertain to 'pyrealsense2.option'
         :rtype: list
         """
+        self.__user_options = []
         usr_ops = self.__config['camera']
-        cam_ops = self.__camera_options
         for op in usr_ops:
-            if op in cam_ops:
+            if op in self.__option_index:
                 self.__user_options.append(op)
         return self.__user_options
 
@@ -308,14 +418,12 @@ class CameraOptions():
         method attempts to find the closest match. The closest match will NOT be
         attempted to set, but logged as a warning
         """
-        cam_ops = self.__camera_options
         usr_ops = self.__user_options
 
         for set_op in usr_ops:
-            if cam_ops.count(set_op) > 0:
-                if hasattr(rs.option, set_op):
-                    if self.writable(set_op):
-                        self.set_rs_option(set_op)
+            if set_op in self.__option_index:
+                if self.writable(set_op):
+                    self.set_rs_option(set_op)
             else:
                 closest_match = diff.get_close_matches(
                     set_op, self.__camera_options, cutoff=0.7)
@@ -325,6 +433,25 @@ class CameraOptions():
                 else:
                     log.warning(f'Failed to set "{set_op}"')
 
+    def update_settings(self, config):
+        """replace the configuration dictionary and write only the options
+        whose configured value changed
+
+        :param config: configuration dictionary
+        :type config: dict
+        :return: names of the options that were written
+        :rtype: list
+        """
+        previous = self.__config.get('camera', {})
+        self.__config = config
+        self.get_user_options()
+        changed = []
+        for option in self.__user_options:
+            if previous.get(option) != config['camera'].get(option) and self.writable(option):
+                self.set_rs_option(option)
+                changed.append(option)
+        return changed
+
     def writable(self, option):
         """checks if 'option' is able to be written to
 
@@ -333,8 +460,7 @@ class CameraOptions():
         :return: true if option is writable, false if readonly
         :rtype: bool
         """
-        option = getattr(rs.option, option)
-        return not self.__depth_sensor.is_option_read_only(option)
+        return not self.__option_index[option].read_only
 
     def constrain_option_value(self, option, set_val):
         """constrains a desired set value to the pyrealsense2.option range while
@@ -347,9 +473,8 @@ class CameraOptions():
         :return: constrained set point
         :rtype: float
         """
-        value_range = self.__depth_sensor.get_option_range(
-            getattr(rs.option, option))
-        min_val, max_val, step_size = value_range.min, value_range.max, value_range.step
+        info = self.__option_index[option]
+        min_val, max_val, step_size = info.min, info.max, info.step
         # round set value to nearest step size
         set_val = step_size * round(set_val / step_size)
         # constrain set_value within value_range
@@ -369,7 +494,7 @@ class CameraOptions():
         :param set_option: pyrealsense2.option name
         :type set_option: string
         """
-        rs_option = getattr(rs.option, set_option)
+        rs_option = self.__option_index[set_option].option
         raw_val = float(self.__config['camera'][set_option])
         set_val = self.constrain_option_value(set_option, raw_val)
         self.__depth_sensor.set_option(rs_option, set_val)
@@ -385,14 +510,13 @@ class CameraOptions():
         :rtype: bool
         """
 
-        if self.__camera_options.count(option_name) > 0:
-            if hasattr(rs.option, option_name):
-                if self.writable(option_name):
-                    rs_option = getattr(rs.option, option_name)
-                    set_value = self.constrain_option_value(
-                        option_name, set_value)
-                    self.__depth_sensor.set_option(rs_option, set_value)
-                    return True
+        if option_name in self.__option_index:
+            if self.writable(option_name):
+                rs_option = self.__option_index[option_name].option
+                set_value = self.constrain_option_value(
+                    option_name, set_value)
+                self.__depth_sensor.set_option(rs_option, set_value)
+                return True
         return False
 
     def get_camera_value(self, option):
@@ -403,11 +527,9 @@ class CameraOptions():
         :return: returns setting value or None 
         :rtype: float or None
         """
-        if self.__camera_options.count(option) > 0:
-            if hasattr(rs.option, option):
-                rs_option = getattr(rs.option, option)
-                value = self.__depth_sensor.get_option(rs_option)
-                return value
+        info = self.__option_index.get(option)
+        if info is not None:
+            return self.__depth_sensor.get_option(info.option)
         return None
 
     def log_settings(self):
@@ -9,6 +9,8 @@ import configparser
 import logging as log
 from typing import Union
 
+from settings import Settings
+
 MSG_ERROR_SHUTDOWN = "~~~~~~~~~~~~~~~Error Exited Application~~~~~~~~~~~~~~\n"
 
 
@@ -24,6 +26,7 @@ class Config():
         :raises FileNotFoundError: if unable to open file
         :raises RuntimeError: if there is a discrepency between the configuration
         file data and the requried data dict
+        :raises SettingsError: if values are missing or can not be converted
         """
         self._file_name = file_name
         config_file = configparser.ConfigParser()
@@ -44,6 +47,9 @@ class Config():
                 raise RuntimeError(
                     f'"{self._file_name}" is missing required configuration data: "{validity}"')
 
+        # converted once, nothing is parsed after this
+        self._settings = Settings(self._data)
+
     def get_value(self, section: str, key: str, fallback=None) -> str:
         """gets config file value at specified location
 
@@ -83,6 +89,11 @@ class Config():
                         missing.append((section, key))
         return missing
 
+    @property
+    def settings(self) -> Settings:
+        """typed configuration"""
+        return self._settings
+
     @property
     def data(self) -> dict:
         """configuration file contents
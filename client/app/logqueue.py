@@ -0,0 +1,164 @@
+"""
+title:   RealSenseOPC non-blocking logging
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Log calls only format the record and put it on a bounded queue. A listener
+thread owns the real handlers (rotating log file, console) and does all of
+the disk I/O, so a slow disk or a log rotation never stalls the main loop.
+
+When the queue is full records are dropped instead of blocking. Dropped
+records are counted and reported once there is room again. Repeated
+messages from the same line of code (a node that fails to write every loop
+for example) are collapsed: the first one is logged, the rest are counted
+and the count is attached to the next one that gets through. Only identical
+messages are repeats, so one failing station does not hide the same warning
+from another.
+"""
+
+import atexit
+import logging as log
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# CONSTANTS
+QUEUE_SIZE = 10000  # records
+RATE_LIMIT_INTERVAL = 10.0  # seconds between repeats of the same message
+MAX_SITES = 4096  # remembered messages before the rate limiter starts over
+
+_listener = None
+_handler = None
+
+
+class BoundedQueueHandler(QueueHandler):
+    def __init__(self, size=QUEUE_SIZE):
+        """queue handler that drops records instead of blocking when the
+        listener falls behind
+
+        :param size: maximum number of queued records, defaults to QUEUE_SIZE
+        :type size: int, optional
+        """
+        super().__init__(queue.Queue(maxsize=size))
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._reported = 0
+
+    def enqueue(self, record: log.LogRecord) -> None:
+        if self._dropped != self._reported:
+            # report dropped records before the next one that fits
+            with self._lock:
+                missed = self._dropped - self._reported
+            notice = log.makeLogRecord({
+                'name': record.name,
+                'levelno': log.WARNING,
+                'levelname': log.getLevelName(log.WARNING),
+                'msg': f'Dropped {missed} log message(s), logging queue was full'})
+            try:
+                self.queue.put_nowait(notice)
+                with self._lock:
+                    self._reported += missed
+            except queue.Full:
+                pass
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    @property
+    def dropped(self) -> int:
+        """number of records dropped since start"""
+        return self._dropped
+
+
+class RateLimitFilter(log.Filter):
+    def __init__(self, interval=RATE_LIMIT_INTERVAL):
+        """let a repeated message through once every 'interval' seconds.
+        Messages logged with exc_info are never limited
+
+        :param interval: seconds, defaults to RATE_LIMIT_INTERVAL
+        :type interval: float, optional
+        """
+        super().__init__()
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._sites = {}  # message key -> [last emitted, suppressed]
+
+    def filter(self, record: log.LogRecord) -> bool:
+        if record.exc_info or self._interval <= 0:
+            return True
+        # the message names the station or node, the same line of code
+        #   failing for another one is not a repeat
+        key = (record.pathname, record.lineno, record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                if len(self._sites) >= MAX_SITES:
+                    self._sites.clear()
+                self._sites[key] = [now, 0]
+                return True
+            if now - site[0] < self._interval:
+                site[1] += 1
+                return False
+            suppressed = site[1]
+            site[0], site[1] = now, 0
+        if suppressed:
+            record.msg = f'{record.getMessage()} (repeated {suppressed} more time(s))'
+            record.args = None
+        return True
+
+
+def start(handlers: list, size=QUEUE_SIZE, interval=RATE_LIMIT_INTERVAL) -> None:
+    """route the root logger through a bounded queue to 'handlers'
+
+    :param handlers: handlers doing the actual output, run on the listener thread
+    :type handlers: list
+    :param size: queue size, defaults to QUEUE_SIZE
+    :type size: int, optional
+    :param interval: rate limit interval in seconds, 0 disables, defaults to
+    RATE_LIMIT_INTERVAL
+    :type interval: float, optional
+    """
+    global _listener, _handler
+    stop()
+    _handler = BoundedQueueHandler(size)
+    _handler.addFilter(RateLimitFilter(interval))
+    _listener = QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    root = log.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_handler)
+    _listener.start()
+    atexit.register(stop)
+
+
+def stop() -> None:
+    """write out everything still queued and stop the listener. Call before
+    os._exit(), which skips atexit"""
+    global _listener, _handler
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    try:
+        listener.stop()
+    except queue.Full:
+        # no room for the stop sentinel, the thread is a daemon anyway
+        pass
+    for handler in listener.handlers:
+        handler.close()
+    log.getLogger().removeHandler(_handler)
+    _handler = None
+
+
+def running() -> bool:
+    """true while the listener is running"""
+    return _listener is not None
+
+
+def dropped() -> int:
+    """number of log records dropped because the queue was full"""
+    return _handler.dropped if _handler is not None else 0
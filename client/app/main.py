@@ -10,15 +10,20 @@ from logging.handlers import RotatingFileHandler
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import opcua
 import opcua.ua.uatypes
-import pyrealsense2 as rs
 from opcua import Node, ua
 
 from camera import Camera
 from config import Config
-from status import Status
+from framebus import FramePublisher
+import logqueue
+from memtrack import MemoryTracker
+from profiler import Profiler
+from reload import ConfigWatcher
+from station import Station
 
 # CONFIGURATION
 DEBUG = False
@@ -31,7 +36,6 @@ g_retries = 0
 # CONSTANTS
 WIDTH = 848  # dont change this
 HEIGHT = 480  # or this
-NUM_OF_ROI = 8  # or this
 if DEBUG:
     LOG_FORMAT = '%(levelname)-10s %(asctime)-25s LINE:%(lineno)-5d THREAD:%(thread)-7d %(message)s'
     WAIT_BEFORE_RESTARTING = 0
@@ -79,41 +83,30 @@ def _setup_config(path: str) -> Config:
 
 
 def _setup_logging(config: Config) -> None:
-    """setup root and opcua logging levels"""
-    if DEBUG:
-        log.basicConfig(level=log.DEBUG)
-    else:
-        log.basicConfig(
-            handlers=[RotatingFileHandler('log', maxBytes=100000, backupCount=10)],
-            level=log.DEBUG, format=LOG_FORMAT)
-    try:
-        # root logger
-        raw_level = config.get_value('logging',
-                                     'logging_level',
-                                     fallback='debug').upper()
-        log_level = getattr(log, raw_level, log.DEBUG)
-        log.getLogger().setLevel(log_level)
-
-        # opcua module logger
-        raw_level = config.get_value('logging',
-                                     'opcua_logging_level',
-                                     fallback='warning').upper()
-        opcua_log_level = getattr(log, raw_level, log.WARNING)
-        log.getLogger(opcua.__name__).setLevel(opcua_log_level)
-
-        log.info('Successfully setup logging')
-    except (ValueError, TypeError, KeyError) as e:
-        log.getLogger().setLevel(log.INFO)
-        log.getLogger(opcua.__name__).setLevel(log.WARNING)
-        log.warning(f'Failed to set logging levels '
-                    f'from user configuration: {e}')
+    """setup root and opcua logging levels. Records are written by a
+    background thread so disk I/O never blocks the main loop"""
+    settings = config.settings.logging
+    if not logqueue.running():
+        if DEBUG:
+            handler = log.StreamHandler()
+        else:
+            handler = RotatingFileHandler('log', maxBytes=100000, backupCount=10)
+        handler.setFormatter(log.Formatter(LOG_FORMAT))
+        logqueue.start([handler], size=settings.queue_size, interval=settings.rate_limit)
+
+    # values were converted when the configuration was loaded
+    log.getLogger().setLevel(settings.logging_level)
+    log.getLogger(opcua.__name__).setLevel(settings.opcua_logging_level)
+    log.info('Successfully setup logging')
+    if config.settings.defaults:
+        log.info(f'Configuration does not set {list(config.settings.defaults)}, using defaults')
 
 
 def _setup_opc(config: Config) -> opcua.Client:
     """setup opc connection"""
     try:
         # config_copy = config
-        ip = str(config.get_value('server', 'ip'))
+        ip = config.settings.server.ip
         client = opcua.Client(ip)
         client.connect()
         log.info(f'Successfully setup opc client connection to "{ip}"')
@@ -134,39 +127,75 @@ def _setup_opc(config: Config) -> opcua.Client:
     return client
 
 
-def _setup_camera(config: Config) -> Camera:
+def _setup_camera(config: Config, serial=None) -> Camera:
+    """connect, configure and start a single camera. Raises RuntimeError
+    on failure"""
+    settings = config.settings.station(serial).camera
+    camera = Camera({'camera': settings.options},
+                    width=WIDTH,
+                    height=HEIGHT,
+                    framerate=settings.framerate,
+                    metric=True,
+                    serial=serial)
+    camera.options.write_all_settings()
+    camera.options.log_settings()
+    camera.start()
+
+    log.info(f'Successfully setup camera "{serial if serial else "default"}"')
+    return camera
+
+
+def _setup_cameras(config: Config) -> list:
+    """setup every camera listed under '[cameras]: serials', or the first
+    camera found if none are listed"""
+    cameras = []
     try:
-        # connect camera
-        # config_copy = config
-        framerate = int(config.get_value('camera', 'framerate', fallback='0'))
-        camera = Camera(config.data,
-                        width=WIDTH,
-                        height=HEIGHT,
-                        framerate=framerate,
-                        metric=True)
-        camera.options.write_all_settings()
-        camera.options.log_settings()
-        camera.start()
-
-        log.info('Successfully setup camera')
+        for serial in config.settings.cameras.serials or [None]:
+            cameras.append(_setup_camera(config, serial))
     except RuntimeError as e:
+        # release the cameras that already started so the restart can
+        # open them again
+        for camera in cameras:
+            try:
+                camera.stop()
+            except RuntimeError:
+                pass
         sleep_time = 5
         log.critical(f'Failed to setup camera. '
                      f'Restarting in {sleep_time} seconds: {e}')
         time.sleep(sleep_time)
-        # _setup_camera(config_copy)
         main()
-    return camera
+    return cameras
+
+
+def _setup_frame_bus(config: Config, cameras: list) -> list:
+    """publish every camera's depth frames to shared memory so other
+    programs (ROI Utility) can read them while the client owns the cameras.
+    Disabled unless '[application]: frame_bus' is set"""
+    publishers = []
+    bus = config.settings.application.frame_bus
+    if bus:
+        for camera in cameras:
+            name = f'{bus}_{camera.serial}' if camera.serial else bus
+            try:
+                camera.publisher = FramePublisher(name, width=WIDTH, height=HEIGHT,
+                                                  depth_scale=camera.depth_scale)
+                publishers.append(camera.publisher)
+                log.info(f'Publishing depth frames to frame bus "{name}"')
+            except (OSError, ValueError) as e:
+                log.warning(f'Failed to create frame bus "{name}": {e}')
+    return publishers
 
 
 def setup() -> tuple:
     """setup components
 
-    :return: client, camera, config
+    :return: client, cameras, config
     :rtype: tuple
     """
     try:
-        steps = ['configuration setup', 'logging setup', 'opc setup', 'camera setup']
+        steps = ['configuration setup', 'logging setup', 'opc setup', 'camera setup',
+                 'frame bus setup']
         step = 0
         config = _setup_config('configuration.ini')
         step += 1
@@ -174,67 +203,71 @@ def setup() -> tuple:
         step += 1
         client = _setup_opc(config)
         step += 1
-        camera = _setup_camera(config)
+        cameras = _setup_cameras(config)
+        step += 1
+        _setup_frame_bus(config, cameras)
     except RecursionError:
         log.critical('Maximum setup retries reached')
         log.critical(MSG_ERROR_SHUTDOWN)
+        logqueue.stop()
         os._exit(1)
     except Exception as e:
         log.critical(f'Error in setup. Could not complete "{steps[step]}": {e}')
+        logqueue.stop()
         os._exit(1)
 
-    return client, camera, config
+    return client, cameras, config
 
 
 class App:
     def __init__(
-            self, client: opcua.Client, camera: Camera, configurator: Config):
+            self, client: opcua.Client, cameras: list, configurator: Config):
 
         self._running = False
 
         self._client = client
-        self._camera = camera
+        self._cameras = cameras
         self._configurator = configurator
 
-        # nodes
-        self._nodes = {
-            'roi_depth': None,
-            'roi_invalid': None,
-            'roi_deviation': None,
-            'roi_select': None,
-            'status': None,
-            'alive': None
-        }
-        self.get_nodes()
-
-        # status
-        self._status = Status(self._camera, self._nodes)
-        self._previous_status = self._status.status
-        self.send_status()
-
-        # camera
-        self._sleep_time = float(self._configurator.get_value(
-            'application', 'sleep_time', fallback='20'))
-        self._spatial_filter_level = int(self._configurator.get_value(
-            'camera', 'spatial_filter_level', fallback='0'))
-
-        self._roi_depth = 0.0
-        self._roi_invalid = 100.0
-        self._roi_deviation = 0.0
-
-        # get regions of interest
-        self._polygons = []
-        for key in self._configurator.data['roi']:
-            poly = list(eval(self._configurator.get_value('roi', key, fallback='[]')))
-            self._polygons.append(poly)
-        if len(self._polygons) < NUM_OF_ROI:
-            self.error(f'Missing regions of interest from configuration file. '
-                       f'Need {NUM_OF_ROI}, found {len(self._polygons)}', False)
-
-        self.set_roi_exposure()
-
-        self._sleep_time = float(self._configurator.get_value(
-            'application', 'sleep_time', '15')) / 1000
+        # one station per camera, all sharing the opc client
+        self._stations = []
+        try:
+            for camera in self._cameras:
+                self._stations.append(Station(self._client, camera, self._configurator))
+        except RuntimeError as e:
+            self.error(str(e), False)
+        self.check_stations()
+        self.open_measurements()
+
+        # stations are processed in parallel when there is more than one
+        self._executor = None
+        if len(self._stations) > 1:
+            self._executor = ThreadPoolExecutor(max_workers=len(self._stations),
+                                                thread_name_prefix='station')
+
+        self._sleep_time = self._configurator.settings.application.sleep_time
+
+        # watch configuration file and apply changes without restarting
+        self._watcher = None
+        if self._configurator.settings.application.hot_reload:
+            self._watcher = ConfigWatcher(self._configurator.name, self.prepare_reload)
+            self._watcher.start()
+
+        # sampling profiler, idle until triggered. profiles are written next
+        #   to the log
+        settings = self._configurator.settings.profiler
+        self._profiler = Profiler(os.path.dirname(os.path.abspath('log')), settings.interval,
+                                  settings.duration, settings.sentinel)
+        self._profiler.start()
+        if settings.enabled:
+            self._profiler.trigger()
+
+        # memory use and growth in the log
+        self._memory = None
+        settings = self._configurator.settings.memory
+        if settings.enabled:
+            self._memory = MemoryTracker(settings.interval, settings.tracemalloc, settings.top)
+            self._memory.start()
 
         self._last_log_time = time.time()
         self._start_time = time.time()
@@ -242,50 +275,161 @@ class App:
     def run(self) -> None:
         """main loop"""
         try:
-            log.info('Running')
+            log.info(f'Running {len(self._stations)} station(s)')
             self._start_time = time.time()
             self._running = True
             global g_retries
             g_retries = 0
-            while self._camera.connected and self._running:
-                self.update_roi_data()
-                self.send_roi_data()
-                self.send_alive()
-                self.send_status()
+            while self.connected and self._running:
+                self.apply_reload()
+                start = time.perf_counter()
+                selects, alives = self.read_nodes()
+                self.update_roi_data(selects)
+                writes = []
+                for station, alive in zip(self._stations, alives):
+                    writes += station.roi_writes()
+                    writes += station.alive_writes(alive)
+                    writes += station.status_writes()
+                self.write_nodes(writes)
+                latency = (time.perf_counter() - start) * 1000
+                for station in self._stations:
+                    station.record_measurement(latency)
                 time.sleep(self._sleep_time)
         except Exception as e:
             self.error(f'Failure in main program loop: {e}')
 
-    def update_roi_data(self) -> None:
-        """query camera for updated roi data"""
-        self._roi_select = self._nodes['roi_select'].get_value()
-
-        self._roi_depth, self._roi_invalid, self._roi_deviation = self._camera.roi_data(
-            polygons=self._polygons,
-            roi_select=self._roi_select,
-            filter_level=self._spatial_filter_level)
-
-    def send_roi_data(self) -> None:
-        """send depth, invalid, and deviation to server"""
-        self.write_node(self._nodes['roi_depth'], self._roi_depth, ua.VariantType.Float)
-        self.write_node(self._nodes['roi_invalid'], self._roi_invalid, ua.VariantType.Float)
-        self.write_node(self._nodes['roi_deviation'], self._roi_deviation, ua.VariantType.Float)
-
-    def send_alive(self) -> bool:
-        """set alive to true if false"""
-        if not self._nodes['alive'].get_value():
-            self.write_node(self._nodes['alive'], True, ua.VariantType.Boolean)
-            return True
-        return False
-
-    def send_status(self) -> bool:
-        """send status to server"""
-        new_status = self._status.status
-        if new_status != self._previous_status:
-            self._previous_status = new_status
-            self.write_node(self._nodes['status'], new_status, ua.VariantType.Int16)
+    def open_measurements(self) -> None:
+        """log every station's results if '[measurements] enabled' is set"""
+        settings = self._configurator.settings.measurements
+        if not settings.enabled:
+            return
+        directory = os.path.join(os.path.dirname(os.path.abspath(self._configurator.name)),
+                                 settings.directory)
+        for station in self._stations:
+            try:
+                station.open_measurements(directory, settings.roi_stats, settings.retention_days)
+            except OSError as e:
+                log.warning(f'Failed to open measurement log for station "{station.name}": {e}')
+        log.info(f'Logging measurements to "{directory}"')
+
+    def prepare_reload(self) -> tuple:
+        """load the changed configuration file and prepare every station.
+        Runs on the watcher thread
+
+        :return: configuration, prepared station settings, sleep time
+        :rtype: tuple
+        """
+        configurator = Config(self._configurator.name, REQUIRED_DATA)
+        restart = self.restart_changes(configurator)
+        if restart:
+            log.warning(f'Configuration changes to {restart} take effect after a restart')
+        prepared = [station.prepare(configurator) for station in self._stations]
+        return configurator, prepared, configurator.settings.application.sleep_time
+
+    def apply_reload(self) -> bool:
+        """swap in a prepared configuration if there is one. Called between
+        frames"""
+        if self._watcher is None:
+            return False
+        pending = self._watcher.take()
+        if pending is None:
+            return False
+        start = time.perf_counter()
+        configurator, prepared, sleep_time = pending.value
+        for station, settings in zip(self._stations, prepared):
+            station.apply(settings)
+        self.apply_profiler(self._configurator.settings.profiler, configurator.settings.profiler)
+        self._configurator = configurator
+        self._sleep_time = sleep_time
+        end = time.perf_counter()
+        log.info(f'Reloaded "{configurator.name}": applied in {(end - start) * 1000:.1f} ms, '
+                 f'prepared in {pending.prepare_time * 1000:.1f} ms, '
+                 f'{(end - pending.detected) * 1000:.1f} ms after change was detected')
+        return True
+
+    def apply_profiler(self, old, new) -> None:
+        """reconfigure the profiler and start a window if 'enabled' was
+        turned on
+
+        :param old: current profiler settings
+        :type old: ProfilerSettings
+        :param new: reloaded profiler settings
+        :type new: ProfilerSettings
+        """
+        if old == new:
+            return
+        self._profiler.configure(new.interval, new.duration, new.sentinel)
+        if new.enabled and not old.enabled:
+            self._profiler.trigger()
+
+    def restart_changes(self, configurator: Config) -> list:
+        """settings that changed in 'configurator' but can not be applied
+        without restarting (server, nodes, cameras, framerate, frame bus,
+        measurements, memory)
+
+        :return: changed '[section]: key' descriptions
+        :rtype: list
+        """
+        old, new = self._configurator.settings, configurator.settings
+        changed = []
+        for section in ('server', 'cameras'):
+            if getattr(old, section) != getattr(new, section):
+                changed.append(f'[{section}]')
+        for station in self._stations:
+            serial = station.camera.serial
+            if old.station(serial).nodes != new.station(serial).nodes:
+                changed.append(f'nodes of "{station.name}"')
+            if old.station(serial).camera.framerate != new.station(serial).camera.framerate:
+                changed.append(f'framerate of "{station.name}"')
+        if old.application.frame_bus != new.application.frame_bus:
+            changed.append('[application]: frame_bus')
+        if old.measurements != new.measurements:
+            changed.append('[measurements]')
+        if old.memory != new.memory:
+            changed.append('[memory]')
+        return changed
+
+    def read_nodes(self) -> tuple:
+        """read every station's roi select and alive node in one request
+
+        :return: roi select values, alive values
+        :rtype: tuple
+        """
+        nodes = []
+        for station in self._stations:
+            nodes.append(station.nodes['roi_select'])
+            nodes.append(station.nodes['alive'])
+        values = self._client.get_values(nodes)
+        return values[0::2], values[1::2]
+
+    def update_roi_data(self, selects: list) -> None:
+        """compute roi data of every station"""
+        if self._executor is None:
+            for station, roi_select in zip(self._stations, selects):
+                station.update_roi_data(roi_select)
+        else:
+            # list() re-raises worker exceptions here
+            list(self._executor.map(Station.update_roi_data, self._stations, selects))
+
+    def write_nodes(self, writes: list) -> bool:
+        """write values to nodes in one request. Falls back to writing node
+        by node if the request fails so the failing node gets logged
+
+        :param writes: (node, value, type) tuples
+        :type writes: list
+        """
+        if len(writes) < 1:
             return True
-        return False
+        nodes = [node for node, _, _ in writes]
+        values = [ua.DataValue(ua.Variant(value, type)) for _, value, type in writes]
+        try:
+            self._client.set_values(nodes, values)
+        except ua.UaError:
+            ok = True
+            for node, value, type in writes:
+                ok = self.write_node(node, value, type) and ok
+            return ok
+        return True
 
     def write_node(self, node: Node, value, type: ua.VariantType) -> bool:
         """write value to node
@@ -305,54 +449,20 @@ class App:
             return False
         return True
 
-    def get_nodes(self) -> None:
-        """retrieve nodes from opc server"""
-        try:
-            self._nodes = {
-                'roi_depth': self.get_node('roi_depth_node'),
-                'roi_invalid': self.get_node('roi_invalid_node'),
-                'roi_deviation': self.get_node('roi_deviation_node'),
-                'roi_select': self.get_node('roi_select_node'),
-                'status': self.get_node('status_node'),
-                'alive': self.get_node('alive_node')
-            }
-        except (ua.UaError, KeyError) as e:
-            self.error(f'Failed to retrieve nodes from server: {e}', False)
-
-    def get_node(self, name: str) -> Node:
-        """retrieve node from opc server"""
-        return self._client.get_node(str(self._configurator.get_value('nodes', name)))
-
-    def roi_box(self) -> tuple:
-        """calculate regions of interest bounding box"""
-        polys = self._polygons
-        x = [y[0] for x in polys for y in x if len(x) > 2]
-        y = [y[1] for x in polys for y in x if len(x) > 2]
-        if len(x) and len(y) > 2:
-            x1, y1 = max(min(x), 0), max(min(y), 0)
-            x2, y2 = min(max(x), 847), min(max(y), 479)
-
-            if x1 != x2 and y1 != y2:
-                return x1, y1, x2, y2
-
-        x1, y1, x2, y2 = 106, 60, 742, 420
-        return x1, y1, x2, y2
-
-    def set_roi_exposure(self) -> bool:
-        """set camera auto exposure roi from config file"""
-        try:
-            enable_roi_exposure = bool(float(self._configurator.get_value(
-                'camera', 'region_of_interest_auto_exposure', fallback='0.0')))
-            if enable_roi_exposure:
-                x1, y1, x2, y2, = self.roi_box()
-                roi = rs.region_of_interest()
-                roi.min_x, roi.min_y, roi.max_x, roi.max_y = x1, y1, x2, y2
-                self._camera.set_roi(roi)
-        except RuntimeError:
-            log.warning('Failed to set region of interest auto exposure '
-                        'from configuration file')
-            return False
-        return True
+    def check_stations(self) -> None:
+        """make sure no two stations write to the same nodes"""
+        seen = {}
+        for station in self._stations:
+            nodeid = station.nodes['roi_depth'].nodeid
+            if nodeid in seen:
+                self.error(f'Stations "{seen[nodeid]}" and "{station.name}" share the '
+                           f'same nodes. Add a "[nodes:serial]" section for each camera', False)
+            seen[nodeid] = station.name
+
+    @property
+    def connected(self) -> bool:
+        """true while every camera is connected"""
+        return all(camera.connected for camera in self._cameras)
 
     def loop_time(self) -> None:
         """measure loop time"""
@@ -375,19 +485,36 @@ class App:
             sys.exit(1)
 
     def disconnect(self) -> None:
-        """disconnect client and camera"""
+        """disconnect client and cameras"""
         self._running = False
+        if getattr(self, '_watcher', None) is not None:
+            self._watcher.stop()
+        if getattr(self, '_profiler', None) is not None:
+            self._profiler.stop()
+        if getattr(self, '_memory', None) is not None:
+            log.info(f'Memory report:\n{self._memory.report()}')
+            self._memory.stop()
+            self._memory = None
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown(wait=False)
+        for station in getattr(self, '_stations', []):
+            station.close_measurements()
         try:
             self._client.disconnect()
         except RuntimeError:
             pass
-        try:
-            self._camera.stop()
-        except RuntimeError:
-            pass
+        for camera in self._cameras:
+            try:
+                camera.stop()
+            except RuntimeError:
+                pass
+            publisher = camera.publisher
+            if publisher is not None:
+                camera.publisher = None
+                publisher.close()
 
     def stop(self) -> None:
-        """disconnect client and camera, then exit"""
+        """disconnect client and cameras, then exit"""
         self.disconnect()
         sys.exit(0)
 
@@ -400,10 +527,11 @@ def main():
             log.critical(f'Maximum restarts attempted. '
                          f'(tried {g_retries} times)')
         finally:
+            logqueue.stop()
             os._exit(1)
 
-    client, camera, config = setup()
-    app = App(client, camera, config)
+    client, cameras, config = setup()
+    app = App(client, cameras, config)
 
     app.run()
 
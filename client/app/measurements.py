@@ -0,0 +1,379 @@
+"""
+title:   RealSenseOPC measurement log
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Every result the client computes is appended to a binary store, one
+directory per station:
+
+    chunk-<created ms>.npy
+        fixed width records (RECORD_FIELDS plus per roi columns) in a
+        preallocated .npy file. Records are written straight into the memory
+        mapped file, unwritten records have a time of 0. A new chunk is
+        started every hour or when the chunk is full. The next chunk is
+        created ahead of time, so the name is not the time of its first record
+    segment-<created ms>-<last ms>.npz
+        a closed chunk after compaction. Every field is stored as its own
+        compressed column
+
+Compaction, flushing and creating the next chunk run on a background thread. Use MeasurementReader to
+query a time range across segments and chunks.
+"""
+
+import glob
+import logging as log
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+# CONSTANTS
+CHUNK_RECORDS = 2 ** 17  # about 72 minutes at 30 fps
+CHUNK_SECONDS = 3600  # chunks are closed and compacted every hour
+RECORD_FIELDS = [
+    ('time', '<f8'),  # seconds since epoch when the result was computed
+    ('frame_number', '<u8'),
+    ('timestamp', '<f8'),  # camera frame timestamp in milliseconds
+    ('roi_select', '<u8'),
+    ('depth', '<f4'),
+    ('invalid', '<f4'),
+    ('deviation', '<f4'),
+    ('latency', '<f4')  # loop time in milliseconds
+]
+ROI_FIELDS = ['roi_depth', 'roi_invalid', 'roi_deviation']
+
+
+def record_dtype(roi_count: int) -> np.dtype:
+    """record layout for 'roi_count' per roi columns"""
+    fields = list(RECORD_FIELDS)
+    if roi_count > 0:
+        fields += [(name, '<f4', (roi_count,)) for name in ROI_FIELDS]
+    return np.dtype(fields)
+
+
+def pack_select(roi_select) -> int:
+    """store array selects as a 64 bit mask, first element is the most
+    significant bit. Integer selects are masked to 64 bits like
+    RoiModel.select() masks them, so a negative value of a signed node keeps
+    its two's complement bits"""
+    if isinstance(roi_select, (list, tuple, np.ndarray)):
+        value = 0
+        for i, selected in enumerate(roi_select[:64]):
+            if selected:
+                value |= 1 << (63 - i)
+        return value
+    return int(roi_select) & (2 ** 64 - 1)
+
+
+def _valid(records: np.ndarray) -> np.ndarray:
+    """written part of a chunk"""
+    return records[:int(np.count_nonzero(records['time'] > 0))]
+
+
+class MeasurementLog():
+    def __init__(self, directory: str, roi_count=0, retention_days=28.0):
+        """append measurements of one station to 'directory'
+
+        :param directory: station directory, created if needed
+        :type directory: string
+        :param roi_count: number of per roi columns, 0 for none, defaults to 0
+        :type roi_count: int, optional
+        :param retention_days: segments older than this are removed, 0 keeps
+        everything, defaults to 28.0
+        :type retention_days: float, optional
+        :raises OSError: if the directory can not be created
+        """
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._roi_count = roi_count
+        self._retention = retention_days * 86400
+        self._chunk = None
+        self._chunk_path = None
+        self._chunk_start = 0.0
+        self._index = 0
+
+        self._closing = False
+        self._create_lock = threading.Lock()
+        self._spares = queue.Queue()
+        self._closed = queue.Queue()
+        self._compactor = threading.Thread(target=self._compact_loop,
+                                           name='measurement-compactor', daemon=True)
+        # chunks left behind by the last run
+        for path in sorted(glob.glob(os.path.join(directory, 'chunk-*.npy'))):
+            self._closed.put((None, path))
+        self._compactor.start()
+
+    def append(self, frame_number: int, timestamp: float, roi_select, depth: float,
+               invalid: float, deviation: float, latency: float, roi_stats=None) -> None:
+        """append one result. Only touches memory, the operating system
+        writes the mapped chunk to disk in the background
+
+        :param roi_stats: per roi (depth, invalid, deviation) arrays
+        :type roi_stats: tuple, optional
+        """
+        now = time.time()
+        if roi_stats is not None and len(roi_stats[0]) != self._roi_count:
+            # regions of interest were reloaded
+            self._roi_count = len(roi_stats[0])
+            self._rotate()
+        if (self._chunk is None or self._index >= CHUNK_RECORDS
+                or now - self._chunk_start >= CHUNK_SECONDS):
+            self._rotate(now)
+
+        record = self._chunk[self._index]
+        record['frame_number'] = frame_number
+        record['timestamp'] = timestamp
+        record['roi_select'] = pack_select(roi_select)
+        record['depth'] = depth
+        record['invalid'] = invalid
+        record['deviation'] = deviation
+        record['latency'] = latency
+        if self._roi_count > 0:
+            if roi_stats is None:
+                for name in ROI_FIELDS:
+                    record[name] = np.nan
+            else:
+                for name, values in zip(ROI_FIELDS, roi_stats):
+                    record[name] = values
+        # time last, a record with a time is complete
+        record['time'] = now
+        self._index += 1
+
+    def _rotate(self, now=None) -> None:
+        """hand the current chunk to the compactor and swap in the next one"""
+        if self._chunk is not None:
+            self._closed.put((self._chunk, self._chunk_path))
+        self._chunk = None
+        if now is None:
+            return
+        try:
+            chunk, path = self._spares.get_nowait()
+            if chunk.dtype != record_dtype(self._roi_count):
+                # created before the regions of interest were reloaded
+                self._closed.put((chunk, path))
+                chunk = None
+        except queue.Empty:
+            chunk = None
+        if chunk is None:
+            chunk, path = self._create_chunk(self._roi_count)
+        self._chunk = chunk
+        self._chunk_path = path
+        self._chunk_start = now
+        self._index = 0
+
+    def _create_chunk(self, roi_count: int) -> tuple:
+        """new empty chunk as (memory map, path)"""
+        with self._create_lock:
+            start = int(time.time() * 1000)
+            while glob.glob(os.path.join(self._directory, f'*-{start}[-.]*')):
+                start += 1
+            path = os.path.join(self._directory, f'chunk-{start}.npy')
+            # the whole file is written when it is created, zero filled where
+            # the file system has no sparse files. That is slow for large
+            # chunks, so the compactor creates the next chunk ahead of time
+            chunk = np.lib.format.open_memmap(path, mode='w+', dtype=record_dtype(roi_count),
+                                              shape=(CHUNK_RECORDS,))
+        return chunk, path
+
+    def _prepare(self) -> None:
+        """create the next chunk, unless one is ready"""
+        if self._closing or not self._spares.empty():
+            return
+        try:
+            self._spares.put(self._create_chunk(self._roi_count))
+        except (OSError, ValueError) as e:
+            log.warning(f'Failed to create the next measurement chunk: {e}')
+
+    def _compact_loop(self) -> None:
+        self._prepare()
+        while True:
+            chunk, path = self._closed.get()
+            if path is None:
+                break
+            # the next chunk is ready before the slow compaction starts
+            self._prepare()
+            try:
+                if chunk is not None:
+                    chunk.flush()
+                # the mapping has to be gone before the file can be removed
+                del chunk
+                self._compact(path)
+            except (OSError, ValueError) as e:
+                log.error(f'Failed to compact measurements "{path}": {e}')
+            try:
+                self._prune()
+            except OSError as e:
+                log.warning(f'Failed to remove old measurements: {e}')
+
+        # the next chunk is not needed any more
+        while not self._spares.empty():
+            chunk, path = self._spares.get_nowait()
+            del chunk
+            try:
+                os.remove(path)
+            except OSError as e:
+                log.warning(f'Failed to remove unused measurements "{path}": {e}')
+
+    def _compact(self, path: str) -> None:
+        """write a closed chunk as a compressed columnar segment, then remove
+        the chunk"""
+        if _segment_of(path) is None:
+            chunk = np.load(path, mmap_mode='r')
+            records = _valid(chunk)
+            if len(records) > 0:
+                first = int(os.path.basename(path)[len('chunk-'):-len('.npy')])
+                last = int(records['time'][-1] * 1000)
+                segment = os.path.join(self._directory, f'segment-{first}-{last}.npz')
+                temporary = segment + '.tmp'
+                with open(temporary, 'wb') as file:
+                    np.savez_compressed(file, **{name: records[name]
+                                                 for name in records.dtype.names})
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(temporary, segment)
+            del records, chunk
+        os.remove(path)
+
+    def _prune(self) -> None:
+        """remove segments older than the retention time"""
+        if self._retention <= 0:
+            return
+        oldest = (time.time() - self._retention) * 1000
+        for path in glob.glob(os.path.join(self._directory, 'segment-*.npz')):
+            if _segment_range(path)[1] < oldest:
+                os.remove(path)
+
+    def close(self) -> None:
+        """close the current chunk and wait for it to be compacted"""
+        self._closing = True
+        self._rotate()
+        self._closed.put((None, None))
+        self._compactor.join()
+
+    @property
+    def directory(self) -> str:
+        """station directory"""
+        return self._directory
+
+
+def _segment_of(chunk_path: str):
+    """segment made from a chunk (it has the chunk's start time), None if
+    the chunk was not compacted yet"""
+    start = os.path.basename(chunk_path)[len('chunk-'):-len('.npy')]
+    found = glob.glob(os.path.join(os.path.dirname(chunk_path), f'segment-{start}-*.npz'))
+    return found[0] if found else None
+
+
+def _segment_range(path: str) -> tuple:
+    """(first ms, last ms) from a segment file name"""
+    name = os.path.basename(path)[len('segment-'):-len('.npz')]
+    first, last = name.split('-')
+    return int(first), int(last)
+
+
+class MeasurementReader():
+    def __init__(self, directory: str):
+        """read measurements written by MeasurementLog
+
+        :param directory: station directory
+        :type directory: string
+        """
+        self._directory = directory
+
+    def read(self, start=None, end=None, fields=None) -> dict:
+        """measurements with start <= time < end, oldest first
+
+        :param start: seconds since epoch, defaults to the first record
+        :type start: float, optional
+        :param end: seconds since epoch, defaults to the last record
+        :type end: float, optional
+        :param fields: field names to return, defaults to every field
+        :type fields: list, optional
+        :return: field name -> column. Per roi columns are 2d, padded with
+        nan where the number of rois changed
+        :rtype: dict
+        """
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        parts = []
+
+        for path in sorted(glob.glob(os.path.join(self._directory, 'segment-*.npz'))):
+            first, last = _segment_range(path)
+            if last / 1000 < start or first / 1000 >= end:
+                continue
+            with np.load(path) as data:
+                times = data['time']
+                keep = (times >= start) & (times < end)
+                if keep.any():
+                    names = fields if fields is not None else data.files
+                    parts.append({name: data[name][keep] for name in names if name in data.files})
+
+        for path in sorted(glob.glob(os.path.join(self._directory, 'chunk-*.npy'))):
+            if _segment_of(path) is not None:
+                # compacted, the chunk is about to be removed
+                continue
+            try:
+                records = _valid(np.load(path, mmap_mode='r'))
+            except (OSError, ValueError):
+                # being created or removed right now
+                continue
+            keep = (records['time'] >= start) & (records['time'] < end)
+            if keep.any():
+                names = fields if fields is not None else records.dtype.names
+                parts.append({name: np.array(records[name][keep])
+                              for name in names if name in records.dtype.names})
+
+        return _concatenate(parts, fields)
+
+    def latest(self, fields=None) -> dict:
+        """every measurement of the newest chunk, or the newest segment"""
+        # chunks are created ahead of time, the start is the first record
+        for path in sorted(glob.glob(os.path.join(self._directory, 'chunk-*.npy')), reverse=True):
+            if _segment_of(path) is not None:
+                continue
+            try:
+                records = _valid(np.load(path, mmap_mode='r'))
+            except (OSError, ValueError):
+                continue
+            if len(records) > 0:
+                return self.read(start=float(records['time'][0]), fields=fields)
+        segments = sorted(glob.glob(os.path.join(self._directory, 'segment-*.npz')),
+                          key=_segment_range)
+        if segments:
+            with np.load(segments[-1]) as data:
+                start = float(data['time'][0])
+            return self.read(start=start, fields=fields)
+        return _concatenate([], fields)
+
+
+def _concatenate(parts: list, fields=None) -> dict:
+    """join column dictionaries, sorted by time"""
+    names = list(fields) if fields is not None else [name for name, _ in RECORD_FIELDS]
+    if fields is None:
+        for part in parts:
+            names += [name for name in ROI_FIELDS if name in part and name not in names]
+    empty = record_dtype(0)
+    lengths = [len(next(iter(part.values()))) if part else 0 for part in parts]
+    columns = {}
+    for name in names:
+        if name in empty.names:
+            values = [part[name] for part in parts if name in part]
+            columns[name] = np.concatenate(values) if values else np.zeros(0, dtype=empty[name])
+            continue
+        # per roi columns, the number of rois may differ between parts
+        width = max([part[name].shape[1] for part in parts if name in part] or [0])
+        column = np.full((sum(lengths), width), np.nan, dtype=np.float32)
+        row = 0
+        for part, length in zip(parts, lengths):
+            if name in part:
+                column[row:row + length, :part[name].shape[1]] = part[name]
+            row += length
+        columns[name] = column
+
+    if parts and 'time' in columns:
+        order = np.argsort(columns['time'], kind='stable')
+        columns = {name: column[order] for name, column in columns.items()}
+    return columns
@@ -0,0 +1,269 @@
+"""
+title:   RealSenseOPC memory tracking
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Samples the resident set size (and its peak) on a background thread and
+logs it with the growth rate, so a client that runs for weeks shows slow
+leaks in its log. With tracemalloc enabled every sample also takes a
+snapshot, logs the allocation sites that grew since the previous one and
+keeps the first snapshot as a baseline for report().
+
+tracemalloc sees memory allocated by Python and numpy, not memory held by
+librealsense (retained rs frames for example). Those only show up in the
+resident set size.
+"""
+
+import collections
+import ctypes
+import logging as log
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# CONSTANTS
+INTERVAL = 60.0  # seconds between samples
+TOP_SITES = 10  # allocation sites per report
+MAX_SAMPLES = 10000  # oldest samples are dropped
+MEGABYTE = 1024 * 1024
+# allocation sites of the tracking itself and of imports are not reported
+IGNORED = (tracemalloc.__file__, os.path.abspath(__file__), '<frozen importlib._bootstrap>',
+           '<frozen importlib._bootstrap_external>', '<unknown>')
+
+MemorySample = collections.namedtuple('MemorySample', ['time', 'rss', 'peak', 'traced'])
+
+
+def process_memory() -> tuple:
+    """resident set size and its peak in bytes
+
+    :return: rss, peak, either None if the platform does not report it
+    :rtype: tuple
+    """
+    if sys.platform.startswith('linux'):
+        values = {}
+        with open('/proc/self/status') as file:
+            for line in file:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    values[key] = int(value.split()[0]) * 1024
+        return values.get('VmRSS'), values.get('VmHWM')
+    if sys.platform == 'win32':
+        counters = _ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.c_void_p(process),
+                                                    ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize, counters.PeakWorkingSetSize
+        return None, None
+    try:
+        import resource
+        return None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return None, None
+
+
+class _ProcessMemoryCounters(ctypes.Structure):
+    _fields_ = [('cb', ctypes.c_ulong),
+                ('PageFaultCount', ctypes.c_ulong),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t)]
+
+
+class MemoryTracker():
+    def __init__(self, interval=INTERVAL, trace=False, top=TOP_SITES, frames=1):
+        """sample memory use every 'interval' seconds on a background thread
+
+        :param interval: seconds between samples, defaults to INTERVAL
+        :type interval: float, optional
+        :param trace: trace allocations with tracemalloc, this slows every
+        allocation down, defaults to False
+        :type trace: bool, optional
+        :param top: allocation sites per report, defaults to TOP_SITES
+        :type top: int, optional
+        :param frames: traceback depth of traced allocations, defaults to 1
+        :type frames: int, optional
+        """
+        self._interval = max(interval, 0.1)
+        self._trace = trace
+        self._top = max(top, 1)
+        self._frames = max(frames, 1)
+        self._lock = threading.Lock()
+        self._samples = collections.deque(maxlen=MAX_SAMPLES)
+        self._baseline = None
+        self._previous = None
+        self._started_tracing = False
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """take the first sample and start sampling"""
+        if self._trace and not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames)
+            self._started_tracing = True
+        self.sample()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='memory', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """stop sampling and stop tracemalloc if it was started here"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._baseline = self._previous = None
+
+    def sample(self) -> MemorySample:
+        """take a sample now. With tracemalloc the snapshot is compared with
+        the previous one
+
+        :return: sample
+        :rtype: MemorySample
+        """
+        rss, peak = process_memory()
+        traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        sample = MemorySample(time.time(), rss, peak, traced)
+        snapshot = tracemalloc.take_snapshot() if traced is not None else None
+        previous = None
+        with self._lock:
+            self._samples.append(sample)
+            if snapshot is not None:
+                previous, self._previous = self._previous, snapshot
+                if self._baseline is None:
+                    self._baseline = snapshot
+        if previous is not None:
+            self._log_sites('since the last sample', snapshot.compare_to(previous, 'lineno'))
+        return sample
+
+    def growth(self, since=0.0, field='rss') -> float:
+        """growth rate, a least squares fit through the samples taken at
+        least 'since' seconds after the first one
+
+        :param since: seconds of warm up to skip, defaults to 0.0
+        :type since: float, optional
+        :param field: 'rss' or 'traced', defaults to 'rss'
+        :type field: string, optional
+        :return: bytes per hour, None with less than 2 samples
+        :rtype: float
+        """
+        with self._lock:
+            samples = [s for s in self._samples if getattr(s, field) is not None]
+        if samples:
+            samples = [s for s in samples if s.time - samples[0].time >= since]
+        if len(samples) < 2 or samples[-1].time == samples[0].time:
+            return None
+        times = np.array([s.time for s in samples]) - samples[0].time
+        sizes = np.array([getattr(s, field) for s in samples], dtype=np.float64)
+        return float(np.polyfit(times, sizes, 1)[0] * 3600)
+
+    def top_sites(self, limit=None, grown=False) -> list:
+        """largest allocation sites, or the ones that grew the most since
+        the first sample
+
+        :param limit: number of sites, defaults to the 'top' setting
+        :type limit: int, optional
+        :param grown: compare with the first snapshot, defaults to False
+        :type grown: bool, optional
+        :return: tracemalloc.Statistic (or StatisticDiff) list, empty if
+        tracemalloc is off
+        :rtype: list
+        """
+        if not tracemalloc.is_tracing():
+            return []
+        limit = limit or self._top
+        snapshot = tracemalloc.take_snapshot()
+        if grown:
+            with self._lock:
+                baseline = self._baseline
+            if baseline is None:
+                return []
+            stats = snapshot.compare_to(baseline, 'lineno')
+            return [s for s in _reported(stats) if s.size_diff > 0][:limit]
+        return _reported(snapshot.statistics('lineno'))[:limit]
+
+    def report(self) -> str:
+        """memory use, growth rate and the top allocation sites
+
+        :return: multi line report
+        :rtype: string
+        """
+        with self._lock:
+            samples = list(self._samples)
+        lines = []
+        if samples:
+            first, last = samples[0], samples[-1]
+            lines.append(f'{len(samples)} samples over {(last.time - first.time) / 3600:.2f} h')
+            lines.append(f'rss {_megabytes(last.rss)} (first {_megabytes(first.rss)}, '
+                         f'peak {_megabytes(last.peak)})')
+            growth = self.growth()
+            if growth is not None:
+                lines.append(f'rss growth {growth / MEGABYTE:+.2f} MB/h')
+            if last.traced is not None:
+                lines.append(f'traced {_megabytes(last.traced)} (first {_megabytes(first.traced)})')
+        for title, stats in (('largest allocation sites', self.top_sites()),
+                             ('grown since the first sample', self.top_sites(grown=True))):
+            if stats:
+                lines.append(f'{title}:')
+                lines += [f'    {_site(s)}' for s in stats]
+        return '\n'.join(lines)
+
+    @property
+    def samples(self) -> list:
+        """samples, oldest first"""
+        with self._lock:
+            return list(self._samples)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            try:
+                sample = self.sample()
+            except (OSError, ValueError) as e:
+                log.warning(f'Failed to sample memory use: {e}')
+                continue
+            growth = self.growth()
+            growth = f', {growth / MEGABYTE:+.2f} MB/h' if growth is not None else ''
+            traced = f', traced {_megabytes(sample.traced)}' if sample.traced is not None else ''
+            log.info(f'Memory: rss {_megabytes(sample.rss)} '
+                     f'(peak {_megabytes(sample.peak)}{growth}){traced}')
+
+    def _log_sites(self, title: str, stats: list) -> None:
+        grown = [s for s in _reported(stats) if s.size_diff > 0][:self._top]
+        if grown:
+            log.info(f'Memory: allocation sites grown {title}: '
+                     + '; '.join(_site(s) for s in grown))
+
+
+def _reported(stats: list) -> list:
+    """statistics without the IGNORED allocation sites. Filtering the
+    statistics is much cheaper than filtering every trace of a snapshot"""
+    return [s for s in stats if s.traceback[0].filename not in IGNORED]
+
+
+def _site(stat) -> str:
+    """'file:line size (count blocks)' of a tracemalloc statistic, with the
+    change for a StatisticDiff"""
+    frame = stat.traceback[0]
+    text = f'{os.path.basename(frame.filename)}:{frame.lineno} {stat.size / 1024:.1f} kB'
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        text += f' ({stat.size_diff / 1024:+.1f} kB, {stat.count_diff:+d} blocks)'
+    else:
+        text += f' ({stat.count} blocks)'
+    return text
+
+
+def _megabytes(size) -> str:
+    return '?' if size is None else f'{size / MEGABYTE:.1f} MB'
@@ -0,0 +1,228 @@
+"""
+title:   RealSenseOPC on-demand sampling profiler
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Samples the stacks of every Python thread (the main loop, station workers,
+librealsense callback threads) for a bounded window and writes them as
+collapsed stacks, one 'thread;outer;...;inner count' line per stack. The
+file can be turned into a flamegraph by flamegraph.pl, speedscope or
+inferno.
+
+A window is started by
+
+    - '[profiler] enabled' in the configuration file (at startup, or when a
+      hot reload turns it on)
+    - the SIGUSR1 signal (not on Windows)
+    - creating the sentinel file next to the log. It is deleted when the
+      window starts. A number in the file sets the window length in seconds
+
+Nothing is sampled outside a window, the main loop never calls into the
+profiler. The only cost while idle is a check for the sentinel file once a
+second on the profiler's own thread, while a sentinel file name is set. The
+SIGUSR1 handler only wakes that thread, which starts the window, so the
+signal can not deadlock on a lock the interrupted main thread holds.
+"""
+
+import logging as log
+import os
+import signal
+import sys
+import threading
+import time
+
+# CONSTANTS
+INTERVAL = 0.005  # seconds between samples
+DURATION = 30.0  # seconds per window
+MAX_DURATION = 600.0  # longest window, the file grows with every unique stack
+SENTINEL = 'profile'  # file name, next to the log
+SENTINEL_PERIOD = 1.0  # seconds between sentinel file checks
+
+
+class Profiler():
+    def __init__(self, directory: str, interval=INTERVAL, duration=DURATION, sentinel=SENTINEL):
+        """sampling profiler that is idle until triggered
+
+        :param directory: directory of the profile files and the sentinel
+        :type directory: string
+        :param interval: seconds between samples, defaults to INTERVAL
+        :type interval: float, optional
+        :param duration: seconds per window, defaults to DURATION
+        :type duration: float, optional
+        :param sentinel: sentinel file name, empty to not watch for it,
+        defaults to SENTINEL
+        :type sentinel: string, optional
+        """
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._watcher = None
+        self._stopped = threading.Event()
+        self._stopped.set()
+        self._wake = threading.Event()
+        self._signal = False  # SIGUSR1 handler installed
+        self._signalled = False
+        self.configure(interval, duration, sentinel)
+
+    def configure(self, interval=INTERVAL, duration=DURATION, sentinel=SENTINEL) -> None:
+        """change the settings, a running window keeps its own. Setting a
+        sentinel after start() starts watching for it"""
+        self._interval = max(interval, 0.001)
+        self._duration = min(max(duration, 0.1), MAX_DURATION)
+        self._sentinel = os.path.join(self._directory, sentinel) if sentinel else ''
+        if not self._stopped.is_set():
+            self._start_watcher()
+            self._wake.set()
+
+    def start(self) -> None:
+        """install the SIGUSR1 handler (main thread only) and watch for the
+        signal and the sentinel file, if one is set"""
+        if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, self._on_signal)
+            self._signal = True
+        self._stopped.clear()
+        self._start_watcher()
+
+    def stop(self) -> None:
+        """stop watching and end a running window, its samples are written"""
+        self._stopped.set()
+        self._wake.set()
+        with self._lock:
+            watcher = self._watcher
+            self._watcher = None
+        if watcher is not None and watcher is not threading.current_thread():
+            watcher.join()
+        with self._lock:
+            sampler = self._sampler
+        if sampler is not None and sampler is not threading.current_thread():
+            sampler.join()
+
+    def trigger(self, duration=None) -> bool:
+        """start a window unless one is running
+
+        :param duration: window length in seconds, defaults to the
+        configured duration
+        :type duration: float, optional
+        :return: true if a window was started
+        :rtype: bool
+        """
+        with self._lock:
+            if self._sampler is not None:
+                return False
+            duration = min(max(duration or self._duration, 0.1), MAX_DURATION)
+            self._sampler = threading.Thread(target=self._sample,
+                                             args=(self._interval, duration),
+                                             name='profiler-sampler', daemon=True)
+            self._sampler.start()
+        return True
+
+    @property
+    def running(self) -> bool:
+        """true while a window is being sampled"""
+        return self._sampler is not None
+
+    def _on_signal(self, signum, frame) -> None:
+        """SIGUSR1 handler. Runs on the main thread between any two
+        bytecodes, so it takes no lock and leaves the window to the watcher"""
+        self._signalled = True
+        self._wake.set()
+
+    def _start_watcher(self) -> None:
+        """watch for the signal and the sentinel file unless there is
+        nothing to watch or it is already watched"""
+        with self._lock:
+            if not (self._sentinel or self._signal) or self._watcher is not None:
+                return
+            self._watcher = threading.Thread(target=self._watch, name='profiler', daemon=True)
+            self._watcher.start()
+
+    def _watch(self) -> None:
+        while True:
+            with self._lock:
+                path = self._sentinel
+                if self._stopped.is_set() or not (path or self._signal):
+                    # turned off, configure() starts a new watcher
+                    if self._watcher is threading.current_thread():
+                        self._watcher = None
+                    return
+            # without a sentinel there is nothing to poll, only the signal
+            #   or configure() wake the watcher
+            self._wake.wait(SENTINEL_PERIOD if path else None)
+            self._wake.clear()
+            if self._stopped.is_set():
+                continue
+            if self._signalled:
+                self._signalled = False
+                self.trigger()
+            if not path or not os.path.exists(path):
+                continue
+            duration = None
+            try:
+                with open(path) as file:
+                    duration = float(file.read().strip() or 0) or None
+            except ValueError:
+                pass
+            except OSError as e:
+                log.warning(f'Failed to read profiler sentinel "{path}": {e}')
+            try:
+                os.remove(path)
+            except OSError as e:
+                # leaving it would start a window every second
+                log.warning(f'Failed to remove profiler sentinel "{path}", '
+                            f'not watching it anymore: {e}')
+                self._sentinel = ''
+            self.trigger(duration)
+
+    def _sample(self, interval: float, duration: float) -> None:
+        own = threading.get_ident()
+        counts = {}
+        samples = 0
+        start = time.perf_counter()
+        deadline = start
+        log.info(f'Profiling for {duration:g} s, a sample every {interval * 1000:.1f} ms')
+        try:
+            while not self._stopped.is_set() and time.perf_counter() - start < duration:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = collapse(frame, names.get(ident, f'thread-{ident}'))
+                    counts[stack] = counts.get(stack, 0) + 1
+                samples += 1
+                # sample at a fixed rate, skip ahead instead of catching up
+                deadline = max(deadline + interval, time.perf_counter())
+                time.sleep(max(deadline - time.perf_counter(), 0))
+            self._write(counts, samples, time.perf_counter() - start)
+        finally:
+            with self._lock:
+                self._sampler = None
+
+    def _write(self, counts: dict, samples: int, elapsed: float) -> None:
+        name = os.path.join(self._directory, f'profile-{time.strftime("%Y%m%d-%H%M%S")}')
+        path, number = f'{name}.folded', 1
+        while os.path.exists(path):
+            path, number = f'{name}-{number}.folded', number + 1
+        try:
+            with open(path, 'w') as file:
+                for stack, count in sorted(counts.items()):
+                    file.write(f'{stack} {count}\n')
+        except OSError as e:
+            log.error(f'Failed to write profile "{path}": {e}')
+            return
+        log.info(f'Wrote {samples} samples over {elapsed:.1f} s '
+                 f'({samples / max(elapsed, 1e-9):.0f}/s) to "{path}"')
+
+
+def collapse(frame, thread_name: str) -> str:
+    """'thread;outer;...;inner' stack of 'frame', one 'function (file:line)'
+    entry per frame, the line being the first line of the function so every
+    call of a function adds up"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:'
+                     f'{code.co_firstlineno})')
+        frame = frame.f_back
+    names.append(thread_name)
+    return ';'.join(name.replace(';', ':') for name in reversed(names))
@@ -0,0 +1,97 @@
+"""
+title:   RealSenseOPC configuration file watcher
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+"""
+
+import logging as log
+import os
+import threading
+import time
+
+
+class PendingReload():
+    def __init__(self, value, detected: float, prepare_time: float):
+        """prepared configuration waiting to be applied
+
+        :param value: whatever the prepare callback returned
+        :type value: any
+        :param detected: time.perf_counter() when the change was detected
+        :type detected: float
+        :param prepare_time: time spent preparing in seconds
+        :type prepare_time: float
+        """
+        self.value = value
+        self.detected = detected
+        self.prepare_time = prepare_time
+
+
+class ConfigWatcher(threading.Thread):
+    def __init__(self, path: str, prepare, interval=1.0):
+        """watch a configuration file for changes. When the file changes the
+        'prepare' callback runs on this thread, so expensive work such as
+        building roi masks never happens on the main loop. The result is
+        handed over through take(), which the main loop calls at a frame
+        boundary
+
+        :param path: configuration file path
+        :type path: string
+        :param prepare: called with no arguments when the file changed.
+        Exceptions are logged and the change is skipped
+        :type prepare: callable
+        :param interval: seconds between checks, defaults to 1.0
+        :type interval: float, optional
+        """
+        super().__init__(name='config-watcher', daemon=True)
+        self._path = path
+        self._prepare = prepare
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = None
+        self._signature = self._stat()
+
+    def _stat(self):
+        """file modification time and size, None if missing"""
+        try:
+            stat = os.stat(self._path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self._interval):
+            signature = self._stat()
+            if signature is None or signature == self._signature:
+                continue
+            # let whoever is writing the file finish first
+            if self._stop_event.wait(min(self._interval, 0.2)) or self._stat() != signature:
+                continue
+            self._signature = signature
+
+            detected = time.perf_counter()
+            try:
+                value = self._prepare()
+            except Exception as e:
+                log.error(f'Failed to reload "{self._path}", keeping previous configuration: {e}')
+                continue
+            pending = PendingReload(value, detected, time.perf_counter() - detected)
+            with self._lock:
+                self._pending = pending
+
+    def take(self):
+        """newest prepared configuration, if any. Clears it
+
+        :return: pending reload or None
+        :rtype: PendingReload or None
+        """
+        if self._pending is None:
+            return None
+        with self._lock:
+            pending, self._pending = self._pending, None
+        return pending
+
+    def stop(self) -> None:
+        """stop watching"""
+        self._stop_event.set()
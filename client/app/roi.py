@@ -0,0 +1,748 @@
+"""
+title:   RealSenseOPC region of interest model
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Regions of interest are compiled once into a RoiModel:
+    vertices   int32 (n, 2) vertex array per roi
+    boxes      int32 (x1, y1, x2, y2) bounding box per roi
+    labels     label map. Every pixel holds the id of the 'atom' it belongs
+               to, an atom being a set of pixels covered by exactly the same
+               rois (atom 0 is usually the background). Overlapping rois are
+               therefore represented exactly
+    membership bool (atoms, rois) table of which rois cover which atom
+    indices    flat pixel indices per roi
+
+Any number of rois is supported. Statistics cost one pass over the pixels no
+matter how many rois are selected: the selection becomes a lookup table over
+atoms and is read one of two ways
+    mask       a single gather from the label map, limited to the bounding
+               window of the selected rois, masks the depth values of the
+               window
+    indices    the flat indices of the selected pixels (every atom's pixels
+               are stored together) gather only those depth values
+    integral   summed area tables of depth, depth^2 and valid pixels are
+               built for the frame (cv2.integral2), after which every
+               rectangular roi costs four lookups per table
+The 'auto' strategy reads a selection by its indices when it covers less
+than INDEX_COVERAGE of its window (small or scattered rois) and by its mask
+otherwise. Building the tables costs about as much as gathering a whole
+frame, so 'auto' only uses them for roi_statistics() of models whose rois
+are all rectangles and either cover at least INTEGRAL_COVERAGE of the frame
+or number INTEGRAL_ROIS or more (combining atom sums per roi grows with
+rois x atoms), a grid of a thousand cells for example.
+
+Statistics do not allocate frame sized arrays. The mask and the converted
+depth values live in scratch buffers allocated once per model (a model is
+compiled for one resolution) and every step writes into them with 'out='.
+Depth sums are taken over float64 copies of the z16 values: sums of values
+and of their squares stay below 2**53 for any realsense resolution, so they
+are exact integers and the deviation does not lose precision.
+
+Robust depth statistics (median, 5th and 95th percentile, trimmed mean) of
+a selection are read from a histogram of its z16 values (np.bincount), so
+they cost about as much as the mean and need no sorting. The histogram is
+the only array they allocate, its running counts and sums are taken into
+scratch buffers.
+
+Compiled models are cached in a 'roicache' directory next to the
+configuration file, keyed by a hash of the polygons and the resolution, so a
+restart loads the masks instead of rasterizing them again.
+"""
+
+import ast
+import hashlib
+import logging as log
+import math
+import os
+
+import cv2
+import numpy as np
+
+# CONSTANTS
+MODEL_VERSION = 1
+CACHE_DIRECTORY = 'roicache'
+CACHE_SIZE = 16  # number of cached models kept on disk
+SELECT_BITS = (8, 16, 32, 64)  # default select widths, see select_bits()
+STRATEGIES = ('auto', 'mask', 'indices', 'integral')  # see RoiModel.strategy
+INDEX_COVERAGE = 0.9  # 'auto' gathers indices below this fraction of the window
+INTEGRAL_COVERAGE = 0.5  # 'auto' builds summed area tables above this fraction of the frame
+INTEGRAL_ROIS = 1000  # or for this many rectangles
+ROBUST_STATISTICS = ('median', 'p5', 'p95', 'trimmed_mean')  # see robust_statistics()
+DEPTH_STATISTICS = ('mean',) + ROBUST_STATISTICS  # depth statistic names, see parse_roi()
+TRIM = 0.1  # fraction of valid pixels cut from each end for the trimmed mean
+DEPTH_VALUES = 2 ** 16  # z16 depth values, the most histogram bins of robust_statistics()
+
+
+def parse_polygon(text: str) -> list:
+    """safely parse a polygon string such as '[(1, 2), (3, 4)]'. Only python
+    literals are evaluated
+
+    :param text: polygon string from the configuration file
+    :type text: string
+    :raises ValueError: if the string is not a list of (x, y) integer pairs
+    :return: list of (x, y) tuples
+    :rtype: list
+    """
+    try:
+        value = ast.literal_eval(text.strip()) if text.strip() else []
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError) as e:
+        raise ValueError(f'"{text}" is not a valid polygon: {e}') from None
+    if isinstance(value, tuple) and len(value) == 2 and all(isinstance(v, int) for v in value):
+        value = [value]
+    if not isinstance(value, (list, tuple)):
+        raise ValueError(f'"{text}" is not a list of coordinates')
+    polygon = []
+    for point in value:
+        if (not isinstance(point, (list, tuple)) or len(point) != 2
+                or not all(isinstance(v, int) and not isinstance(v, bool) for v in point)):
+            raise ValueError(f'"{point}" in "{text}" is not an (x, y) integer coordinate')
+        polygon.append((point[0], point[1]))
+    return polygon
+
+
+def parse_roi(text: str) -> tuple:
+    """parse a roi configuration value, a polygon string optionally led by
+    the depth statistic to report for the roi, such as
+    'median [(1, 2), (3, 4)]'
+
+    :param text: roi value from the configuration file
+    :type text: string
+    :raises ValueError: if the statistic is not one of DEPTH_STATISTICS or
+    the polygon is invalid
+    :return: statistic ('mean' if missing) and polygon
+    :rtype: tuple
+    """
+    statistic, polygon = 'mean', text.strip()
+    if polygon[:1].isalpha():
+        statistic, _, polygon = polygon.partition(' ')
+        if statistic.lower() not in DEPTH_STATISTICS:
+            raise ValueError(f'"{statistic}" is not one of {", ".join(DEPTH_STATISTICS)}')
+    return statistic.lower(), parse_polygon(polygon)
+
+
+class RoiModel():
+    def __init__(self, polygons: list, width=848, height=480, _compiled=None):
+        """compile regions of interest
+
+        :param polygons: list of polygons, each a list of (x, y) tuples
+        :type polygons: list
+        :param width: frame width, defaults to 848
+        :type width: int, optional
+        :param height: frame height, defaults to 480
+        :type height: int, optional
+        """
+        self._polygons = [list(polygon) for polygon in polygons]
+        self._width = width
+        self._height = height
+        self._key = model_key(self._polygons, width, height)
+
+        if _compiled is None:
+            _compiled = self._compile()
+        (self._vertices, self._boxes, self._labels,
+         self._membership, self._indices) = _compiled
+
+        self._last_selection = None
+        self._last_mask = None
+        self._strategy = 'auto'
+        self._read_selection = None
+        self._last_read = None
+        self._order = None
+        self._atoms = None
+        self._starts = None
+        self._sizes = None
+        self._weights = None
+        self._corners = None
+        self._rectangular = None
+        self._scratch = {}
+
+    def _compile(self) -> tuple:
+        """rasterize polygons into the label map and per roi pixel indices.
+        Only the pixels inside a roi are relabeled, so compiling costs the
+        total roi area rather than one pass over the frame per roi"""
+        height, width = self._height, self._width
+        count = len(self._polygons)
+        vertices = []
+        boxes = np.zeros((count, 4), dtype=np.int32)
+        labels = np.zeros(height * width, dtype=np.int64)
+        rows = [[False] * count]
+        indices = []
+        raster = np.zeros((height, width), dtype=np.uint8)
+        for i, polygon in enumerate(self._polygons):
+            points = np.asarray(polygon, dtype=np.int32).reshape(-1, 2)
+            vertices.append(points)
+            raster.fill(0)
+            if len(points) > 0:
+                cv2.fillPoly(raster, pts=[points], color=1)
+                boxes[i] = (points[:, 0].min(), points[:, 1].min(),
+                            points[:, 0].max(), points[:, 1].max())
+            inside = np.flatnonzero(raster.ravel()).astype(np.int32)
+            indices.append(inside)
+            if inside.size < 1:
+                continue
+
+            # the part of every atom inside this roi becomes a new atom
+            uniq, inverse = np.unique(labels[inside], return_inverse=True)
+            labels[inside] = len(rows) + inverse.reshape(-1)
+            for u in uniq:
+                row = list(rows[u])
+                row[i] = True
+                rows.append(row)
+
+        # drop atoms that ended up without pixels
+        used = np.flatnonzero(np.bincount(labels, minlength=len(rows)))
+        remap = np.zeros(len(rows), dtype=np.int64)
+        remap[used] = np.arange(used.size)
+        membership = np.array(rows, dtype=bool).reshape(len(rows), count)[used]
+        labels = remap[labels].astype(_label_dtype(used.size)).reshape(height, width)
+        return vertices, boxes, labels, membership, indices
+
+    def select(self, roi_select, bits=None) -> tuple:
+        """rois selected by a server select value. An integer value is a bit
+        mask 'bits' wide whose most significant bit selects the first roi
+        (ex. 8 bits, 137 -> 0b10001001 -> rois 0, 4 and 7). Values are masked
+        to 'bits', so a negative value of a signed node selects by its two's
+        complement bits (ex. 16 bits, -32768 -> roi 0). A list (array node)
+        selects roi i if element i is true
+
+        :param roi_select: select value
+        :type roi_select: int or list
+        :param bits: select mask width, defaults to select_bits(count)
+        :type bits: int, optional
+        :return: selected roi indices
+        :rtype: tuple
+        """
+        count = len(self._polygons)
+        if isinstance(roi_select, (list, tuple, np.ndarray)):
+            return tuple(i for i, value in enumerate(roi_select[:count]) if value)
+        if bits is None:
+            bits = select_bits(count)
+        roi_select = int(roi_select) & (2 ** bits - 1)
+        return tuple(i for i in range(min(count, bits)) if roi_select >> (bits - 1 - i) & 1)
+
+    def mask(self, selection: tuple) -> np.ndarray:
+        """union of the selected rois as a boolean image. The mask of the
+        last selection is kept, so a constant selection costs nothing
+
+        :param selection: roi indices
+        :type selection: tuple
+        :return: mask, true inside the selected rois
+        :rtype: numpy.ndarray
+        """
+        selection = tuple(selection)
+        if selection != self._last_selection:
+            lut = self._membership[:, list(selection)].any(axis=1)
+            self._last_mask = lut[self._labels]
+            self._last_selection = selection
+        return self._last_mask
+
+    def statistics(self, depth_image: np.ndarray, selection: tuple, conversion: float) -> tuple:
+        """average depth of valid (non zero) pixels, percentage of invalid
+        pixels and standard deviation of every pixel in the selected rois
+
+        :param depth_image: depth image (height x width)
+        :type depth_image: numpy.ndarray
+        :param selection: roi indices
+        :type selection: tuple
+        :param conversion: depth units to meters or feet
+        :type conversion: float
+        :return: depth, invalid, deviation
+        :rtype: tuple
+        """
+        if len(selection) < 1:
+            return float(0), float(100), float(0)
+
+        strategy, total, region = self._read(tuple(selection))
+        if total < 1:
+            return float(0), float(100), float(0)
+
+        if strategy == 'integral':
+            # the selected rois are rectangles that do not overlap
+            sums, squares, valids, _ = self._box_sums(self._integrals(depth_image), region)
+            valid = int(valids.sum())
+            depth_sum = int(sums.sum())
+            square_sum = int(squares.sum())
+            return _summarize(total, valid, depth_sum, square_sum, conversion)
+        if strategy == 'indices':
+            gathered = self._buffer('depth', depth_image.dtype, region.shape)
+            np.take(depth_image.reshape(-1), region, out=gathered, mode='clip')
+            values = self._buffer('values', np.float64, region.shape)
+            np.copyto(values, gathered)
+        else:
+            # pixels outside the selection stay 0 and add nothing to the sums
+            rows, cols, mask = region
+            values = self._buffer('values', np.float64, mask.shape)
+            values.fill(0)
+            np.copyto(values, depth_image[rows, cols], where=mask)
+        flat = values.reshape(-1)
+        valid = np.count_nonzero(flat)
+        depth_sum = int(np.add.reduce(flat))
+        square_sum = int(np.dot(flat, flat))
+        return _summarize(total, valid, depth_sum, square_sum, conversion)
+
+    def robust_statistics(self, depth_image: np.ndarray, selection: tuple, conversion: float,
+                          trim=TRIM) -> tuple:
+        """median, 5th and 95th percentile (interpolated like numpy's
+        percentile) and trimmed mean depth of the valid (non zero) pixels in
+        the selected rois. Read from a histogram of the z16 values
+
+        :param depth_image: z16 depth image (height x width)
+        :type depth_image: numpy.ndarray
+        :param selection: roi indices
+        :type selection: tuple
+        :param conversion: depth units to meters or feet
+        :type conversion: float
+        :param trim: fraction of valid pixels cut from each end for the
+        trimmed mean (0 - 0.5), defaults to TRIM
+        :type trim: float, optional
+        :return: median, p5, p95, trimmed mean, 0 without valid pixels
+        :rtype: tuple
+        """
+        nothing = (float(0),) * len(ROBUST_STATISTICS)
+        if len(selection) < 1:
+            return nothing
+        strategy, total, region = self._read(tuple(selection))
+        if total < 1:
+            return nothing
+
+        # bincount takes contiguous intp values without a copy
+        if strategy == 'mask':
+            # pixels outside the selection stay 0 and count as invalid
+            rows, cols, mask = region
+            values = self._buffer('bins', np.intp, mask.shape)
+            values.fill(0)
+            np.copyto(values, depth_image[rows, cols], where=mask)
+        elif strategy == 'integral':
+            values = self._buffer('bins', np.intp, (total,))
+            position = 0
+            for y1, x1, y2, x2 in self._corners[:, region].T:
+                size = (y2 - y1) * (x2 - x1)
+                np.copyto(values[position:position + size].reshape(y2 - y1, x2 - x1),
+                          depth_image[y1:y2, x1:x2])
+                position += size
+        else:
+            gathered = self._buffer('depth', depth_image.dtype, region.shape)
+            np.take(depth_image.reshape(-1), region, out=gathered, mode='clip')
+            values = self._buffer('bins', np.intp, region.shape)
+            np.copyto(values, gathered)
+
+        # one bin per depth value up to the largest, bin 0 holds the invalid
+        histogram = np.bincount(values.reshape(-1))
+        valid = values.size - int(histogram[0])
+        if valid < 1:
+            return nothing
+        histogram[0] = 0
+        depths = self._scratch.get('depth_values')
+        if depths is None:
+            depths = self._scratch['depth_values'] = np.arange(DEPTH_VALUES, dtype=np.intp)
+        counts = self._buffer('histogram_counts', np.intp, histogram.shape)
+        np.cumsum(histogram, out=counts)
+        sums = self._buffer('histogram_sums', np.intp, histogram.shape)
+        np.multiply(histogram, depths[:histogram.size], out=sums)
+        np.cumsum(sums, out=sums)
+
+        def value(rank):
+            """depth of the valid pixel 'rank' (0 based) in sorted order"""
+            return int(np.searchsorted(counts, rank, side='right'))
+
+        def percentile(fraction):
+            position = fraction * (valid - 1)
+            rank = int(position)
+            low, high = value(rank), value(min(rank + 1, valid - 1))
+            return (low + (high - low) * (position - rank)) * conversion
+
+        def smallest(count):
+            """sum of the 'count' smallest valid depths"""
+            if count < 1:
+                return 0
+            largest = value(count - 1)
+            below = int(counts[largest - 1]) if largest > 0 else 0
+            return (int(sums[largest - 1]) if largest > 0 else 0) + (count - below) * largest
+
+        cut = int(min(max(trim, 0), 0.499) * valid)
+        trimmed = (smallest(valid - cut) - smallest(cut)) / (valid - 2 * cut) * conversion
+        return percentile(0.5), percentile(0.05), percentile(0.95), trimmed
+
+    def roi_statistics(self, depth_image: np.ndarray, conversion: float) -> tuple:
+        """depth, invalid percentage and deviation of every roi on its own
+        (same definitions as statistics()). Sums are taken per atom in one
+        pass over the pixels inside the rois and combined per roi, so the
+        cost hardly depends on the number of rois. Rectangular rois may be
+        summed from summed area tables instead, see strategy
+
+        :param depth_image: depth image (height x width)
+        :type depth_image: numpy.ndarray
+        :param conversion: depth units to meters or feet
+        :type conversion: float
+        :return: depth, invalid, deviation arrays with one value per roi
+        :rtype: tuple
+        """
+        if self._order is None:
+            self._sort_atoms()
+        order, starts = self._order, self._starts
+        if order.size < 1:
+            return np.zeros(self.count), np.full(self.count, 100.0), np.zeros(self.count)
+        if self._integral_rois():
+            total, squares, valid, size = self._box_sums(self._integrals(depth_image))
+            return _combine(size, valid, total, squares, conversion)
+
+        # the pixels of every atom are contiguous after the gather, so the
+        #   per atom sums are reduceat runs. One scratch buffer holds the
+        #   values, then their squares, then 1 for every valid pixel
+        gathered = self._buffer('depth', depth_image.dtype, order.shape)
+        np.take(depth_image.reshape(-1), order, out=gathered, mode='clip')
+        values = self._buffer('values', np.float64, order.shape)
+        np.copyto(values, gathered)
+        total = np.add.reduceat(values, starts)
+        np.square(values, out=values)
+        squares = np.add.reduceat(values, starts)
+        np.sign(values, out=values)
+        valid = np.add.reduceat(values, starts)
+
+        membership = self._weights
+        size = membership @ self._sizes
+        valid, total, squares = membership @ valid, membership @ total, membership @ squares
+        return _combine(size, valid, total, squares, conversion)
+
+    def _read(self, selection: tuple) -> tuple:
+        """how statistics() reads the selected rois. Kept for the last
+        selection, indices and mask live in scratch buffers
+
+        :return: strategy, pixel count and the roi indices ('integral'),
+        the flat indices ('indices') or the row slice, column slice and mask
+        of the window ('mask')
+        :rtype: tuple
+        """
+        if selection != self._read_selection:
+            if self._order is None:
+                self._sort_atoms()
+            if self._rectangular is None:
+                self._find_rectangles()
+            covers = self._membership[:, list(selection)]
+            lut = covers.any(axis=1)
+            runs = lut[self._atoms]
+            starts, sizes = self._starts[runs], self._sizes[runs]
+            total = int(sizes.sum())
+            rows, cols = self._window(selection)
+            area = (rows.stop - rows.start) * (cols.stop - cols.start)
+
+            strategy = self._strategy
+            if strategy == 'integral':
+                rois = np.array(selection, dtype=np.intp)
+                # sums of overlapping rois would count shared pixels twice
+                if self._rectangular[rois].all() and covers.sum(axis=1).max() <= 1:
+                    region = rois
+                else:
+                    strategy = 'auto'
+            if strategy == 'auto':
+                strategy = 'indices' if total < area * INDEX_COVERAGE else 'mask'
+            if strategy == 'indices':
+                region = self._buffer('indices', np.intp, (total,))
+                if total > 0:
+                    order = self._order
+                    np.concatenate([order[start:start + size]
+                                    for start, size in zip(starts, sizes)], out=region)
+            elif strategy == 'mask':
+                shape = (rows.stop - rows.start, cols.stop - cols.start)
+                # take() copies indices that are not contiguous intp and
+                #   buffers the whole output with the default mode='raise'
+                labels = self._buffer('labels', np.intp, shape)
+                np.copyto(labels, self._labels[rows, cols])
+                mask = self._buffer('mask', bool, shape)
+                np.take(lut, labels, out=mask, mode='clip')
+                region = rows, cols, mask
+            self._last_read = strategy, total, region
+            self._read_selection = selection
+        return self._last_read
+
+    def _window(self, selection: tuple) -> tuple:
+        """row and column slices of the bounding window of the selected
+        rois, clipped to the frame"""
+        boxes = [self._boxes[i] for i in selection if len(self._vertices[i]) > 0]
+        if not boxes:
+            return slice(0, 0), slice(0, 0)
+        x1 = min(max(min(int(b[0]) for b in boxes), 0), self._width)
+        y1 = min(max(min(int(b[1]) for b in boxes), 0), self._height)
+        x2 = min(max(max(int(b[2]) for b in boxes) + 1, x1), self._width)
+        y2 = min(max(max(int(b[3]) for b in boxes) + 1, y1), self._height)
+        return slice(y1, y2), slice(x1, x2)
+
+    def _sort_atoms(self) -> None:
+        """order the pixels covered by any roi by atom, done once per model.
+        Keeps the pixel order, the atom, start and size of every run and the
+        float64 (rois, atoms) membership of those atoms"""
+        labels = self._labels.reshape(-1)
+        pixels = np.flatnonzero(self._membership.any(axis=1)[labels])
+        order = pixels[np.argsort(labels[pixels], kind='stable')]
+        ordered = labels[order]
+        starts = np.flatnonzero(np.concatenate(([True], ordered[1:] != ordered[:-1])))
+        if order.size < 1:
+            starts = starts[:0]
+        self._order = order
+        self._atoms = ordered[starts]
+        self._starts = starts
+        self._sizes = np.diff(np.append(starts, order.size))
+        self._weights = self._membership[self._atoms].T.astype(np.float64)
+
+    def _find_rectangles(self) -> None:
+        """find the rois whose pixels fill their bounding box (clipped to the
+        frame), done once per model. Keeps their corners as (y1, x1, y2, x2)
+        rows, the second corner exclusive"""
+        boxes = self._boxes.astype(np.intp).reshape(-1, 4)
+        x1 = np.clip(boxes[:, 0], 0, self._width)
+        y1 = np.clip(boxes[:, 1], 0, self._height)
+        x2 = np.maximum(np.clip(boxes[:, 2] + 1, 0, self._width), x1)
+        y2 = np.maximum(np.clip(boxes[:, 3] + 1, 0, self._height), y1)
+        sizes = np.array([len(i) for i in self._indices], dtype=np.intp)
+        self._corners = np.stack((y1, x1, y2, x2))
+        self._rectangular = (sizes > 0) & (sizes == (x2 - x1) * (y2 - y1))
+
+    def _integral_rois(self) -> bool:
+        """true if roi_statistics() sums every roi from summed area tables"""
+        if self._strategy not in ('auto', 'integral') or self.count < 1:
+            return False
+        if self._rectangular is None:
+            self._find_rectangles()
+        if not self._rectangular.all():
+            return False
+        return (self._strategy == 'integral' or self.count >= INTEGRAL_ROIS
+                or self._order.size >= self._width * self._height * INTEGRAL_COVERAGE)
+
+    def _integrals(self, depth_image: np.ndarray) -> tuple:
+        """summed area tables of depth, depth^2 and valid pixels of a frame,
+        (height + 1, width + 1) with a leading row and column of zeros. The
+        float64 sums are exact, see above
+
+        :return: sums, squares, counts
+        :rtype: tuple
+        """
+        shape = (self._height + 1, self._width + 1)
+        sums = self._buffer('sums', np.float64, shape)
+        squares = self._buffer('squares', np.float64, shape)
+        counts = self._buffer('counts', np.int32, shape)
+        flags = self._buffer('flags', np.uint8, depth_image.shape)
+        cv2.integral2(depth_image, sum=sums, sqsum=squares,
+                      sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        np.not_equal(depth_image, 0, out=flags.view(bool))
+        cv2.integral(flags, sum=counts, sdepth=cv2.CV_32S)
+        return sums, squares, counts
+
+    def _box_sums(self, tables: tuple, rois=slice(None)) -> tuple:
+        """depth sum, square sum, valid pixels and pixels of rectangular
+        rois, four lookups per table and roi
+
+        :param tables: summed area tables, see _integrals()
+        :type tables: tuple
+        :param rois: roi indices, defaults to every roi
+        :type rois: numpy.ndarray or slice, optional
+        :return: float64 array per sum with one value per roi
+        :rtype: tuple
+        """
+        y1, x1, y2, x2 = self._corners[:, rois]
+        sums, squares, counts = (table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+                                 for table in tables)
+        return sums, squares, counts.astype(np.float64), ((x2 - x1) * (y2 - y1)).astype(np.float64)
+
+    def _buffer(self, name: str, dtype, shape: tuple) -> np.ndarray:
+        """'shape' view of a scratch buffer big enough for a frame with a
+        row and column of padding (or for 'shape' if that is larger),
+        allocated on first use"""
+        buffer = self._scratch.get(name)
+        length = math.prod(shape)
+        if buffer is None or buffer.dtype != dtype or buffer.size < length:
+            size = max((self._width + 1) * (self._height + 1), length)
+            buffer = self._scratch[name] = np.empty(size, dtype=dtype)
+        return buffer[:length].reshape(shape)
+
+    def save(self, path: str) -> None:
+        """write compiled model to 'path' (numpy .npz)"""
+        vertex_counts = np.array([len(v) for v in self._vertices], dtype=np.int64)
+        index_counts = np.array([len(i) for i in self._indices], dtype=np.int64)
+        empty = np.zeros((0, 2), dtype=np.int32)
+        with open(path, 'wb') as file:
+            np.savez(file,
+                     version=np.array(MODEL_VERSION),
+                     key=np.array(self._key),
+                     size=np.array((self._width, self._height)),
+                     vertices=np.concatenate(self._vertices) if self._vertices else empty,
+                     vertex_counts=vertex_counts,
+                     boxes=self._boxes,
+                     labels=self._labels,
+                     membership=self._membership,
+                     indices=np.concatenate(self._indices) if self._indices else np.zeros(0, np.int32),
+                     index_counts=index_counts)
+
+    @classmethod
+    def load(cls, path: str, polygons: list, width=848, height=480):
+        """load a compiled model from 'path'
+
+        :raises ValueError: if the file does not belong to these polygons
+        :raises OSError: if the file can not be read
+        """
+        key = model_key(polygons, width, height)
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != MODEL_VERSION or str(data['key']) != key:
+                raise ValueError(f'"{path}" does not match regions of interest')
+            vertices = np.split(data['vertices'], np.cumsum(data['vertex_counts'])[:-1])
+            indices = np.split(data['indices'], np.cumsum(data['index_counts'])[:-1])
+            compiled = (list(vertices) if len(polygons) else [], data['boxes'], data['labels'],
+                        data['membership'], list(indices) if len(polygons) else [])
+        return cls(polygons, width, height, _compiled=compiled)
+
+    @property
+    def strategy(self) -> str:
+        """how statistics() reads the selected rois, one of STRATEGIES.
+        'auto' (the default) picks 'indices' or 'mask' per selection.
+        'integral' applies to selections of rectangles that do not overlap
+        and to roi_statistics() of models made of rectangles only, anything
+        else falls back to 'auto'. roi_statistics() sums atoms unless it
+        uses the tables"""
+        return self._strategy
+
+    @strategy.setter
+    def strategy(self, strategy: str) -> None:
+        if strategy not in STRATEGIES:
+            raise ValueError(f'"{strategy}" is not one of {", ".join(STRATEGIES)}')
+        self._strategy = strategy
+        self._read_selection = None
+
+    @property
+    def polygons(self) -> list:
+        """polygons the model was compiled from"""
+        return self._polygons
+
+    @property
+    def count(self) -> int:
+        """number of rois"""
+        return len(self._polygons)
+
+    @property
+    def key(self) -> str:
+        """content hash of polygons and resolution"""
+        return self._key
+
+    @property
+    def vertices(self) -> list:
+        """int32 vertex array per roi"""
+        return self._vertices
+
+    @property
+    def boxes(self) -> np.ndarray:
+        """bounding box (x1, y1, x2, y2) per roi"""
+        return self._boxes
+
+    @property
+    def labels(self) -> np.ndarray:
+        """atom label map"""
+        return self._labels
+
+    @property
+    def membership(self) -> np.ndarray:
+        """(atoms, rois) table of which rois cover which atom"""
+        return self._membership
+
+    @property
+    def indices(self) -> list:
+        """flat pixel indices per roi"""
+        return self._indices
+
+    @property
+    def width(self) -> int:
+        """frame width"""
+        return self._width
+
+    @property
+    def height(self) -> int:
+        """frame height"""
+        return self._height
+
+
+def _summarize(total: int, valid: int, depth_sum: int, square_sum: int,
+               conversion: float) -> tuple:
+    """depth, invalid and deviation from exact integer sums of 'total'
+    pixels, 'valid' of them non zero"""
+    invalid = (total - valid) / total * 100
+    # exact integer variance, total * sum(x^2) - sum(x)^2 over total^2
+    deviation = math.sqrt(max(square_sum * total - depth_sum * depth_sum, 0)) / total
+    depth = depth_sum / valid * conversion if valid > 0 else float(0)
+    return depth, invalid, deviation * conversion
+
+
+def _combine(size, valid, total, squares, conversion: float) -> tuple:
+    """depth, invalid and deviation arrays from per roi pixel, valid pixel,
+    depth and square sums"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        depth = np.where(valid > 0, total / valid, 0) * conversion
+        invalid = np.where(size > 0, (size - valid) / size * 100, 100)
+        mean = total / size
+        deviation = np.where(size > 0, np.sqrt(np.maximum(squares / size - mean * mean, 0)), 0)
+    return depth, invalid, deviation * conversion
+
+
+def select_bits(count: int) -> int:
+    """default select mask width for 'count' rois. 8 bits for up to 8 rois
+    (the original select node), otherwise the narrowest of 16, 32 and 64 bits
+    that fits, 64 bits beyond that"""
+    for bits in SELECT_BITS:
+        if count <= bits:
+            return bits
+    return SELECT_BITS[-1]
+
+
+def model_key(polygons: list, width: int, height: int) -> str:
+    """content hash of polygons and resolution"""
+    text = repr((MODEL_VERSION, width, height, [[tuple(p) for p in poly] for poly in polygons]))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def load_model(config_path: str, polygons: list, width=848, height=480) -> RoiModel:
+    """load the compiled model of 'polygons' from the cache next to the
+    configuration file, or compile and cache it
+
+    :param config_path: configuration file path
+    :type config_path: string
+    :param polygons: list of polygons, each a list of (x, y) tuples
+    :type polygons: list
+    :return: compiled model
+    :rtype: RoiModel
+    """
+    directory = os.path.join(os.path.dirname(os.path.abspath(config_path)), CACHE_DIRECTORY)
+    path = os.path.join(directory, f'{model_key(polygons, width, height)}.npz')
+    if os.path.isfile(path):
+        try:
+            model = RoiModel.load(path, polygons, width, height)
+            os.utime(path)
+            log.debug(f'Loaded regions of interest from "{path}"')
+            return model
+        except (OSError, ValueError, KeyError) as e:
+            log.warning(f'Failed to load cached regions of interest "{path}": {e}')
+
+    model = RoiModel(polygons, width, height)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        model.save(path)
+        _prune(directory)
+        log.debug(f'Cached regions of interest to "{path}"')
+    except OSError as e:
+        log.warning(f'Failed to cache regions of interest to "{path}": {e}')
+    return model
+
+
+def _prune(directory: str) -> None:
+    """remove all but the newest CACHE_SIZE cached models"""
+    files = [os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.npz')]
+    files.sort(key=os.path.getmtime, reverse=True)
+    for file in files[CACHE_SIZE:]:
+        try:
+            os.remove(file)
+        except OSError:
+            pass
+
+
+def _label_dtype(count: int):
+    """smallest unsigned integer type able to hold 'count' labels"""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if count <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.uint64
@@ -0,0 +1,316 @@
+"""
+title:   RealSenseOPC typed configuration
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+The configuration file is converted once, when it is loaded. Every section is
+described by a schema of (key, converter, default) fields and becomes a
+slotted object, so the rest of the program reads plain attributes
+('settings.application.sleep_time') instead of parsing strings in its loops.
+
+Camera specific sections ('[camera:serial]', '[nodes:serial]',
+'[roi:serial]') replace the shared section for that camera. Use
+Settings.station(serial) to get the sections that apply to a camera.
+"""
+
+import logging as log
+
+from roi import parse_roi
+
+# CONSTANTS
+REQUIRED = object()  # marks a field without a default
+BOOLEAN_WORDS = {'true': True, 'yes': True, 'on': True,
+                 'false': False, 'no': False, 'off': False}
+MAX_FILTER_LEVEL = 5
+
+
+class SettingsError(ValueError):
+    """raised when configuration values are missing or can not be converted"""
+
+
+# converters. Each takes the raw string and raises ValueError if it is invalid
+
+def to_str(text: str) -> str:
+    return text.strip()
+
+
+def to_int(text: str) -> int:
+    return int(float(text))
+
+
+def to_float(text: str) -> float:
+    return float(text)
+
+
+def to_bool(text: str) -> bool:
+    """'1.0', '0', 'true', 'no'... to bool"""
+    word = text.strip().lower()
+    if word in BOOLEAN_WORDS:
+        return BOOLEAN_WORDS[word]
+    return bool(float(word))
+
+
+def to_level(text: str) -> int:
+    """logging level name ('info') to logging level number"""
+    level = log.getLevelName(text.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f'"{text}" is not a logging level')
+    return level
+
+
+def to_seconds(text: str) -> float:
+    """milliseconds to seconds"""
+    milliseconds = float(text)
+    if milliseconds < 0:
+        raise ValueError(f'"{text}" is negative')
+    return milliseconds / 1000
+
+
+def to_filter_level(text: str) -> int:
+    """spatial filter level, clamped to 0 - 5"""
+    return min(max(int(float(text)), 0), MAX_FILTER_LEVEL)
+
+
+def to_select_bits(text: str) -> int:
+    """roi select mask width, a positive multiple of 8"""
+    bits = int(float(text))
+    if bits < 8 or bits % 8:
+        raise ValueError(f'"{text}" is not a positive multiple of 8')
+    return bits
+
+
+def to_list(text: str) -> tuple:
+    """comma separated values"""
+    return tuple(value.strip() for value in text.split(',') if value.strip())
+
+
+class Field():
+    __slots__ = ('key', 'convert', 'default')
+
+    def __init__(self, key: str, convert, default=REQUIRED):
+        """describe one configuration value
+
+        :param key: key in the configuration file, also the attribute name
+        :type key: string
+        :param convert: converts the raw string, raises ValueError if invalid
+        :type convert: callable
+        :param default: value used if the key is missing, defaults to REQUIRED
+        :type default: any, optional
+        """
+        self.key = key
+        self.convert = convert
+        self.default = default
+
+
+class Section():
+    """base of the typed configuration sections. Subclasses list their
+    fields in SCHEMA and the same names in __slots__"""
+    __slots__ = ()
+    SCHEMA = ()
+
+    def __init__(self, name: str, values: dict, problems: list, defaults: list):
+        """convert a raw configuration section
+
+        :param name: section title, used in messages
+        :type name: string
+        :param values: raw key -> string values, empty if the section is missing
+        :type values: dict
+        :param problems: invalid or missing required values are appended here
+        :type problems: list
+        :param defaults: missing keys that fell back to their default are
+        appended here. Empty values also use the default
+        :type defaults: list
+        """
+        for field in self.SCHEMA:
+            raw = values.get(field.key)
+            value = field.default
+            if raw is None:
+                if field.default is REQUIRED:
+                    problems.append(f'"[{name}]: {field.key}" is missing')
+                    value = None
+                else:
+                    defaults.append(f'[{name}]: {field.key}')
+            elif not raw.strip() and field.default is not REQUIRED:
+                # left empty on purpose, use the default
+                pass
+            else:
+                try:
+                    value = field.convert(raw)
+                except (ValueError, TypeError) as e:
+                    problems.append(f'"[{name}]: {field.key}" = "{raw}" is invalid: {e}')
+                    if field.default is REQUIRED:
+                        value = None
+            setattr(self, field.key, value)
+
+    def __eq__(self, other) -> bool:
+        return (type(self) is type(other)
+                and all(getattr(self, s) == getattr(other, s) for s in self.__slots__))
+
+    def __repr__(self) -> str:
+        values = ', '.join(f'{s}={getattr(self, s)!r}' for s in self.__slots__)
+        return f'{type(self).__name__}({values})'
+
+
+class ServerSettings(Section):
+    __slots__ = ('ip',)
+    SCHEMA = (Field('ip', to_str),)
+
+
+class CamerasSettings(Section):
+    __slots__ = ('serials',)
+    SCHEMA = (Field('serials', to_list, ()),)
+
+
+class LoggingSettings(Section):
+    __slots__ = ('logging_level', 'opcua_logging_level', 'queue_size', 'rate_limit')
+    SCHEMA = (Field('logging_level', to_level, log.DEBUG),
+              Field('opcua_logging_level', to_level, log.WARNING),
+              Field('queue_size', to_int, 10000),
+              Field('rate_limit', to_float, 10.0))  # seconds
+
+
+class ApplicationSettings(Section):
+    __slots__ = ('hot_reload', 'sleep_time', 'frame_bus')
+    SCHEMA = (Field('hot_reload', to_bool, True),
+              Field('sleep_time', to_seconds, 0.015),  # seconds
+              Field('frame_bus', to_str, ''))
+
+
+class MeasurementSettings(Section):
+    __slots__ = ('enabled', 'directory', 'roi_stats', 'retention_days')
+    SCHEMA = (Field('enabled', to_bool, False),
+              Field('directory', to_str, 'measurements'),
+              Field('roi_stats', to_bool, True),
+              Field('retention_days', to_float, 28.0))
+
+
+class ProfilerSettings(Section):
+    __slots__ = ('enabled', 'duration', 'interval', 'sentinel')
+    SCHEMA = (Field('enabled', to_bool, False),
+              Field('duration', to_float, 30.0),  # seconds
+              Field('interval', to_seconds, 0.005),  # seconds
+              Field('sentinel', to_str, ''))  # file name next to the log, empty to not watch
+
+
+class MemorySettings(Section):
+    __slots__ = ('enabled', 'interval', 'tracemalloc', 'top')
+    SCHEMA = (Field('enabled', to_bool, False),
+              Field('interval', to_float, 60.0),  # seconds
+              Field('tracemalloc', to_bool, False),
+              Field('top', to_int, 10))
+
+
+class CameraSettings(Section):
+    __slots__ = ('framerate', 'spatial_filter_level', 'region_of_interest_auto_exposure',
+                 'metric', 'options')
+    SCHEMA = (Field('framerate', to_int, 0),
+              Field('spatial_filter_level', to_filter_level, 0),
+              Field('region_of_interest_auto_exposure', to_bool, False),
+              Field('metric', to_bool, False))
+
+    def __init__(self, name: str, values: dict, problems: list, defaults: list):
+        super().__init__(name, values, problems, defaults)
+        # raw option strings, CameraOptions matches them to device options
+        self.options = dict(values)
+
+
+class NodeSettings(Section):
+    __slots__ = ('roi_depth_node', 'roi_invalid_node', 'roi_deviation_node', 'roi_select_node',
+                 'status_node', 'picture_trigger_node', 'alive_node', 'roi_median_node',
+                 'roi_p5_node', 'roi_p95_node', 'roi_trimmed_mean_node', 'roi_select_bits')
+    SCHEMA = tuple(Field(key, to_str, None) for key in __slots__[:-1]) + (
+        Field('roi_select_bits', to_select_bits, None),)  # None picks a width from the roi count
+
+
+class RoiSettings(Section):
+    __slots__ = ('keys', 'polygons', 'statistics')
+
+    def __init__(self, name: str, values: dict, problems: list, defaults: list):
+        """every key of the section is a polygon, optionally led by the
+        depth statistic to report for it. Invalid polygons are reported and
+        replaced by an empty polygon"""
+        self.keys = tuple(values)
+        polygons = []
+        statistics = []
+        for key, raw in values.items():
+            try:
+                statistic, polygon = parse_roi(raw)
+            except ValueError as e:
+                problems.append(f'"[{name}]: {key}" is invalid: {e}')
+                statistic, polygon = 'mean', []
+            polygons.append(polygon)
+            statistics.append(statistic)
+        self.polygons = tuple(polygons)
+        self.statistics = tuple(statistics)
+
+
+class StationSettings():
+    __slots__ = ('serial', 'camera', 'nodes', 'roi')
+
+    def __init__(self, serial, camera: CameraSettings, nodes: NodeSettings, roi: RoiSettings):
+        """sections that apply to one camera"""
+        self.serial = serial
+        self.camera = camera
+        self.nodes = nodes
+        self.roi = roi
+
+
+class Settings():
+    __slots__ = ('server', 'cameras', 'logging', 'application', 'measurements', 'profiler',
+                 'memory', 'camera', 'nodes', 'roi', 'problems', 'defaults', '_stations')
+
+    def __init__(self, data: dict, strict=True):
+        """convert raw configuration data
+
+        :param data: section -> key -> string, as read by configparser
+        :type data: dict
+        :param strict: raise if anything is invalid, otherwise invalid values
+        fall back to their default and are listed in 'problems', defaults to True
+        :type strict: bool, optional
+        :raises SettingsError: if strict and values are missing or invalid
+        """
+        problems = []
+        defaults = []
+        self.server = ServerSettings('server', data.get('server', {}), problems, defaults)
+        self.cameras = CamerasSettings('cameras', data.get('cameras', {}), problems, defaults)
+        self.logging = LoggingSettings('logging', data.get('logging', {}), problems, defaults)
+        self.application = ApplicationSettings('application', data.get('application', {}),
+                                               problems, defaults)
+        self.measurements = MeasurementSettings('measurements', data.get('measurements', {}),
+                                                problems, defaults)
+        self.profiler = ProfilerSettings('profiler', data.get('profiler', {}), problems, defaults)
+        self.memory = MemorySettings('memory', data.get('memory', {}), problems, defaults)
+        self.camera = CameraSettings('camera', data.get('camera', {}), problems, defaults)
+        self.nodes = NodeSettings('nodes', data.get('nodes', {}), problems, defaults)
+        self.roi = RoiSettings('roi', data.get('roi', {}), problems, defaults)
+
+        # camera specific sections
+        sections = {}
+        for name, values in data.items():
+            section, _, serial = name.partition(':')
+            if serial and section in ('camera', 'nodes', 'roi'):
+                kind = {'camera': CameraSettings, 'nodes': NodeSettings, 'roi': RoiSettings}[section]
+                sections[(section, serial)] = kind(name, values, problems, defaults)
+        self._stations = {None: StationSettings(None, self.camera, self.nodes, self.roi)}
+        for serial in set(s for _, s in sections) | set(self.cameras.serials):
+            self._stations[serial] = StationSettings(
+                serial,
+                sections.get(('camera', serial), self.camera),
+                sections.get(('nodes', serial), self.nodes),
+                sections.get(('roi', serial), self.roi))
+
+        self.problems = tuple(problems)
+        self.defaults = tuple(defaults)
+        if strict and problems:
+            raise SettingsError('; '.join(problems))
+
+    def station(self, serial=None) -> StationSettings:
+        """sections that apply to the camera 'serial'
+
+        :param serial: camera serial number, defaults to the shared sections
+        :type serial: string, optional
+        :return: camera, nodes and roi settings
+        :rtype: StationSettings
+        """
+        return self._stations.get(serial or None, self._stations[None])
@@ -0,0 +1,292 @@
+"""
+title:   RealSenseOPC station class
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+"""
+
+import logging as log
+import os
+
+import opcua
+import pyrealsense2 as rs
+from opcua import Node, ua
+
+from camera import Camera
+from config import Config
+from measurements import MeasurementLog
+from roi import ROBUST_STATISTICS, load_model, select_bits
+from status import Status
+
+
+class Station:
+    def __init__(self, client: opcua.Client, camera: Camera, configurator: Config):
+        """create a Station object. A station is one camera together with its
+        own server nodes, regions of interest and status. Stations look for
+        camera specific sections ('[camera:serial]', '[nodes:serial]',
+        '[roi:serial]') and fall back to the shared sections
+
+        :param client: opc client shared by every station
+        :type client: opcua.Client
+        :param camera: started camera
+        :type camera: Camera
+        :param configurator: configuration
+        :type configurator: Config
+        :raises RuntimeError: if the nodes or regions of interest could not
+        be retrieved
+        """
+        self._client = client
+        self._camera = camera
+        self._configurator = configurator
+
+        serial = camera.serial
+        self._name = serial if serial else 'default'
+        self._node_settings = configurator.settings.station(serial).nodes
+
+        # nodes
+        try:
+            self._nodes = {
+                'roi_depth': self.get_node('roi_depth_node'),
+                'roi_invalid': self.get_node('roi_invalid_node'),
+                'roi_deviation': self.get_node('roi_deviation_node'),
+                'roi_select': self.get_node('roi_select_node'),
+                'status': self.get_node('status_node'),
+                'alive': self.get_node('alive_node')
+            }
+            # robust statistics are only published if their node is set
+            for statistic in ROBUST_STATISTICS:
+                if getattr(self._node_settings, f'roi_{statistic}_node', None):
+                    self._nodes[f'roi_{statistic}'] = self.get_node(f'roi_{statistic}_node')
+        except (ua.UaError, KeyError) as e:
+            raise RuntimeError(f'Failed to retrieve nodes for station '
+                               f'"{self._name}" from server: {e}')
+
+        # status
+        self._status = Status(self._camera, self._nodes)
+        self._previous_status = self._status.status
+
+        self._roi_select = 0
+        self._roi_depth = 0.0
+        self._roi_invalid = 100.0
+        self._roi_deviation = 0.0
+        self._roi_robust = (0.0,) * len(ROBUST_STATISTICS)
+        self._measurements = None
+        self._per_roi = False
+
+        # regions of interest and camera settings. camera options were
+        #   already written when the camera was setup
+        self.apply(self.prepare(configurator), write_options=False)
+
+    def prepare(self, configurator: Config) -> dict:
+        """read everything the station needs from 'configurator' and compile
+        the regions of interest. Does not touch the camera or the server, so
+        it may run on any thread
+
+        :param configurator: configuration
+        :type configurator: Config
+        :raises RuntimeError: if regions of interest are missing
+        :return: prepared settings for apply()
+        :rtype: dict
+        """
+        settings = configurator.settings.station(self._camera.serial)
+        polygons = list(settings.roi.polygons)
+        if len(polygons) < 1:
+            raise RuntimeError(f'Missing regions of interest for station "{self._name}" '
+                               f'from configuration file')
+        bits = self._node_settings.roi_select_bits or select_bits(len(polygons))
+        if len(polygons) > bits:
+            log.warning(f'Station "{self._name}" has {len(polygons)} regions of interest but '
+                        f'a {bits} bit select node can only select the first {bits}. Use a '
+                        f'wider select node or an array node')
+
+        return {
+            'configurator': configurator,
+            'settings': settings,
+            'statistics': settings.roi.statistics,
+            'select_bits': bits,
+            'model': load_model(configurator.name, polygons,
+                                self._camera.width, self._camera.height)
+        }
+
+    def apply(self, prepared: dict, write_options=True) -> None:
+        """switch to settings returned by prepare(). Call between frames
+
+        :param prepared: prepared settings
+        :type prepared: dict
+        :param write_options: write changed camera options, defaults to True
+        :type write_options: bool, optional
+        """
+        self._configurator = prepared['configurator']
+        self._settings = prepared['settings'].camera
+        self._model = prepared['model']
+        self._select_bits = prepared['select_bits']
+        # the histogram is only built if a robust statistic node is set or
+        #   the selected roi reports a robust statistic
+        self._statistics = prepared['statistics']
+        self._robust = any(f'roi_{statistic}' in self._nodes for statistic in ROBUST_STATISTICS)
+
+        if write_options:
+            try:
+                changed = self._camera.options.update_settings({'camera': self._settings.options})
+                if changed:
+                    log.info(f'Station "{self._name}" camera options changed: {changed}')
+            except RuntimeError as e:
+                log.warning(f'Failed to write camera options for station "{self._name}": {e}')
+
+        self.set_roi_exposure()
+
+    def update_roi_data(self, roi_select) -> None:
+        """compute roi data for the given selection. Safe to call from a
+        worker thread, numpy releases the GIL for the heavy lifting
+
+        :param roi_select: roi select value read from the server
+        :type roi_select: int or list
+        """
+        self._roi_select = roi_select
+        # roi_depth reports a robust statistic only for a roi selected on its
+        #   own, over several rois it would describe none of them
+        selection = self._model.select(roi_select, self._select_bits)
+        statistic = self._statistics[selection[0]] if len(selection) == 1 else 'mean'
+        self._roi_depth, self._roi_invalid, self._roi_deviation = self._camera.roi_data(
+            model=self._model,
+            roi_select=roi_select,
+            filter_level=self._settings.spatial_filter_level,
+            select_bits=self._select_bits,
+            per_roi=self._per_roi,
+            robust=self._robust or statistic != 'mean')
+        robust = self._camera.last_robust_stats
+        self._roi_robust = robust or (0.0,) * len(ROBUST_STATISTICS)
+        if robust and statistic != 'mean':
+            self._roi_depth = robust[ROBUST_STATISTICS.index(statistic)]
+
+    def open_measurements(self, directory: str, roi_stats=True, retention_days=28.0) -> None:
+        """log every result to a measurement log in 'directory'
+
+        :param directory: measurement directory, the station name is appended
+        :type directory: string
+        :param roi_stats: also log every roi on its own, defaults to True
+        :type roi_stats: bool, optional
+        :param retention_days: days of history to keep, defaults to 28.0
+        :type retention_days: float, optional
+        :raises OSError: if the directory can not be created
+        """
+        self._measurements = MeasurementLog(os.path.join(directory, self._name),
+                                            roi_count=self._model.count if roi_stats else 0,
+                                            retention_days=retention_days)
+        self._per_roi = roi_stats
+
+    def close_measurements(self) -> None:
+        """close the measurement log, if any"""
+        measurements, self._measurements = self._measurements, None
+        self._per_roi = False
+        if measurements is not None:
+            measurements.close()
+
+    def record_measurement(self, latency: float) -> None:
+        """append the last result to the measurement log
+
+        :param latency: loop time in milliseconds
+        :type latency: float
+        """
+        if self._measurements is None:
+            return
+        frame_number, timestamp = self._camera.last_frame
+        self._measurements.append(frame_number, timestamp, self._roi_select,
+                                  self._roi_depth, self._roi_invalid, self._roi_deviation,
+                                  latency, self._camera.last_roi_stats)
+
+    def roi_writes(self) -> list:
+        """depth, invalid, and deviation writes, and the robust statistics
+        that have a node
+
+        :return: (node, value, type) tuples
+        :rtype: list
+        """
+        writes = [
+            (self._nodes['roi_depth'], self._roi_depth, ua.VariantType.Float),
+            (self._nodes['roi_invalid'], self._roi_invalid, ua.VariantType.Float),
+            (self._nodes['roi_deviation'], self._roi_deviation, ua.VariantType.Float)
+        ]
+        for statistic, value in zip(ROBUST_STATISTICS, self._roi_robust):
+            node = self._nodes.get(f'roi_{statistic}')
+            if node is not None:
+                writes.append((node, value, ua.VariantType.Float))
+        return writes
+
+    def alive_writes(self, alive) -> list:
+        """set alive to true if false
+
+        :param alive: alive value read from the server
+        :type alive: bool
+        :return: (node, value, type) tuples
+        :rtype: list
+        """
+        if not alive:
+            return [(self._nodes['alive'], True, ua.VariantType.Boolean)]
+        return []
+
+    def status_writes(self) -> list:
+        """send status to server if it changed
+
+        :return: (node, value, type) tuples
+        :rtype: list
+        """
+        new_status = self._status.status
+        if new_status != self._previous_status:
+            self._previous_status = new_status
+            return [(self._nodes['status'], new_status, ua.VariantType.Int16)]
+        return []
+
+    def get_node(self, name: str) -> Node:
+        """retrieve node from opc server
+
+        :raises KeyError: if the node is not in the configuration file
+        """
+        nodeid = getattr(self._node_settings, name, None)
+        if not nodeid:
+            raise KeyError(f'"{name}" is not set')
+        return self._client.get_node(nodeid)
+
+    def roi_box(self) -> tuple:
+        """calculate regions of interest bounding box"""
+        polys = self._model.polygons
+        x = [y[0] for x in polys for y in x if len(x) > 2]
+        y = [y[1] for x in polys for y in x if len(x) > 2]
+        if len(x) and len(y) > 2:
+            x1, y1 = max(min(x), 0), max(min(y), 0)
+            x2, y2 = min(max(x), 847), min(max(y), 479)
+
+            if x1 != x2 and y1 != y2:
+                return x1, y1, x2, y2
+
+        x1, y1, x2, y2 = 106, 60, 742, 420
+        return x1, y1, x2, y2
+
+    def set_roi_exposure(self) -> bool:
+        """set camera auto exposure roi from config file"""
+        try:
+            if self._settings.region_of_interest_auto_exposure:
+                x1, y1, x2, y2, = self.roi_box()
+                roi = rs.region_of_interest()
+                roi.min_x, roi.min_y, roi.max_x, roi.max_y = x1, y1, x2, y2
+                self._camera.set_roi(roi)
+        except RuntimeError:
+            log.warning(f'Failed to set region of interest auto exposure '
+                        f'for station "{self._name}" from configuration file')
+            return False
+        return True
+
+    @property
+    def name(self) -> str:
+        """camera serial number or 'default'"""
+        return self._name
+
+    @property
+    def camera(self) -> Camera:
+        """camera getter"""
+        return self._camera
+
+    @property
+    def nodes(self) -> dict:
+        """server nodes getter"""
+        return self._nodes
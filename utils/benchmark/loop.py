@@ -0,0 +1,374 @@
+"""
+title:   RealSenseOPC end to end loop benchmark
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Runs the client's main loop (main.App) against the mock PLC server, started
+in-process, and an OfflineCamera fed with synthetic or replayed frames. A
+driver thread changes roi_select on the server at a fixed rate, like a PLC
+stepping through parts.
+
+    python loop.py                              30 s, 2 select changes per second
+    python loop.py --replay capture.npz         replay a ROI Utility sequence
+    python loop.py --select-rate 20 --framerate 90 --filter-level 2
+
+Measured:
+
+    select -> result    roi_select changed on the server until the write with
+                        the result of the new selection returned
+    frame -> write      frame fed to the camera until the write with its
+                        result returned
+    writes/s            node values (and requests) written by the client
+    cpu/frame           cpu time of the client loop thread per new frame, and
+                        of the whole process (server and feeder included)
+"""
+
+import argparse
+import importlib.util
+import json
+import logging as log
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import opcua
+from opcua import ua
+
+from simcamera import HEIGHT, WIDTH, FrameFeeder, OfflineCamera, polygon_set, synthetic_frame
+from roistats import metadata
+
+import main as application  # noqa: E402, the client path is set by simcamera
+from config import Config  # noqa: E402
+
+# CONSTANTS
+MOCK_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'mock-server', 'server-data.py')
+ENDPOINT = 'opc.tcp://127.0.0.1:48401'  # not the real server's port
+SYNTHETIC_FRAMES = 8  # different synthetic frames fed in a loop
+ROI_SIZE = 120  # synthetic roi size in pixels, see simcamera.polygon_set
+SELECT_BITS = 8
+
+
+def load_mock_server():
+    """the mock server script as a module (its file name is not importable)"""
+    spec = importlib.util.spec_from_file_location('server_data', MOCK_SERVER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_config(path, endpoint, nodes, polygons, framerate, filter_level, sleep_time):
+    """client configuration file for the mock server's nodes
+
+    :param nodes: tag name -> server node
+    :type nodes: dict
+    :param sleep_time: client loop sleep time in milliseconds
+    :type sleep_time: int
+    """
+    lines = ['[server]', f'ip = {endpoint}', '', '[nodes]']
+    lines += [f'{name} = {node.nodeid.to_string()}' for name, node in nodes.items()]
+    lines += ['', '[roi]']
+    lines += [f'roi_{i + 1} = {polygon}' for i, polygon in enumerate(polygons)]
+    lines += ['', '[camera]',
+              f'framerate = {framerate}',
+              f'spatial_filter_level = {filter_level}',
+              'region_of_interest_auto_exposure = 0',
+              'metric = 1',
+              '', '[logging]',
+              'logging_level = warning',
+              'opcua_logging_level = warning',
+              '', '[application]',
+              'hot_reload = 0',
+              f'sleep_time = {sleep_time}']
+    with open(path, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+class SelectDriver():
+    def __init__(self, node, rate, seed=0):
+        """change 'node' to a new random roi select value 'rate' times per
+        second on a background thread
+
+        :param node: server side roi select node
+        :type node: opcua.Node
+        :param rate: changes per second
+        :type rate: float
+        """
+        self._node = node
+        self._period = 1 / rate
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._changed = {}
+        self._count = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='select', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def changed_at(self, select):
+        """time.perf_counter() of the last change to 'select', None if it
+        was never set"""
+        with self._lock:
+            return self._changed.get(select)
+
+    @property
+    def count(self):
+        """number of changes"""
+        return self._count
+
+    def _run(self):
+        select = 0
+        deadline = time.perf_counter()
+        while self._running:
+            deadline += self._period
+            time.sleep(max(deadline - time.perf_counter(), 0))
+            while True:
+                new = int(self._rng.integers(1, 2 ** SELECT_BITS))
+                if new != select:
+                    break
+            select = new
+            with self._lock:
+                self._changed[select] = time.perf_counter()
+            self._node.set_value(ua.DataValue(ua.Variant(select, ua.VariantType.UInt16)))
+            self._count += 1
+
+
+class TimedApp(application.App):
+    def __init__(self, client, cameras, configurator, feeder, driver):
+        """main.App that times select changes and frames until their result
+        is written. Errors stop the loop instead of restarting the program"""
+        self._feeder = feeder
+        self._driver = driver
+        self.failure = None
+        self.iterations = 0
+        self.requests = 0
+        self.writes = 0
+        self.frames = 0
+        self.select_latency = LatencyHistogram()
+        self.frame_latency = LatencyHistogram()
+        self._select = None
+        self._pending_select = None
+        self._frame_number = 0
+        self._pending_frame = None
+        super().__init__(client, cameras, configurator)
+
+    def read_nodes(self):
+        selects, alives = super().read_nodes()
+        if selects[0] != self._select:
+            self._select = selects[0]
+            self._pending_select = self._driver.changed_at(self._select)
+        return selects, alives
+
+    def update_roi_data(self, selects):
+        super().update_roi_data(selects)
+        frame_number = self._cameras[0].last_frame[0]
+        if frame_number != self._frame_number:
+            self._frame_number = frame_number
+            self._pending_frame = self._feeder.fed_at(frame_number)
+            self.frames += 1
+
+    def write_nodes(self, writes):
+        ok = super().write_nodes(writes)
+        now = time.perf_counter()
+        self.iterations += 1
+        self.requests += 1 if writes else 0
+        self.writes += len(writes)
+        if self._pending_select is not None:
+            self.select_latency.add(now - self._pending_select)
+            self._pending_select = None
+        if self._pending_frame is not None:
+            self.frame_latency.add(now - self._pending_frame)
+            self._pending_frame = None
+        return ok
+
+    def error(self, message='Unknown error', restart=True):
+        self.failure = message
+        log.error(message, exc_info=True)
+        self.disconnect()
+
+
+class LatencyHistogram():
+    def __init__(self, resolution=0.0001, limit=2.0):
+        """latencies counted in 'resolution' second bins up to 'limit'
+        seconds. Adding a latency never allocates, so long (soak) runs stay
+        flat
+
+        :param resolution: bin width in seconds, defaults to 0.0001
+        :type resolution: float, optional
+        :param limit: longer latencies count in the last bin, defaults to 2.0
+        :type limit: float, optional
+        """
+        self._resolution = resolution
+        self._counts = np.zeros(int(limit / resolution) + 1, dtype=np.int64)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+    def add(self, latency):
+        self._counts[min(int(latency / self._resolution), self._counts.size - 1)] += 1
+        self._count += 1
+        self._sum += latency
+        self._max = max(self._max, latency)
+
+    def percentile(self, q):
+        """'q' percentile in seconds, the middle of its bin"""
+        cumulative = np.cumsum(self._counts)
+        index = int(np.searchsorted(cumulative, q / 100 * self._count))
+        return (index + 0.5) * self._resolution
+
+    def summary(self):
+        if self._count == 0:
+            return {'count': 0}
+        return {
+            'count': self._count,
+            'mean_ms': self._sum / self._count * 1000,
+            'p50_ms': self.percentile(50) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self._max * 1000,
+        }
+
+
+def run(images, duration, select_rate, framerate, filter_level, sleep_time, polygons,
+        started=None):
+    """run the client loop for 'duration' seconds
+
+    :param started: called with no arguments once everything is set up,
+    right before the loop starts, defaults to None
+    :type started: callable, optional
+    :return: results
+    :rtype: dict
+    """
+    server, station_nodes = load_mock_server().start_server(ENDPOINT)
+    nodes = station_nodes[0]
+    camera = OfflineCamera(WIDTH, HEIGHT)
+    feeder = FrameFeeder(camera, images, framerate)
+    driver = SelectDriver(nodes['roi_select_node'], select_rate)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'configuration.ini')
+            write_config(path, ENDPOINT, nodes, polygons, framerate, filter_level, sleep_time)
+            configurator = Config(path, application.REQUIRED_DATA)
+            client = opcua.Client(ENDPOINT)
+            client.connect()
+
+            camera.start()
+            feeder.start()
+            app = TimedApp(client, [camera], configurator, feeder, driver)
+            if started is not None:
+                started()
+            driver.start()
+            timer = threading.Timer(duration, camera.stop)
+            timer.start()
+
+            start = time.perf_counter()
+            thread_start = time.thread_time()
+            process_start = time.process_time()
+            app.run()
+            elapsed = time.perf_counter() - start
+            thread_cpu = time.thread_time() - thread_start
+            process_cpu = time.process_time() - process_start
+
+            timer.cancel()
+            driver.stop()
+            feeder.stop()
+            app.disconnect()
+    finally:
+        driver.stop()
+        feeder.stop()
+        camera.close()
+        server.stop()
+
+    frames = max(app.frames, 1)
+    return {
+        'duration_s': elapsed,
+        'failure': app.failure,
+        'frames_fed': feeder.count,
+        'frames_computed': app.frames,
+        'select_changes': driver.count,
+        'loops_per_sec': app.iterations / elapsed,
+        'writes_per_sec': app.writes / elapsed,
+        'requests_per_sec': app.requests / elapsed,
+        'loop_cpu_ms_per_frame': thread_cpu * 1000 / frames,
+        'process_cpu_ms_per_frame': process_cpu * 1000 / frames,
+        'select_to_result': app.select_latency.summary(),
+        'frame_to_write': app.frame_latency.summary(),
+    }
+
+
+def report(results):
+    print(f'{results["duration_s"]:.1f} s: {results["frames_fed"]} frames fed, '
+          f'{results["frames_computed"]} computed, {results["select_changes"]} select changes')
+    if results['failure']:
+        print(f'stopped by an error: {results["failure"]}')
+    print(f'loops/s {results["loops_per_sec"]:.1f}  writes/s {results["writes_per_sec"]:.1f}  '
+          f'requests/s {results["requests_per_sec"]:.1f}')
+    print(f'cpu/frame {results["loop_cpu_ms_per_frame"]:.3f} ms loop thread, '
+          f'{results["process_cpu_ms_per_frame"]:.3f} ms process')
+    print(f'{"latency":<18}{"count":>7}{"mean ms":>10}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+    for name in ('select_to_result', 'frame_to_write'):
+        r = results[name]
+        if r['count'] == 0:
+            print(f'{name:<18}{0:>7}')
+            continue
+        print(f'{name:<18}{r["count"]:>7}{r["mean_ms"]:>10.2f}{r["p50_ms"]:>9.2f}'
+              f'{r["p99_ms"]:>9.2f}{r["max_ms"]:>9.2f}')
+
+
+def add_arguments(parser, duration=30):
+    """command line arguments of run()"""
+    parser.add_argument('--duration', type=float, default=duration, help='seconds')
+    parser.add_argument('--select-rate', type=float, default=2,
+                        help='roi_select changes per second')
+    parser.add_argument('--framerate', type=int, default=30, help='camera frames per second')
+    parser.add_argument('--filter-level', type=int, default=0, help='spatial filter level (0-5)')
+    parser.add_argument('--sleep-time', type=int, default=15,
+                        help='client loop sleep time in milliseconds')
+    parser.add_argument('--holes', type=float, default=0.1,
+                        help='fraction of invalid pixels of synthetic frames')
+    parser.add_argument('--replay', help='.npz sequence saved by the ROI Utility')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+
+
+def load_images(parser, args):
+    """frames of the --replay sequence, or synthetic frames"""
+    if not args.replay:
+        return [synthetic_frame(holes=args.holes, seed=seed) for seed in range(SYNTHETIC_FRAMES)]
+    with np.load(args.replay) as data:
+        images = list(data['depth'])
+    if not images or images[0].shape != (HEIGHT, WIDTH):
+        parser.error(f'--replay needs {WIDTH}x{HEIGHT} frames')
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description='end to end client loop benchmark')
+    add_arguments(parser)
+    args = parser.parse_args()
+    images = load_images(parser, args)
+
+    log.basicConfig(level=log.WARNING)
+    results = run(images, args.duration, args.select_rate, args.framerate, args.filter_level,
+                  args.sleep_time, polygon_set(ROI_SIZE))
+    report(results)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'metadata': metadata(), 'arguments': vars(args), 'results': results},
+                      file, indent=2)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
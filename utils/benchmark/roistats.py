@@ -0,0 +1,251 @@
+"""
+title:   RealSenseOPC roi statistics benchmark
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Times the client's roi statistics (Camera.roi_data, RoiModel) on synthetic
+848x480 z16 frames. Every case sweeps all 256 roi_select values of an 8 roi
+configuration. Cases vary the spatial filter level, polygon size, overlap
+and shape and the fraction of invalid pixels. The 'steady' cases keep every
+roi selected, which is what a client sees between select changes: they
+should allocate nothing but a few hundred bytes of python objects. The
+'statistics_<strategy>' cases force one way of reading the selected rois
+(see roi.STRATEGIES) to compare with 'statistics', which picks one per
+selection. For rectangles 'roi_statistics_indices' (atom sums) and
+'roi_statistics_integral' (summed area tables) compare the same way.
+'robust_statistics' (histogram median, percentiles and trimmed mean) sweeps
+the same selections as 'statistics'. 'integral_robust' runs both on every
+call with summed area tables, as a client publishing per roi and robust
+statistics of rectangles does, so both share the model's scratch buffers.
+
+    python roistats.py                          full sweep
+    python roistats.py --quick                  a few cases, filter level 0 and 2
+    python roistats.py --compare old.json       print speedup against old.json
+
+Results (ops/s, mean, p50 and p99 latency, bytes allocated per call) are
+written as JSON. Allocations are traced with tracemalloc, which sees numpy
+buffers but not memory allocated inside librealsense processing blocks.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from simcamera import HEIGHT, WIDTH, OfflineCamera, polygon_set, synthetic_frame
+
+from roi import STRATEGIES, RoiModel  # noqa: E402, the client path is set by simcamera
+
+# CONSTANTS
+SELECT_BITS = 8
+SELECTS = range(2 ** SELECT_BITS)  # every roi_select value of 8 rois
+FILTER_LEVELS = (0, 1, 2, 3, 4, 5)
+POLYGONS = (  # (name, size, overlap, shape, count)
+    ('small', 40, 0.0, 'hexagon', 8),
+    ('medium', 120, 0.0, 'hexagon', 8),
+    ('large', 200, 0.0, 'hexagon', 8),
+    ('medium-overlap', 120, 0.5, 'hexagon', 8),
+    ('large-overlap', 200, 0.5, 'hexagon', 8),
+    ('medium-rectangle', 120, 0.0, 'rectangle', 8),
+    ('grid', 8, 0.0, 'rectangle', 1600),  # 40 x 40 cells, 32% of the frame
+)
+HOLES = (0.0, 0.1, 0.5)
+QUICK = ((0, 2), ('small', 'medium', 'large-overlap', 'medium-rectangle', 'grid'), (0.0, 0.1))
+ALLOCATION_SAMPLES = 16  # calls traced per case
+
+
+def measure(function, arguments, rounds=1):
+    """call 'function' with every argument tuple in 'arguments', 'rounds'
+    times
+
+    :return: latencies in seconds and mean bytes allocated per call
+    :rtype: tuple
+    """
+    for args in arguments[:8]:
+        function(*args)  # warm up caches and filters
+
+    latencies = []
+    clock = time.perf_counter_ns
+    for _ in range(rounds):
+        for args in arguments:
+            start = clock()
+            function(*args)
+            latencies.append(clock() - start)
+
+    tracemalloc.start()
+    allocated = []
+    step = max(len(arguments) // ALLOCATION_SAMPLES, 1)
+    for args in arguments[::step]:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function(*args)
+        allocated.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    return np.array(latencies) / 1e9, float(np.mean(allocated))
+
+
+def summarize(latencies, allocated):
+    return {
+        'calls': int(latencies.size),
+        'ops_per_sec': float(latencies.size / latencies.sum()),
+        'mean_ms': float(latencies.mean() * 1000),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'alloc_bytes_per_call': allocated,
+    }
+
+
+def run(filter_levels, polygon_sets, holes, rounds):
+    camera = OfflineCamera(WIDTH, HEIGHT)
+    results = []
+    try:
+        for name, size, overlap, shape, count in polygon_sets:
+            model = RoiModel(polygon_set(size, overlap, count, shape), WIDTH, HEIGHT)
+            for hole in holes:
+                image = synthetic_frame(WIDTH, HEIGHT, holes=hole)
+                camera.feed(image)
+
+                # the statistics engine on its own
+                latencies, allocated = measure(
+                    lambda s: model.statistics(image, model.select(s, SELECT_BITS), 0.001),
+                    [(s,) for s in SELECTS], rounds)
+                results.append(dict(case='statistics', polygons=name, holes=hole,
+                                    filter_level=0, **summarize(latencies, allocated)))
+                for strategy in STRATEGIES[1:]:
+                    if strategy == 'integral' and shape != 'rectangle':
+                        continue
+                    model.strategy = strategy
+                    latencies, allocated = measure(
+                        lambda s: model.statistics(image, model.select(s, SELECT_BITS), 0.001),
+                        [(s,) for s in SELECTS], rounds)
+                    results.append(dict(case=f'statistics_{strategy}', polygons=name, holes=hole,
+                                        filter_level=0, **summarize(latencies, allocated)))
+                model.strategy = 'auto'
+                latencies, allocated = measure(
+                    lambda s: model.robust_statistics(image, model.select(s, SELECT_BITS), 0.001),
+                    [(s,) for s in SELECTS], rounds)
+                results.append(dict(case='robust_statistics', polygons=name, holes=hole,
+                                    filter_level=0, **summarize(latencies, allocated)))
+                latencies, allocated = measure(
+                    lambda: model.roi_statistics(image, 0.001), [()] * len(SELECTS), rounds)
+                results.append(dict(case='roi_statistics', polygons=name, holes=hole,
+                                    filter_level=0, **summarize(latencies, allocated)))
+                for strategy in ('indices', 'integral') if shape == 'rectangle' else ():
+                    # indices sums atoms, integral looks the rectangles up
+                    model.strategy = strategy
+                    latencies, allocated = measure(
+                        lambda: model.roi_statistics(image, 0.001), [()] * len(SELECTS), rounds)
+                    results.append(dict(case=f'roi_statistics_{strategy}', polygons=name,
+                                        holes=hole, filter_level=0,
+                                        **summarize(latencies, allocated)))
+                if shape == 'rectangle':
+                    model.strategy = 'integral'
+                    latencies, allocated = measure(
+                        lambda s: (model.roi_statistics(image, 0.001),
+                                   model.robust_statistics(image, model.select(s, SELECT_BITS),
+                                                           0.001)),
+                        [(s,) for s in SELECTS], rounds)
+                    results.append(dict(case='integral_robust', polygons=name, holes=hole,
+                                        filter_level=0, **summarize(latencies, allocated)))
+                model.strategy = 'auto'
+                latencies, allocated = measure(
+                    lambda: model.statistics(image, model.select(SELECTS[-1], SELECT_BITS), 0.001),
+                    [()] * len(SELECTS), rounds)
+                results.append(dict(case='steady_statistics', polygons=name, holes=hole,
+                                    filter_level=0, **summarize(latencies, allocated)))
+
+                # what the client runs every loop
+                for level in filter_levels:
+                    latencies, allocated = measure(
+                        lambda s: camera.roi_data(model, s, level, SELECT_BITS),
+                        [(s,) for s in SELECTS], rounds)
+                    results.append(dict(case='roi_data', polygons=name, holes=hole,
+                                        filter_level=level, **summarize(latencies, allocated)))
+                    latencies, allocated = measure(
+                        lambda s: camera.roi_data(model, s, level, SELECT_BITS, per_roi=True),
+                        [(s,) for s in SELECTS], rounds)
+                    results.append(dict(case='roi_data_per_roi', polygons=name, holes=hole,
+                                        filter_level=level, **summarize(latencies, allocated)))
+                    latencies, allocated = measure(
+                        lambda: camera.roi_data(model, SELECTS[-1], level, SELECT_BITS),
+                        [()] * len(SELECTS), rounds)
+                    results.append(dict(case='steady_roi_data', polygons=name, holes=hole,
+                                        filter_level=level, **summarize(latencies, allocated)))
+                print(f'{name:>16} holes {hole:.0%}: done', flush=True)
+    finally:
+        camera.close()
+    return results
+
+
+def case_key(result):
+    return (result['case'], result['polygons'], result['holes'], result['filter_level'])
+
+
+def report(results, baseline=None):
+    """print a table, with the speedup against 'baseline' results if given"""
+    old = {case_key(r): r for r in baseline or []}
+    print(f'{"case":<25}{"polygons":<18}{"holes":>6}{"filter":>7}{"ops/s":>10}'
+          f'{"p50 ms":>9}{"p99 ms":>9}{"alloc kB":>10}' + ('  speedup' if old else ''))
+    for r in results:
+        line = (f'{r["case"]:<25}{r["polygons"]:<18}{r["holes"]:>6.0%}{r["filter_level"]:>7}'
+                f'{r["ops_per_sec"]:>10.0f}{r["p50_ms"]:>9.3f}{r["p99_ms"]:>9.3f}'
+                f'{r["alloc_bytes_per_call"] / 1024:>10.1f}')
+        previous = old.get(case_key(r))
+        if previous:
+            line += f'  {r["ops_per_sec"] / previous["ops_per_sec"]:>6.2f}x'
+        print(line)
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                                ).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='roi statistics benchmark')
+    parser.add_argument('--output', default='roistats.json', help='result file')
+    parser.add_argument('--rounds', type=int, default=1,
+                        help='sweeps over the 256 roi_select values per case')
+    parser.add_argument('--quick', action='store_true',
+                        help='five polygon sets, two hole fractions, filter levels 0 and 2')
+    parser.add_argument('--compare', help='earlier result file to compare with')
+    args = parser.parse_args()
+
+    if args.quick:
+        filter_levels, names, holes = QUICK
+        results = run(filter_levels, [p for p in POLYGONS if p[0] in names], holes, args.rounds)
+    else:
+        results = run(FILTER_LEVELS, POLYGONS, HOLES, args.rounds)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+    report(results, baseline)
+
+    with open(args.output, 'w') as file:
+        json.dump({'metadata': metadata(), 'results': results}, file, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+title:   RealSenseOPC simulated camera
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Synthetic depth frames and a Camera that runs without a device. Frames are
+turned into real pyrealsense2 depth frames by a software device, so the
+client's own Camera.roi_data (spatial filters included) is what gets timed.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pyrealsense2 as rs
+
+# the client is not a package, import its modules like main.py does
+CLIENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'client', 'app')
+if CLIENT_PATH not in sys.path:
+    sys.path.insert(0, CLIENT_PATH)
+
+from camera import Camera  # noqa: E402
+
+# CONSTANTS
+WIDTH = 848
+HEIGHT = 480
+DEPTH_UNITS = 0.001  # meters per depth unit, same as a D400
+HOLE_BLOCK = 8  # holes are made of HOLE_BLOCK x HOLE_BLOCK pixel blocks
+SENSOR_TEMPERATURE = 35.0  # degrees celcius, reported by OfflineOptions
+FEED_HISTORY = 1024  # frames whose feed time is kept by FrameFeeder
+
+
+def synthetic_frame(width=WIDTH, height=HEIGHT, holes=0.0, seed=0, depth_units=DEPTH_UNITS):
+    """z16 depth image of a slightly tilted plane 1.5 - 2.25 m away with
+    sensor like noise and a fraction of invalid (0) pixels
+
+    :param holes: fraction of invalid pixels (0 - 1), defaults to 0.0
+    :type holes: float, optional
+    :param seed: random seed, defaults to 0
+    :type seed: int, optional
+    :return: depth image
+    :rtype: numpy.ndarray
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    meters = 1.5 + 0.5 * x / width + 0.25 * y / height
+    meters += rng.normal(0, 0.004, (height, width))
+    image = np.rint(meters / depth_units).astype(np.uint16)
+    if holes > 0:
+        blocks = rng.random((-(-height // HOLE_BLOCK), -(-width // HOLE_BLOCK))) < holes
+        blocks = np.repeat(np.repeat(blocks, HOLE_BLOCK, axis=0), HOLE_BLOCK, axis=1)
+        image[blocks[:height, :width]] = 0
+    return image
+
+
+def polygon_set(size, overlap=0.0, count=8, shape='hexagon', width=WIDTH, height=HEIGHT):
+    """'count' polygons on a grid of 4 columns, or of about sqrt(count)
+    columns for more than 16 polygons
+
+    :param size: polygon width and height in pixels
+    :type size: int
+    :param overlap: fraction of a polygon covered by its neighbour (0 - 1),
+    defaults to 0.0
+    :type overlap: float, optional
+    :param shape: 'hexagon' or 'rectangle', defaults to 'hexagon'
+    :type shape: string, optional
+    :return: polygons, lists of closed (x, y) tuples
+    :rtype: list
+    """
+    columns = min(count, max(4, int(count ** 0.5)))
+    rows = -(-count // columns)
+    spacing = max(size * (1 - overlap), 1)
+    gap = max(size * 0.25, 4) if overlap <= 0 else 0
+    step = spacing + gap
+    left = width / 2 - step * (columns - 1) / 2
+    top = height / 2 - step * (rows - 1) / 2
+    half = size / 2
+
+    polygons = []
+    for i in range(count):
+        cx = left + step * (i % columns)
+        cy = top + step * (i // columns)
+        if shape == 'rectangle':
+            corners = [(-1, -1), (1, -1), (1, 1), (-1, 1)]
+        else:
+            corners = [(-1, 0), (-0.5, -1), (0.5, -1), (1, 0), (0.5, 1), (-0.5, 1)]
+        polygon = [(int(min(max(cx + dx * half, 0), width - 1)),
+                    int(min(max(cy + dy * half, 0), height - 1))) for dx, dy in corners]
+        polygon.append(polygon[0])
+        polygons.append(polygon)
+    return polygons
+
+
+class SoftwareDepth():
+    def __init__(self, width=WIDTH, height=HEIGHT, depth_units=DEPTH_UNITS, framerate=30):
+        """make pyrealsense2 depth frames from numpy images"""
+        self._width = width
+        self._height = height
+        self._device = rs.software_device()
+        self._sensor = self._device.add_sensor('Depth')
+
+        intrinsics = rs.intrinsics()
+        intrinsics.width = width
+        intrinsics.height = height
+        intrinsics.ppx = width / 2
+        intrinsics.ppy = height / 2
+        intrinsics.fx = intrinsics.fy = width / 2
+        intrinsics.model = rs.distortion.brown_conrady
+        intrinsics.coeffs = [0] * 5
+
+        stream = rs.video_stream()
+        stream.type = rs.stream.depth
+        stream.index = 0
+        stream.uid = 0
+        stream.width = width
+        stream.height = height
+        stream.fps = framerate
+        stream.bpp = 2
+        stream.fmt = rs.format.z16
+        stream.intrinsics = intrinsics
+        self._profile = self._sensor.add_video_stream(stream).as_video_stream_profile()
+        self._sensor.add_read_only_option(rs.option.depth_units, depth_units)
+
+        self._queue = rs.frame_queue(2, keep_frames=True)
+        self._sensor.open(self._profile)
+        self._sensor.start(self._queue)
+        self._frame_number = 0
+
+    def frame(self, image, frame_number=None, timestamp=None):
+        """depth frame with a copy of 'image'
+
+        :param image: z16 depth image
+        :type image: numpy.ndarray
+        :param frame_number: defaults to counting up
+        :type frame_number: int, optional
+        :param timestamp: milliseconds, defaults to now
+        :type timestamp: float, optional
+        :return: depth frame
+        :rtype: pyrealsense2.depth_frame
+        """
+        self._frame_number = self._frame_number + 1 if frame_number is None else frame_number
+        frame = rs.software_video_frame()
+        frame.pixels = np.ascontiguousarray(image, dtype=np.uint16)
+        frame.stride = self._width * 2
+        frame.bpp = 2
+        frame.timestamp = time.time() * 1000 if timestamp is None else timestamp
+        frame.domain = rs.timestamp_domain.system_time
+        frame.frame_number = self._frame_number
+        frame.profile = self._profile
+        self._sensor.on_video_frame(frame)
+        return self._queue.wait_for_frame(1000).as_depth_frame()
+
+    def close(self):
+        self._sensor.stop()
+        self._sensor.close()
+
+
+class OfflineOptions():
+    """CameraOptions stand in of an OfflineCamera. Settings are accepted
+    and ignored, temperatures are constant"""
+
+    def update_settings(self, settings):
+        return []
+
+    def get_camera_value(self, name):
+        return SENSOR_TEMPERATURE
+
+
+class OfflineCamera(Camera):
+    def __init__(self, width=WIDTH, height=HEIGHT, metric=True, depth_units=DEPTH_UNITS,
+                 serial=None):
+        """Camera without a device. Frames are handed over with feed(),
+        everything else (roi_data, spatial filters) is the client's Camera
+
+        :param serial: reported serial number, defaults to None
+        :type serial: string, optional
+        """
+        # Camera.__init__ opens the device, only the frame handling is set up
+        self._init_frame_state(serial, depth_units, width, height, metric)
+        self.options = OfflineOptions()
+        self._source = SoftwareDepth(width, height, depth_units)
+
+    def feed(self, image, frame_number=None, timestamp=None):
+        """make 'image' the newest frame
+
+        :return: depth frame
+        :rtype: pyrealsense2.depth_frame
+        """
+        depth_frame = self._source.frame(image, frame_number, timestamp)
+        self._Camera__depth_frame = depth_frame
+        self._Camera__frame_number = depth_frame.frame_number
+        return depth_frame
+
+    def set_roi(self, roi):
+        """there is no auto exposure without a sensor"""
+        pass
+
+    def start(self):
+        self._Camera__connected = True
+
+    def stop(self):
+        self._Camera__connected = False
+
+    def close(self):
+        self.stop()
+        self._source.close()
+
+
+class FrameFeeder():
+    def __init__(self, camera, images, framerate=30):
+        """feed 'images' to an OfflineCamera in a loop at 'framerate' on a
+        background thread, like a camera's frame callback. The time every
+        frame was fed is kept so latencies can be measured from it
+
+        :param camera: camera to feed
+        :type camera: OfflineCamera
+        :param images: z16 depth images, fed in order
+        :type images: list
+        :param framerate: frames per second, defaults to 30
+        :type framerate: int, optional
+        """
+        self._camera = camera
+        self._images = images
+        self._period = 1 / max(framerate, 1)
+        self._lock = threading.Lock()
+        self._fed = {}
+        self._count = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """start feeding"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='feeder', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """stop feeding and wait for the feeder to finish"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def fed_at(self, frame_number):
+        """time.perf_counter() when 'frame_number' was fed, None if unknown"""
+        with self._lock:
+            return self._fed.get(frame_number)
+
+    @property
+    def count(self):
+        """number of frames fed"""
+        return self._count
+
+    def _run(self):
+        deadline = time.perf_counter()
+        while self._running:
+            image = self._images[self._count % len(self._images)]
+            now = time.perf_counter()
+            frame_number = self._camera.feed(image).frame_number
+            with self._lock:
+                self._fed[frame_number] = now
+                if len(self._fed) > FEED_HISTORY:
+                    del self._fed[next(iter(self._fed))]
+            self._count += 1
+
+            # keep the rate without drifting, skip ahead after a stall
+            deadline = max(deadline + self._period, time.perf_counter() - self._period)
+            time.sleep(max(deadline - time.perf_counter(), 0))
@@ -0,0 +1,84 @@
+"""
+title:   RealSenseOPC client loop soak test
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Runs the end to end loop (see loop.py) for a long time while the client's
+MemoryTracker samples the process. After a warm up the resident set size
+(and with --trace the memory traced by tracemalloc) must stay flat: a
+growth rate above --max-growth fails the run with exit code 1.
+
+    python soak.py                              1 hour, synthetic frames
+    python soak.py --replay capture.npz --duration 28800 --trace
+
+The resident set size includes memory held by librealsense, so frames that
+are never released show up here even though tracemalloc can not see them.
+"""
+
+import argparse
+import json
+import logging as log
+import sys
+
+import loop
+from roistats import metadata
+from simcamera import polygon_set
+
+from memtrack import MEGABYTE, MemoryTracker  # noqa: E402, the client path is set by simcamera
+
+
+def main():
+    parser = argparse.ArgumentParser(description='client loop soak test')
+    loop.add_arguments(parser, duration=3600)
+    parser.add_argument('--interval', type=float, default=10,
+                        help='seconds between memory samples')
+    parser.add_argument('--warmup', type=float, default=300,
+                        help='seconds before memory growth is measured')
+    parser.add_argument('--max-growth', type=float, default=1.0,
+                        help='MB/h of memory growth that fails the run')
+    parser.add_argument('--trace', action='store_true',
+                        help='trace allocations with tracemalloc (slower)')
+    args = parser.parse_args()
+    images = loop.load_images(parser, args)
+
+    # memory samples are logged as they are taken
+    log.basicConfig(level=log.INFO, format='%(asctime)s %(message)s')
+    log.getLogger('opcua').setLevel(log.WARNING)
+
+    # the first sample (and tracemalloc baseline) is taken once the server,
+    #   camera and client are set up
+    tracker = MemoryTracker(args.interval, args.trace)
+    results = loop.run(images, args.duration, args.select_rate, args.framerate,
+                       args.filter_level, args.sleep_time, polygon_set(loop.ROI_SIZE),
+                       started=tracker.start)
+    growth = {field: tracker.growth(args.warmup, field) for field in ('rss', 'traced')}
+    memory_report = tracker.report()
+    samples = [sample._asdict() for sample in tracker.samples]
+    tracker.stop()
+
+    loop.report(results)
+    print(memory_report)
+    failed = []
+    for field, rate in growth.items():
+        if rate is None:
+            continue
+        print(f'{field} growth after {args.warmup:.0f} s warm up: {rate / MEGABYTE:+.3f} MB/h')
+        if rate / MEGABYTE > args.max_growth:
+            failed.append(field)
+    if growth['rss'] is None:
+        print('Not enough samples after the warm up to measure growth, run longer')
+    print(f'FAILED: {", ".join(failed)} grew faster than {args.max_growth} MB/h' if failed
+          else 'PASSED')
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'metadata': metadata(), 'arguments': vars(args), 'results': results,
+                       'memory': {'growth_bytes_per_hour': growth, 'samples': samples}},
+                      file, indent=2)
+        print(f'Results written to {args.output}')
+    sys.exit(1 if failed or results['failure'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,123 +1,459 @@
-"""opcua server to simulate siemens 1500 plc"""
+"""opcua server to simulate siemens 1500 plc
 
+Hosts the tags of one or more simulated stations and drives their roi select
+and picture trigger tags from a load script, like the plc stepping through
+parts. Every value the clients read and write is timestamped in memory,
+nothing is printed per write. Latency and throughput of every station are
+printed every --report-period seconds and written to --output on exit.
 
+    python server-data.py                                   one station, like the plc
+    python server-data.py --stations 4 --config nodes.ini   four stations
+    python server-data.py --script load.json --duration 60 --output stats.json
+
+Station 1 keeps the node ids of the plc program (ns=2;i=2 - ns=2;i=8), the
+other stations follow. --config writes the matching '[nodes]' or
+'[nodes:station_n]' sections for the client configuration file, replace
+'station_n' with the camera serial numbers.
+
+Load script (json). Every key is optional, 'stations' overrides the script of
+a station by its number:
+
+    {
+        "select": {"pattern": "step", "period": 0.2, "values": [1, 2, 4, 8]},
+        "trigger": {"period": 15.0, "length": 0.05},
+        "stations": {"2": {"select": {"pattern": "random", "period": 0.05, "offset": 0.1}}}
+    }
+
+select patterns are 'step' (cycle through 'values', defaults to 0 - 255),
+'random' (one of 'values') and 'hold' (the first value). A period of 0 never
+changes the tag. 'offset' delays a station's pattern by that many seconds.
+
+Measured per station:
+
+    select -> read      select changed until a client read the new value
+    select -> result    select changed until the first roi_depth write after
+                        that read, i.e. the result of the new selection
+    result interval     time between roi_depth writes
+    alive gap           longest time without the client setting alive
+"""
+
+import argparse
+import json
+import random
 import sys
+import threading
 import time
+from array import array
 
 import opcua
 from opcua import ua
+from opcua.server.user_manager import UserManager
 
 
 LOOP_TIME = 50 # amount of time to wait every loop in milliseconds
+ENDPOINT = "opc.tcp://localhost:4840"
+REPORT_PERIOD = 5  # seconds between statistics lines, 0 to disable
+TAGS = (  # (name, type)
+    ("roi_depth_node", ua.VariantType.Float),
+    ("roi_invalid_node", ua.VariantType.Float),
+    ("roi_deviation_node", ua.VariantType.Float),
+    ("roi_select_node", ua.VariantType.UInt16),
+    ("status_node", ua.VariantType.Float),
+    ("picture_trigger_node", ua.VariantType.Boolean),
+    ("alive_node", ua.VariantType.Boolean),
+)
+DEFAULT_SCRIPT = {
+    "select": {"pattern": "step", "period": 0.2, "values": list(range(256))},
+    "trigger": {"period": 15.0, "length": LOOP_TIME / 1000},
+}
 
 
-def main():
-    try:
-        server = opcua.Server()
-        server.set_server_name("Realsense OCP")
-        server.set_endpoint("opc.tcp://localhost:4840")
+def start_server(endpoint=ENDPOINT, stations=1):
+    """start the server and add one writable tag per entry in TAGS for
+    every station
 
-        # Register the OPC-UA namespace
-        idx = server.register_namespace("http://localhost:4840")
-        # Start the OPC UA server (no tags at this point)
-        server.start()
+    :param endpoint: server endpoint, defaults to ENDPOINT
+    :type endpoint: string
+    :param stations: number of stations, defaults to 1
+    :type stations: int, optional
+    :return: server and one tag name -> node dictionary per station
+    :rtype: tuple
+    """
+    server = opcua.Server()
+    server.set_server_name("Realsense OCP")
+    server.set_endpoint(endpoint)
 
-        # Populate address space
-        objects = server.get_objects_node()
-        opc_db = objects.add_object(idx, "OPC Testing")
+    # Register the OPC-UA namespace
+    idx = server.register_namespace("http://localhost:4840")
+    # Start the OPC UA server (no tags at this point)
+    server.start()
+
+    # Populate address space. station 1 first so it keeps the plc's node ids
+    objects = server.get_objects_node()
+    station_nodes = []
+    for number in range(1, stations + 1):
+        name = "OPC Testing" if number == 1 else f"OPC Testing {number}"
+        opc_db = objects.add_object(idx, name)
 
         # Add tags
+        nodes = {}
+        for tag, variant_type in TAGS:
+            node = opc_db.add_variable(idx, tag, 0, variant_type)
+            node.set_writable(writable=True)
+            nodes[tag] = node
+        station_nodes.append(nodes)
+    return server, station_nodes
+
+
+def station_script(script, number):
+    """load script of station 'number', the station's overrides applied to
+    the defaults and the shared script"""
+    merged = {}
+    overrides = script.get("stations", {}).get(str(number), {})
+    for key in ("select", "trigger"):
+        merged[key] = {**DEFAULT_SCRIPT[key], **script.get(key, {}), **overrides.get(key, {})}
+    return merged
+
+
+def summarize(values):
+    """count, mean, p50, p99 and max of 'values' (seconds) in milliseconds"""
+    if len(values) == 0:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": ordered[int(0.50 * (len(ordered) - 1))] * 1000,
+        "p99_ms": ordered[int(0.99 * (len(ordered) - 1))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+class Station():
+    def __init__(self, number, nodes, script, start):
+        """tags, load pattern and measurements of one simulated station
+
+        :param number: station number, counting from 1
+        :type number: int
+        :param nodes: tag name -> node
+        :type nodes: dict
+        :param script: station load script, see station_script()
+        :type script: dict
+        :param start: time.perf_counter() the load starts at
+        :type start: float
+        """
+        self.number = number
+        self.name = f"station_{number}"
+        self.nodes = nodes
+        self._select_script = script["select"]
+        self._trigger_script = script["trigger"]
+        self._random = random.Random(number)
+        self._select_index = -1
+        self._select = 0
+        self._next_select = start + self._select_script.get("offset", 0)
+        self._trigger_start = start + self._trigger_script.get("offset", 0)
+        self._trigger = None
+
+        # written by the server thread, see Recorder
+        self.select_changed = None  # time of the select change not read yet
+        self.select_read = None  # time of the first read of the new select
+        self.select_changes = 0
+        self.alive = False
+        self.last_alive = start
+        self.alive_gap = 0.0
+        self.status = None
+        self.reads = 0
+        self.writes = 0
+        self.requests = 0
+        self.results = array("d")  # roi_depth arrival times
+        self.select_to_read = array("d")
+        self.select_to_result = array("d")
+
+    def nodeids(self):
+        """node id -> tag name"""
+        return {node.nodeid: tag for tag, node in self.nodes.items()}
+
+    def step(self, now, lock):
+        """update the select, trigger and alive tags. Called every loop
+
+        :param lock: recorder lock, held while the select tag changes so a
+        read can not slip in between the change and its time
+        :type lock: threading.Lock
+        """
+        period = self._select_script["period"]
+        if period > 0 and now >= self._next_select:
+            self._next_select = max(self._next_select + period, now)
+            select = self._select_value()
+            if select != self._select:
+                self._select = select
+                with lock:
+                    self.nodes["roi_select_node"].set_value(
+                        ua.DataValue(ua.Variant(select, ua.VariantType.UInt16)))
+                    self.select_changed = time.perf_counter()
+                    self.select_read = None
+                    self.select_changes += 1
+
+        trigger = self._trigger_value(now)
+        if trigger != self._trigger:
+            self._trigger = trigger
+            self.nodes["picture_trigger_node"].set_value(
+                ua.DataValue(ua.Variant(trigger, ua.VariantType.Boolean)))
+
+        # check if client is alive
+        if self.alive:
+            self.alive = False
+            self.nodes["alive_node"].set_value(
+                ua.DataValue(ua.Variant(False, ua.VariantType.Boolean)))
+        self.alive_gap = max(self.alive_gap, now - self.last_alive)
+
+    def _select_value(self):
+        values = self._select_script["values"]
+        pattern = self._select_script["pattern"]
+        if pattern == "random":
+            return self._random.choice(values)
+        if pattern == "hold":
+            return values[0]
+        self._select_index = (self._select_index + 1) % len(values)
+        return values[self._select_index]
+
+    def _trigger_value(self, now):
+        period = self._trigger_script["period"]
+        if period <= 0 or now < self._trigger_start:
+            return False
+        return (now - self._trigger_start) % period < self._trigger_script["length"]
+
+    def statistics(self, elapsed):
+        """latency and throughput since the start
+
+        :param elapsed: seconds since the start
+        :type elapsed: float
+        :return: statistics
+        :rtype: dict
+        """
+        results = self.results
+        intervals = [b - a for a, b in zip(results, results[1:])]
+        return {
+            "station": self.name,
+            "select_changes": self.select_changes,
+            "reads": self.reads,
+            "writes": self.writes,
+            "requests": self.requests,
+            "results_per_sec": len(results) / elapsed if elapsed > 0 else 0.0,
+            "writes_per_sec": self.writes / elapsed if elapsed > 0 else 0.0,
+            "select_to_read": summarize(self.select_to_read),
+            "select_to_result": summarize(self.select_to_result),
+            "result_interval": summarize(intervals),
+            "alive_gap_ms": self.alive_gap * 1000,
+            "status": self.status,
+        }
+
 
-        # depth
-        roi_depth_node = opc_db.add_variable(
-            idx, "roi_depth_node", 0, ua.VariantType.Float)
-        roi_depth_node.set_writable(writable=True)
-
-        # invalid
-        roi_invalid_node = opc_db.add_variable(
-            idx, "roi_invalid_node", 0, ua.VariantType.Float)
-        roi_invalid_node.set_writable(writable=True)
-
-        # invalid
-        roi_deviation_node = opc_db.add_variable(
-            idx, "roi_deviation_node", 0, ua.VariantType.Float)
-        roi_deviation_node.set_writable(writable=True)
-
-        # roi select
-        roi_select_node = opc_db.add_variable(
-            idx, "roi_select_node", 0, ua.VariantType.UInt16)
-        roi_select_node.set_writable(writable=True)
-
-        # status
-        status_node = opc_db.add_variable(
-            idx, "status_node", 0, ua.VariantType.Float)
-        status_node.set_writable(writable=True)
-
-        # trigger
-        picture_trigger_node = opc_db.add_variable(
-            idx, "picture_trigger_node", 0, ua.VariantType.Boolean)
-        picture_trigger_node.set_writable(writable=True)
-
-        # alive
-        alive_node = opc_db.add_variable(
-            idx, "alive_node", 0, ua.VariantType.Boolean)
-        alive_node.set_writable(writable=True)
-
-        dead_count = 0
-        picture_count = 0
-        select_count = 1
-        select = 0
-        
-        while True:
-            # get tag values
-            depth = roi_depth_node.get_value()
-            invalid = roi_invalid_node.get_value()
-            deviation = roi_deviation_node.get_value()
-            status = status_node.get_value()
-            picture = picture_trigger_node.get_value()
-            alive = alive_node.get_value()
-            roi_select = roi_select_node.get_value()
-
-            picture_count += 1
-            select_count += 1
-
-            if picture_count == 1:
-                dv = True
-                dv = ua.DataValue(ua.Variant(dv, ua.VariantType.Boolean))
-                picture_trigger_node.set_value(dv)
-            elif picture_count != 1:
-                dv = False
-                dv = ua.DataValue(ua.Variant(dv, ua.VariantType.Boolean))
-                picture_trigger_node.set_value(dv)
-            if picture_count > 15000 // LOOP_TIME:
-                picture_count = 0
-
-            # check if client is alive
-            if alive:
-                dead_count = 0
-                dv = alive = False
-                dv = ua.DataValue(ua.Variant(dv, ua.VariantType.Boolean))
-                alive_node.set_value(dv)
-            else:
-                dead_count += 1
-
-            # print tag values
-            print(f'Depth: {depth:.2f} | Invalid: {invalid:.2f} | Deviation: {deviation:.2f} | '
-                f'Status: {status:.2f} | Picture: {picture:.2f} | '
-                f'Alive: {alive:.2f} | ROI select: {roi_select} | '
-                f'Dead: {dead_count} | PicCount: {picture_count}')
-            
-            if select_count > 200 // LOOP_TIME:
-                select_count = 0
-                select += 1
-                if select > 255:
-                    select = 0
-                dv = ua.DataValue(ua.Variant(select, ua.VariantType.Int16))
-                roi_select_node.set_value(dv)
-            
-            time.sleep(LOOP_TIME / 1000)
+class Recorder():
+    def __init__(self, server, stations):
+        """timestamp every client read and write of the stations' tags.
+        Wraps the server's attribute service, the callbacks run on the
+        server thread and only append to arrays
+
+        :param server: started server
+        :type server: opcua.Server
+        :param stations: simulated stations
+        :type stations: list
+        """
+        self.lock = threading.Lock()
+        self._tags = {}
+        for station in stations:
+            for nodeid, tag in station.nodeids().items():
+                self._tags[nodeid] = (station, tag)
+
+        service = server.iserver.attribute_service
+        read, write = service.read, service.write
+
+        def recorded_read(params):
+            self.on_read(params.NodesToRead)
+            return read(params)
+
+        def recorded_write(params, user=UserManager.User.Admin):
+            # our own writes are made as admin, clients are anonymous
+            if user != UserManager.User.Admin:
+                self.on_write(params.NodesToWrite)
+            return write(params, user)
+
+        service.read = recorded_read
+        service.write = recorded_write
+
+    def on_read(self, reads):
+        now = time.perf_counter()
+        with self.lock:
+            for read in reads:
+                station, tag = self._tags.get(read.NodeId, (None, None))
+                if tag != "roi_select_node":
+                    continue
+                station.reads += 1
+                if station.select_changed is not None and station.select_read is None:
+                    station.select_read = now
+                    station.select_to_read.append(now - station.select_changed)
+
+    def on_write(self, writes):
+        now = time.perf_counter()
+        with self.lock:
+            requested = set()
+            for write in writes:
+                station, tag = self._tags.get(write.NodeId, (None, None))
+                if station is None:
+                    continue
+                station.writes += 1
+                requested.add(station)
+                if tag == "roi_depth_node":
+                    station.results.append(now)
+                    if station.select_read is not None:
+                        station.select_to_result.append(now - station.select_changed)
+                        station.select_changed = station.select_read = None
+                elif tag == "alive_node" and write.Value.Value.Value:
+                    station.alive = True
+                    station.last_alive = now
+                elif tag == "status_node":
+                    station.status = write.Value.Value.Value
+            for station in requested:
+                station.requests += 1
+
+
+class LoadGenerator():
+    def __init__(self, server, station_nodes, script=None, loop_time=LOOP_TIME):
+        """drive the stations' select and trigger tags on a background thread
+        and record the clients' reads and writes
+
+        :param server: started server
+        :type server: opcua.Server
+        :param station_nodes: tag name -> node dictionary per station
+        :type station_nodes: list
+        :param script: load script, defaults to DEFAULT_SCRIPT
+        :type script: dict, optional
+        :param loop_time: milliseconds between updates, defaults to LOOP_TIME
+        :type loop_time: int, optional
+        """
+        self._period = loop_time / 1000
+        self.start_time = time.perf_counter()
+        self.stations = [Station(number, nodes, station_script(script or {}, number),
+                                 self.start_time)
+                         for number, nodes in enumerate(station_nodes, start=1)]
+        self._recorder = Recorder(server, self.stations)
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """start driving the tags"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="load", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """stop driving the tags and wait for the thread to finish"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def statistics(self):
+        """statistics of every station since the start
+
+        :return: one dictionary per station
+        :rtype: list
+        """
+        elapsed = time.perf_counter() - self.start_time
+        return [station.statistics(elapsed) for station in self.stations]
+
+    def _run(self):
+        deadline = time.perf_counter()
+        while self._running:
+            now = time.perf_counter()
+            for station in self.stations:
+                station.step(now, self._recorder.lock)
+            deadline = max(deadline + self._period, time.perf_counter())
+            time.sleep(max(deadline - time.perf_counter(), 0))
+
+
+def write_client_config(path, endpoint, station_nodes):
+    """write the '[server]' and '[nodes]' sections of a client configuration
+    file for the stations"""
+    lines = ["[server]", f"ip = {endpoint}", ""]
+    if len(station_nodes) > 1:
+        serials = ", ".join(f"station_{n}" for n in range(1, len(station_nodes) + 1))
+        lines += ["[cameras]", f"serials = {serials}", ""]
+    for number, nodes in enumerate(station_nodes, start=1):
+        lines.append("[nodes]" if len(station_nodes) == 1 else f"[nodes:station_{number}]")
+        lines += [f"{tag} = {node.nodeid.to_string()}" for tag, node in nodes.items()]
+        lines.append("")
+    with open(path, "w") as file:
+        file.write("\n".join(lines))
+
+
+def print_statistics(generator, first, elapsed):
+    """one line per station: results per second of the last 'elapsed'
+    seconds, select -> result latency since the start
+
+    :param first: number of results of every station at the last report
+    :type first: list
+    """
+    for station, count in zip(generator.stations, first):
+        rate = (len(station.results) - count) / elapsed
+        latency = summarize(station.select_to_result)
+        latency = (f'{latency["p50_ms"]:.1f}/{latency["p99_ms"]:.1f} ms'
+                   if latency["count"] else "-")
+        print(f'{station.name}: {rate:.1f} results/s | '
+              f'select->result p50/p99 {latency} | '
+              f'alive gap {station.alive_gap * 1000:.0f} ms | status {station.status}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="opc ua server simulating the plc")
+    parser.add_argument("--endpoint", default=ENDPOINT, help="server endpoint")
+    parser.add_argument("--stations", type=int, default=1, help="number of stations")
+    parser.add_argument("--script", help="json load script")
+    parser.add_argument("--loop-time", type=int, default=LOOP_TIME,
+                        help="milliseconds between tag updates")
+    parser.add_argument("--duration", type=float, default=0,
+                        help="seconds to run, 0 runs until interrupted")
+    parser.add_argument("--report-period", type=float, default=REPORT_PERIOD,
+                        help="seconds between statistics lines, 0 to disable")
+    parser.add_argument("--output", help="write the final statistics to this json file")
+    parser.add_argument("--config", help="write the client's node sections to this file")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script) as file:
+            script = json.load(file)
+
+    server, station_nodes = start_server(args.endpoint, max(args.stations, 1))
+    if args.config:
+        write_client_config(args.config, args.endpoint, station_nodes)
+        print(f"Client configuration written to {args.config}")
+
+    generator = LoadGenerator(server, station_nodes, script, args.loop_time)
+    generator.start()
+    try:
+        last_report = time.perf_counter()
+        first = [0] * len(generator.stations)
+        while args.duration <= 0 or time.perf_counter() - generator.start_time < args.duration:
+            time.sleep(0.1)
+            now = time.perf_counter()
+            if args.report_period > 0 and now - last_report >= args.report_period:
+                print_statistics(generator, first, now - last_report)
+                first = [len(station.results) for station in generator.stations]
+                last_report = now
     except KeyboardInterrupt:
-        sys.exit()
+        pass
+    finally:
+        generator.stop()
+        statistics = generator.statistics()
+        print(json.dumps(statistics, indent=2))
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(statistics, file, indent=2)
+        server.stop()
+    sys.exit()
 
 if __name__ == "__main__":
     main()
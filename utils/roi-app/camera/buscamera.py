@@ -0,0 +1,269 @@
+"""
+title:   RealSenseOPC frame bus camera
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+"""
+
+import cv2
+import numpy as np
+import numpy.ma as ma
+
+from camera.colorizer import DepthColorizer
+from camera.framebus import FrameSubscriber
+
+# CONSTANTS
+METER_TO_FEET = 3.28084
+
+
+class BusCamera():
+    def __init__(self, name, width=848, height=480):
+        """create a camera that reads depth frames from another program's
+        frame bus instead of opening the device. Has the same interface as
+        Camera so the rest of the utility does not need to care. Camera
+        settings belong to the publishing program and can not be changed
+
+        :param name: frame bus name
+        :type name: string
+        :param width: expected depth frame width, defaults to 848
+        :type width: int, optional
+        :param height: expected depth frame height, defaults to 480
+        :type height: int, optional
+        :raises FileNotFoundError: if nothing is publishing to 'name'
+        :raises RuntimeError: if the frame bus resolution does not match
+        """
+        self.__subscriber = FrameSubscriber(name)
+        if self.__subscriber.width != width or self.__subscriber.height != height:
+            self.__subscriber.close()
+            raise RuntimeError(f'Frame bus "{name}" is {self.__subscriber.width}x'
+                               f'{self.__subscriber.height}, expected {width}x{height}')
+
+        self.options = BusCameraOptions()
+
+        # camera attributes
+        self.__name = name
+        self.__height = height
+        self.__width = width
+        self.__depth_scale = self.__subscriber.depth_scale
+        self.__conversion = self.__depth_scale
+        self.__colorizer = DepthColorizer(self.__depth_scale)
+        self.__metric = True
+        self.__sequence = 0
+        self.__depth_frame = None
+        self.__raw_depth_frame = None
+        self.__connected = False
+        self.__frame_number = 0
+        self.__scale = 1
+        self.__filter_level = 0
+
+    def __poll(self):
+        """pick up the newest frame from the frame bus if there is one"""
+        if not self.__connected:
+            return
+        if self.__subscriber.sequence == self.__sequence:
+            return
+        latest = self.__subscriber.latest()
+        if latest is None:
+            return
+        self.__sequence, self.__frame_number, _, image = latest
+        self.__raw_depth_frame = image
+        if self.__scale > 1:
+            self.__depth_frame = image[::self.__scale, ::self.__scale]
+        else:
+            self.__depth_frame = image
+
+    def start(self):
+        """start reading frames"""
+        self.__connected = True
+
+    def stop(self):
+        """stop reading frames"""
+        self.__connected = False
+
+    def reset(self):
+        """the device belongs to the publishing program, nothing to reset"""
+        self.stop()
+
+    def restart(self):
+        """call stop() and start()"""
+        self.stop()
+        self.start()
+
+    def to_color(self, depth_image, out=None, rotated=False):
+        """colorize a depth image with the lookup table colorizer
+
+        :param depth_image: depth image
+        :type depth_image: numpy.ndarray
+        :param out: rgb buffer to reuse, defaults to a new image
+        :type out: numpy.ndarray, optional
+        :param rotated: rotate the image 180 degrees, defaults to False
+        :type rotated: bool, optional
+        :return: rgb image
+        :rtype: numpy.ndarray
+        """
+        return self.__colorizer.colorize(depth_image, out=out, rotated=rotated)
+
+    def ROI_datan(self, polygons):
+        """compute average of n-number of polygons. Spatial filtering needs
+        the device's processing blocks and is not applied to frame bus
+        frames"""
+
+        depth_image = self.depth_frame_raw
+        if depth_image is None or len(polygons) < 1:
+            return float(0), float(100), float(0)
+
+        mask = np.zeros((self.__height, self.__width), dtype=np.uint8)
+        for polygon in polygons:
+            cv2.fillPoly(mask, pts=[np.asanyarray(polygon)], color=1)
+        mask = np.invert(mask.astype('bool'))
+
+        depth_mask = ma.array(depth_image, mask=mask, fill_value=0)
+        total = ma.count(depth_mask)
+        if total > 0:
+            invalid = (depth_mask == 0).sum()
+            invalid = (invalid / total) * 100
+            deviation = depth_mask.std() * self.__conversion
+        else:
+            deviation = float(0)
+            invalid = float(100)
+
+        depth_mask = ma.masked_equal(depth_mask, 0)
+        ROI_depth = depth_mask.mean() * self.__conversion
+
+        if isinstance(ROI_depth, np.float64):
+            return ROI_depth.item(), invalid, deviation
+        return float(0), invalid, deviation
+
+    @property
+    def name(self):
+        """frame bus name"""
+        return self.__name
+
+    @property
+    def asic_temperature(self):
+        """not available from the frame bus"""
+        return None
+
+    @property
+    def projector_temperature(self):
+        """not available from the frame bus"""
+        return None
+
+    @property
+    def colorizer(self):
+        """depth colorizer getter"""
+        return self.__colorizer
+
+    @property
+    def connected(self):
+        """true while reading frames"""
+        return self.__connected
+
+    @property
+    def frame_number(self) -> int:
+        """frame number of the newest frame"""
+        self.__poll()
+        return self.__frame_number
+
+    @frame_number.setter
+    def frame_number(self, num: int):
+        """set frame_number"""
+        self.__frame_number = num
+
+    @property
+    def depth_frame(self):
+        """newest (scaled) depth image, a read only view into shared memory
+
+        :return: depth image
+        :rtype: numpy.ndarray or None
+        """
+        self.__poll()
+        return self.__depth_frame
+
+    @property
+    def depth_frame_raw(self):
+        """newest unscaled depth image
+
+        :return: depth image
+        :rtype: numpy.ndarray or None
+        """
+        self.__poll()
+        return self.__raw_depth_frame
+
+    @property
+    def filtered_depth_image(self):
+        """newest unscaled depth image. Spatial filtering needs the device's
+        processing blocks and is not applied to frame bus frames
+
+        :return: depth image
+        :rtype: numpy.ndarray or None
+        """
+        return self.depth_frame_raw
+
+    @property
+    def conversion(self):
+        """depth units to meters (metric) or feet"""
+        return self.__conversion
+
+    @property
+    def scale(self):
+        """camera scale getter"""
+        return self.__scale
+
+    @scale.setter
+    def scale(self, scale):
+        """camera scale setter"""
+        self.__scale = scale
+        self.__sequence = 0
+
+    @property
+    def height(self):
+        """camera height getter"""
+        return self.__height
+
+    @property
+    def width(self):
+        """camera width getter"""
+        return self.__width
+
+    @property
+    def metric(self):
+        """metric getter"""
+        return self.__metric
+
+    @metric.setter
+    def metric(self, metric):
+        """metric setter"""
+        self.__metric = metric
+        if self.__metric:
+            self.__conversion = self.__depth_scale
+        else:
+            self.__conversion = self.__depth_scale * METER_TO_FEET
+
+    @property
+    def filter_level(self):
+        """filter level getter"""
+        return self.__filter_level
+
+    @filter_level.setter
+    def filter_level(self, filter_level):
+        """filter level setter"""
+        lvl = int(min(max(filter_level, 0), 5))
+        self.__filter_level = lvl
+
+
+class BusCameraOptions():
+    """camera options of a frame bus camera. The publishing program owns the
+    device so every option is unavailable"""
+
+    def get_camera_options(self):
+        return []
+
+    def get_option_range(self, option):
+        return (False, None)
+
+    def set_rs_option_direct(self, option_name, set_value):
+        return False
+
+    def get_camera_value(self, option):
+        return None
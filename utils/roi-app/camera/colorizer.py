@@ -0,0 +1,118 @@
+"""
+title:   RealSenseOPC depth colorizer
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Every possible 16 bit depth value is colorized once, when the range or the
+colormap is set. Colorizing a frame is then a single table lookup into an
+output buffer the caller can reuse, so it costs the same for every frame and scales with
+the number of pixels only (a decimated frame is 4 times cheaper at scale 2).
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from camera.settings import COLORMAPS
+
+# CONSTANTS
+DEPTH_VALUES = 2 ** 16
+
+
+class DepthColorizer():
+    def __init__(self, depth_scale=0.001, near=0.0, far=4.0, colormap='jet'):
+        """colorize z16 depth images with a lookup table. Near is the top
+        of the colormap (red for jet), invalid (0) depth is black
+
+        :param depth_scale: meters per depth unit, defaults to 0.001
+        :type depth_scale: float, optional
+        :param near: depth in meters with the first color, defaults to 0.0
+        :type near: float, optional
+        :param far: depth in meters with the last color, defaults to 4.0
+        :type far: float, optional
+        :param colormap: one of COLORMAPS, defaults to 'jet'
+        :type colormap: string, optional
+        """
+        self._depth_scale = depth_scale
+        self._near = near
+        self._far = far
+        self._colormap = colormap
+        self._lut = None
+        self._cost = 0.0
+        self.set_range(near, far, colormap)
+
+    def set_range(self, near, far, colormap=None):
+        """rebuild the lookup table
+
+        :param near: depth in meters with the first color
+        :type near: float
+        :param far: depth in meters with the last color
+        :type far: float
+        :param colormap: one of COLORMAPS, defaults to the current colormap
+        :type colormap: string, optional
+        :raises ValueError: if the range is empty or the colormap is unknown
+        """
+        colormap = self._colormap if colormap is None else colormap.strip().lower()
+        if far <= near:
+            raise ValueError(f'Far ({far}) must be greater than near ({near})')
+        if colormap not in COLORMAPS or not hasattr(cv2, f'COLORMAP_{colormap.upper()}'):
+            raise ValueError(f'"{colormap}" is not a colormap')
+
+        meters = np.arange(DEPTH_VALUES, dtype=np.float32) * self._depth_scale
+        position = np.clip((meters - near) / (far - near), 0, 1)
+        gray = np.rint(255 - position * 255).astype(np.uint8).reshape(-1, 1)
+        bgr = cv2.applyColorMap(gray, getattr(cv2, f'COLORMAP_{colormap.upper()}'))
+        lut = np.ascontiguousarray(bgr.reshape(-1, 3)[:, ::-1])
+        lut[0] = 0
+
+        self._lut = lut
+        self._near = near
+        self._far = far
+        self._colormap = colormap
+
+    def colorize(self, depth_image, out=None, rotated=False):
+        """colorize a depth image
+
+        :param depth_image: z16 depth image, any size
+        :type depth_image: numpy.ndarray
+        :param out: rgb buffer to write into, a new one is made if it is
+        missing or does not fit, defaults to None
+        :type out: numpy.ndarray, optional
+        :param rotated: rotate the result 180 degrees, defaults to False
+        :type rotated: bool, optional
+        :return: rgb image
+        :rtype: numpy.ndarray
+        """
+        start = time.perf_counter()
+        depth_image = np.asarray(depth_image, dtype=np.uint16)
+        if rotated:
+            depth_image = depth_image[::-1, ::-1]
+        shape = depth_image.shape + (3,)
+        if out is None or out.shape != shape or out.dtype != np.uint8:
+            out = np.empty(shape, np.uint8)
+        # every uint16 is in the table, 'clip' lets take write straight into out
+        np.take(self._lut, depth_image, axis=0, out=out, mode='clip')
+        self._cost = 0.9 * self._cost + 0.1 * (time.perf_counter() - start)
+        return out
+
+    @property
+    def cost(self):
+        """average colorize time in seconds"""
+        return self._cost
+
+    @property
+    def near(self):
+        """near depth getter"""
+        return self._near
+
+    @property
+    def far(self):
+        """far depth getter"""
+        return self._far
+
+    @property
+    def colormap(self):
+        """colormap getter"""
+        return self._colormap
@@ -8,6 +8,8 @@ license: TODO
 import configparser
 import logging as log
 
+from camera.settings import Settings
+
 MSG_ERROR_SHUTDOWN = "~~~~~~~~~~~~~~~Error Exited Application~~~~~~~~~~~~~~\n"
 
 
@@ -36,6 +38,7 @@ class Config():
             raise FileNotFoundError(f'"{self._path}" was not found')
 
         self._data = self._config_file.__dict__['_sections'].copy()
+        self._settings = None
 
         if required_data is not None:
             self._required_data = required_data
@@ -98,6 +101,17 @@ class Config():
         except configparser.NoSectionError:
             self._config_file.add_section(args[0])
             self._config_file.set(*args, **kwargs)
+        self._data = self._config_file.__dict__['_sections'].copy()
+        self._settings = None
+
+    @property
+    def settings(self):
+        """typed configuration. Converted on first use and again after set().
+        Invalid values fall back to their defaults and are listed in
+        'settings.problems'"""
+        if self._settings is None:
+            self._settings = Settings(self._data, strict=False)
+        return self._settings
         
     @property
     def path(self):
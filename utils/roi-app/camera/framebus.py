@@ -0,0 +1,239 @@
+"""
+title:   RealSenseOPC shared memory frame bus
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Only one process may open the camera. The process that owns the camera
+publishes every depth frame into a ring of shared memory slots and any number
+of other processes (the ROI Utility for example) attach as readers. Readers
+get numpy views straight into shared memory, nothing is copied or serialized.
+
+Memory layout:
+    bus header  | magic, version, width, height, number of slots, depth scale,
+                  latest sequence
+    slot header | sequence, frame number, timestamp  (one per slot)
+    slot data   | height * width uint16 depth values (one per slot)
+
+The writer clears a slot's sequence before writing into it and sets it after,
+so readers can tell if the slot they are looking at was overwritten.
+"""
+
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# CONSTANTS
+MAGIC = b'RSFB'
+VERSION = 1
+DEFAULT_SLOTS = 4
+BUS_HEADER = struct.Struct('<4sIIIIdQ')
+SLOT_HEADER = struct.Struct('<QQd')
+ALIGNMENT = 64
+
+
+def _layout(width: int, height: int, slots: int) -> tuple:
+    """offsets of the slot headers and slot data and total size in bytes"""
+    headers = BUS_HEADER.size
+    data = headers + SLOT_HEADER.size * slots
+    data += -data % ALIGNMENT
+    frame_size = width * height * np.dtype(np.uint16).itemsize
+    return headers, data, frame_size, data + frame_size * slots
+
+
+class FramePublisher():
+    def __init__(self, name: str, width=848, height=480, slots=DEFAULT_SLOTS, depth_scale=0.001):
+        """create (or take over) the shared memory block 'name' and publish
+        depth frames into it
+
+        :param name: shared memory name, readers attach with the same name
+        :type name: string
+        :param width: depth frame width, defaults to 848
+        :type width: int, optional
+        :param height: depth frame height, defaults to 480
+        :type height: int, optional
+        :param slots: number of frames kept in the ring, defaults to 4
+        :type slots: int, optional
+        :param depth_scale: meters per depth unit, defaults to 0.001
+        :type depth_scale: float, optional
+        """
+        self._name = name
+        self._width = width
+        self._height = height
+        self._slots = slots
+        self._depth_scale = depth_scale
+        self._headers, self._data, self._frame_size, size = _layout(width, height, slots)
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # left behind by a publisher that did not exit cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        self._buffer = self._shm.buf
+        self._frames = []
+        for slot in range(slots):
+            self._frames.append(np.ndarray((height, width), dtype=np.uint16, buffer=self._buffer,
+                                           offset=self._data + slot * self._frame_size))
+        self._sequence = 0
+        for slot in range(slots):
+            SLOT_HEADER.pack_into(self._buffer, self._headers + slot * SLOT_HEADER.size, 0, 0, 0.0)
+        BUS_HEADER.pack_into(self._buffer, 0, MAGIC, VERSION, width, height, slots, depth_scale, 0)
+
+    def publish(self, image: np.ndarray, frame_number: int, timestamp=None) -> int:
+        """copy a depth image into the next slot of the ring
+
+        :param image: depth image (height x width, uint16)
+        :type image: numpy.ndarray
+        :param frame_number: camera frame number
+        :type frame_number: int
+        :param timestamp: frame timestamp in milliseconds, defaults to now
+        :type timestamp: float, optional
+        :return: sequence number of the published frame
+        :rtype: int
+        """
+        if timestamp is None:
+            timestamp = time.time() * 1000
+        sequence = self._sequence + 1
+        slot = sequence % self._slots
+        header = self._headers + slot * SLOT_HEADER.size
+
+        SLOT_HEADER.pack_into(self._buffer, header, 0, 0, 0.0)
+        np.copyto(self._frames[slot], image, casting='unsafe')
+        SLOT_HEADER.pack_into(self._buffer, header, sequence, frame_number, timestamp)
+        BUS_HEADER.pack_into(self._buffer, 0, MAGIC, VERSION, self._width,
+                             self._height, self._slots, self._depth_scale, sequence)
+        self._sequence = sequence
+        return sequence
+
+    def close(self) -> None:
+        """release and remove the shared memory block"""
+        self._frames = []
+        self._buffer = None
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
+
+    @property
+    def name(self) -> str:
+        """shared memory name"""
+        return self._name
+
+    @property
+    def sequence(self) -> int:
+        """sequence number of the last published frame"""
+        return self._sequence
+
+
+class FrameSubscriber():
+    def __init__(self, name: str):
+        """attach to the frame bus 'name' as a reader
+
+        :param name: shared memory name used by the publisher
+        :type name: string
+        :raises FileNotFoundError: if there is no publisher
+        :raises RuntimeError: if the shared memory block is not a frame bus
+        """
+        self._name = name
+        self._shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            # the publisher owns the block. stop the resource tracker from
+            # removing it when this process exits
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+            except Exception:
+                pass
+        self._buffer = self._shm.buf
+
+        magic, version, width, height, slots, depth_scale, _ = BUS_HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self._shm.close()
+            raise RuntimeError(f'"{name}" is not a version {VERSION} frame bus')
+
+        self._width = width
+        self._height = height
+        self._slots = slots
+        self._depth_scale = depth_scale
+        self._headers, self._data, self._frame_size, _ = _layout(width, height, slots)
+        self._frames = []
+        for slot in range(slots):
+            self._frames.append(np.ndarray((height, width), dtype=np.uint16, buffer=self._buffer,
+                                           offset=self._data + slot * self._frame_size))
+
+    @property
+    def sequence(self) -> int:
+        """sequence number of the newest frame on the bus, 0 if none"""
+        return BUS_HEADER.unpack_from(self._buffer, 0)[6]
+
+    def latest(self):
+        """newest frame on the bus. The image is a read only view into shared
+        memory, it stays valid until the publisher wraps around the ring. Use
+        still_valid() after reading it if that matters
+
+        :return: (sequence, frame number, timestamp, image) or None
+        :rtype: tuple or None
+        """
+        sequence = self.sequence
+        if sequence < 1:
+            return None
+        slot = sequence % self._slots
+        slot_sequence, frame_number, timestamp = SLOT_HEADER.unpack_from(
+            self._buffer, self._headers + slot * SLOT_HEADER.size)
+        if slot_sequence != sequence:
+            # overwritten between reading the bus header and the slot header
+            return None
+        image = self._frames[slot].view()
+        image.flags.writeable = False
+        return sequence, frame_number, timestamp, image
+
+    def still_valid(self, sequence: int) -> bool:
+        """check if the frame with 'sequence' has not been overwritten
+
+        :param sequence: sequence number returned by latest()
+        :type sequence: int
+        :return: validity
+        :rtype: bool
+        """
+        slot = sequence % self._slots
+        header = self._headers + slot * SLOT_HEADER.size
+        return SLOT_HEADER.unpack_from(self._buffer, header)[0] == sequence
+
+    def close(self) -> None:
+        """detach from the frame bus"""
+        self._frames = []
+        self._buffer = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
+
+    @property
+    def name(self) -> str:
+        """shared memory name"""
+        return self._name
+
+    @property
+    def width(self) -> int:
+        """frame width"""
+        return self._width
+
+    @property
+    def height(self) -> int:
+        """frame height"""
+        return self._height
+
+    @property
+    def depth_scale(self) -> float:
+        """meters per depth unit"""
+        return self._depth_scale
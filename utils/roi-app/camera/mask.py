@@ -1,9 +1,9 @@
-from hashlib import new
 import cv2
 import numpy as np
 
 # constants
 METER_TO_FEET = 3.28084
+OVERLAY_MARGIN = 3  # pixels around the coordinates covered by the line width
 
 
 class MaskWidget():
@@ -25,6 +25,9 @@ class MaskWidget():
         self.__box_color = (0, 0, 0)
         self.__text_color = (255, 255, 255)
 
+        self.__overlay = None
+        self.__overlay_key = None
+
     def get_coordinates(self, event):
         """mouse movement callback. Stores mouse coordinates if they are within
         the image
@@ -63,137 +66,120 @@ class MaskWidget():
         self.__right_clicked = False
         self.__left_clicked = False
 
-    def draw(self, image):
-        """draws opencv lines between stored coordinates"""
+    def draw(self, image, rotated=False):
+        """draws the mask overlay onto an rgb image
 
-        coordinates = self.__coordinates
-        scaled_coordinates = []
+        :param image: rgb image, scaled by camera scale
+        :type image: numpy.ndarray
+        :param rotated: image is rotated 180 degrees, defaults to False
+        :type rotated: bool, optional
+        """
+        overlay, (y, x) = self.overlay(image.shape[:2], self._root.camera.scale, rotated)
+        height, width = overlay.shape[:2]
+        np.copyto(image[y:y + height, x:x + width], overlay[..., :3],
+                  where=overlay[..., 3:] > 0)
+
+    def overlay(self, shape, scale, rotated=False):
+        """lines, bounding box and label as an rgba image cropped to what is
+        drawn. The overlay is only redrawn when the coordinates, active state,
+        scale or rotation change
+
+        :param shape: image height, width
+        :type shape: tuple
+        :param scale: camera scale
+        :type scale: int
+        :param rotated: draw for an image rotated 180 degrees, the label stays
+        upright, defaults to False
+        :type rotated: bool, optional
+        :return: rgba crop, alpha is 0 where nothing is drawn, and the
+        (y, x) of its top left corner in the image
+        :rtype: tuple
+        """
+        key = (tuple(tuple(c) for c in self.__coordinates), self.ready,
+               self.__active, scale, rotated, tuple(shape))
+        if key != self.__overlay_key:
+            self.__overlay = self.draw_overlay(shape, scale, rotated)
+            self.__overlay_key = key
+        return self.__overlay
+
+    def draw_overlay(self, shape, scale, rotated=False):
+        """draw a new overlay without touching the cached one, same
+        arguments as overlay()"""
+        height, width = shape[0], shape[1]
 
-        for coordinate in coordinates:
-            scaled_coordinates.append(
-                (coordinate[0] // self._root.camera.scale,
-                 coordinate[1] // self._root.camera.scale)
-            )
+        scaled_coordinates = []
+        for coordinate in self.__coordinates:
+            x = int(coordinate[0]) // scale
+            y = int(coordinate[1]) // scale
+            if rotated:
+                x, y = width - 1 - x, height - 1 - y
+            scaled_coordinates.append((x, y))
 
         n = len(scaled_coordinates)
-        if n > 0:
-            if self.__active:
-                self.__line_color = (255, 255, 255)
-                self.__box_color = (0, 0, 0)
-                self.__text_color = (255, 255, 255)
-            else:
-                self.__line_color = (150, 150, 150)
-                self.__box_color = (30, 30, 30)
-                self.__text_color = (150, 150, 150)
-            
-            if n == 1:
-                cv2.line(image, scaled_coordinates[0], scaled_coordinates[0],
-                         color=self.__line_color, thickness=3)
-            elif n == 2:
-                cv2.line(image, scaled_coordinates[0], scaled_coordinates[1],
-                         color=self.__line_color, thickness=2)
-            elif n > 2:
-                for i in range(n - 1):
-                    cv2.line(image, scaled_coordinates[i], scaled_coordinates[i+1],
-                             color=self.__line_color, thickness=2)
-            if self.ready:
-                if isinstance(self._id, int) and n >= 2:
-                    x1, y1, x2, y2 = self.box(scaled_coordinates)
-                    cv2.line(image, (x1, y1), (x2, y1), color=self.__box_color, thickness=1)
-                    cv2.line(image, (x2, y1), (x2, y2), color=self.__box_color, thickness=1)
-                    cv2.line(image, (x2, y2), (x1, y2), color=self.__box_color, thickness=1)
-                    cv2.line(image, (x1, y2), (x1, y1), color=self.__box_color, thickness=1)
-
-                    text_pos = (((x2-x1)//2)+x1-7, ((y2-y1)//2)+y1+10)
-
-                    cv2.putText(img=image,
-                                text=str(self._id),
-                                org=text_pos,
-                                fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-                                fontScale=1,
-                                color=self.__text_color,
-                                thickness=2,
-                                lineType=cv2.LINE_AA)    
-    def _draw(self, image):
-        """draws opencv lines between stored coordinates"""
-        if isinstance(image, np.ndarray):
-            new_image = image.copy()
-            new_image = image
-            coordinates = self.__coordinates
-            scaled_coordinates = []
-
-            for coordinate in coordinates:
-                scaled_coordinates.append(
-                    (coordinate[0] // self._root.camera.scale,
-                     coordinate[1] // self._root.camera.scale)
-                )
-
-            n = len(scaled_coordinates)
-            if n > 0:
-                if self.__active:
-                    self.__line_color = (255, 255, 255)
-                    self.__box_color = (0, 0, 0)
-                    self.__text_color = (255, 255, 255)
-                else:
-                    self.__line_color = (150, 150, 150)
-                    self.__box_color = (30, 30, 30)
-                    self.__text_color = (150, 150, 150)
-
-                if n == 1:
-                    cv2.line(new_image, scaled_coordinates[0], scaled_coordinates[0],
-                             color=self.__line_color, thickness=3)
-                elif n == 2:
-                    cv2.line(new_image, scaled_coordinates[0], scaled_coordinates[1],
-                             color=self.__line_color, thickness=2)
-                elif n > 2:
-                    for i in range(n - 1):
-                        cv2.line(new_image, scaled_coordinates[i], scaled_coordinates[i+1],
-                                 color=self.__line_color, thickness=2)
-                if self.ready:
-                    if isinstance(self._id, int) and n >= 2:
-                        x1, y1, x2, y2 = self.box(scaled_coordinates)
-                        cv2.line(new_image, (x1, y1), (x2, y1), color=self.__box_color, thickness=1)
-                        cv2.line(new_image, (x2, y1), (x2, y2), color=self.__box_color, thickness=1)
-                        cv2.line(new_image, (x2, y2), (x1, y2), color=self.__box_color, thickness=1)
-                        cv2.line(new_image, (x1, y2), (x1, y1), color=self.__box_color, thickness=1)
-
-                        x_offset = -7
-                        y_offset = 10
-                        text_pos = (((x2-x1)//2)+x1, ((y2-y1)//2)+y1)
-
-                        text_image = np.zeros((new_image.shape[0], new_image.shape[1], 3), np.uint8)
-
-                        if self._root.video.rotated:
-                            text_pos = (new_image.shape[1] - text_pos[0], new_image.shape[0] - text_pos[1])
-
-                        text_pos = (text_pos[0] + x_offset, text_pos[1] + y_offset)
-
-                        cv2.putText(img=text_image,
-                                    text=str(self._id),
-                                    org=text_pos,
-                                    fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-                                    fontScale=1,
-                                    color=self.__text_color,
-                                    thickness=2,
-                                    lineType=cv2.LINE_AA)
-
-                        if self._root.video.rotated:
-                            text_image = np.rot90(text_image, 2).copy()
-
-                        new_image = new_image + text_image
-                        new_image = np.add(new_image, text_image)
-
-                        # print(type(img), type(blank_image))
-
-                        # if self._root.video.rotated:
-                        #     new_image = np.rot90(new_image, 2).copy()
-                        # # print(image.shape, blank_image.shape, new_image.shape)
-
-                        # cv2.imshow('text', blank_image)
-                        # cv2.imshow('image', img)
-                        cv2.imshow('new', new_image)
-                        cv2.waitKey(1)
-            return new_image           
+        label = self.ready and isinstance(self._id, int) and n >= 2
+        if n < 1:
+            return np.zeros((0, 0, 4), np.uint8), (0, 0)
+
+        # crop to the coordinates and the label, everything is drawn shifted
+        #   by the crop's top left corner
+        x1, y1, x2, y2 = self.box(scaled_coordinates)
+        if label:
+            text_pos = self.label_position((x1, y1, x2, y2))
+            (text_width, text_height), baseline = cv2.getTextSize(
+                str(self._id), cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
+            x1, x2 = min(x1, text_pos[0]), max(x2, text_pos[0] + text_width)
+            y1, y2 = min(y1, text_pos[1] - text_height), max(y2, text_pos[1] + baseline)
+        left = min(max(x1 - OVERLAY_MARGIN, 0), width)
+        top = min(max(y1 - OVERLAY_MARGIN, 0), height)
+        right = min(max(x2 + OVERLAY_MARGIN + 1, left), width)
+        bottom = min(max(y2 + OVERLAY_MARGIN + 1, top), height)
+        overlay = np.zeros((bottom - top, right - left, 4), np.uint8)
+        scaled_coordinates = [(x - left, y - top) for x, y in scaled_coordinates]
+
+        if self.__active:
+            self.__line_color = (255, 255, 255)
+            self.__box_color = (0, 0, 0)
+            self.__text_color = (255, 255, 255)
+        else:
+            self.__line_color = (150, 150, 150)
+            self.__box_color = (30, 30, 30)
+            self.__text_color = (150, 150, 150)
+        line_color = (*self.__line_color, 255)
+        box_color = (*self.__box_color, 255)
+        text_color = (*self.__text_color, 255)
+
+        if n == 1:
+            cv2.line(overlay, scaled_coordinates[0], scaled_coordinates[0],
+                     color=line_color, thickness=3)
+        else:
+            for i in range(n - 1):
+                cv2.line(overlay, scaled_coordinates[i], scaled_coordinates[i+1],
+                         color=line_color, thickness=2)
+        if label:
+            x1, y1, x2, y2 = self.box(scaled_coordinates)
+            cv2.rectangle(overlay, (x1, y1), (x2, y2), color=box_color, thickness=1)
+
+            cv2.putText(img=overlay,
+                        text=str(self._id),
+                        org=self.label_position((x1, y1, x2, y2)),
+                        fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+                        fontScale=1,
+                        color=text_color,
+                        thickness=2,
+                        lineType=cv2.LINE_AA)
+        return overlay, (top, left)
+
+    @staticmethod
+    def label_position(box):
+        """bottom left corner of the id label, centered in 'box'
+
+        :param box: x1, y1, x2, y2
+        :type box: tuple
+        :return: x, y
+        :rtype: tuple
+        """
+        x1, y1, x2, y2 = box
+        return ((x2-x1)//2)+x1-7, ((y2-y1)//2)+y1+10
 
     def coordinate_valid(self, x, y):
         """checks if a coordiante lies within an image
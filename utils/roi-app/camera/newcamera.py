@@ -8,6 +8,7 @@ license: TODO
 import difflib as diff
 import logging as log
 import time
+from collections import namedtuple
 from typing import Callable
 
 import cv2
@@ -15,9 +16,14 @@ import numpy as np
 import numpy.ma as ma
 import pyrealsense2 as rs
 
+from camera.colorizer import DepthColorizer
+
 # CONSTANTS
 METER_TO_FEET = 3.28084
 
+# cached description of a single pyrealsense2.option
+OptionInfo = namedtuple('OptionInfo', ['option', 'min', 'max', 'step', 'default', 'read_only'])
+
 
 class Camera():
     def __init__(self, width=848, height=480, framerate=0, config=None, callback=None):
@@ -54,8 +60,9 @@ class Camera():
         self.__pipeline.stop()
         self.__depth_sensor = self.__profile.get_device().first_depth_sensor()
         self.__depth_scale = self.__depth_sensor.get_depth_scale()
-        self.__colorizer = rs.colorizer()
+        self.__colorizer = DepthColorizer(self.__depth_scale)
         self.__decimate = rs.decimation_filter()
+        self.__spatial = rs.spatial_filter()
 
         # options object used to alter camera settings. all settings must
         #   be configured before calling the start() method of the camera
@@ -150,10 +157,20 @@ class Camera():
         sensor = self.__profile.get_device().first_roi_sensor()
         sensor.set_region_of_interest(roi)
 
-    def to_color(self, depth_frame):
-        color_image = self.__colorizer.colorize(depth_frame)
-        color_image = np.asanyarray(color_image.get_data())
-        return color_image
+    def to_color(self, depth_frame, out=None, rotated=False):
+        """colorize a depth frame with the camera's lookup table colorizer
+
+        :param depth_frame: depth frame
+        :type depth_frame: pyrealsense2.depth_frame
+        :param out: rgb buffer to reuse, defaults to a new image
+        :type out: numpy.ndarray, optional
+        :param rotated: rotate the image 180 degrees, defaults to False
+        :type rotated: bool, optional
+        :return: rgb image
+        :rtype: numpy.ndarray
+        """
+        depth_image = np.asanyarray(depth_frame.get_data())
+        return self.__colorizer.colorize(depth_image, out=out, rotated=rotated)
 
     def __disconnect_callback(self, info):
         """called when a camera device is connected or disconnected. Updates  
@@ -292,10 +309,10 @@ class Camera():
 
     @property
     def colorizer(self):
-        """return pyrealsense2.colorizer object
+        """return depth colorizer
 
         :return: colorizer object
-        :rtype: pyrealsense2.colorizer
+        :rtype: DepthColorizer
         """
         return self.__colorizer
 
@@ -346,6 +363,28 @@ class Camera():
         """
         return self.__raw_depth_frame
 
+    @property
+    def filtered_depth_image(self):
+        """full resolution depth image with the spatial filter of
+        filter_level applied. The filter is kept between calls, so only call
+        this from one thread
+
+        :return: depth image
+        :rtype: numpy.ndarray or None
+        """
+        depth_frame = self.__raw_depth_frame
+        if not isinstance(depth_frame, rs.depth_frame):
+            return None
+        if self.__filter_level > 0:
+            self.__spatial.set_option(rs.option.holes_fill, self.__filter_level)
+            depth_frame = self.__spatial.process(depth_frame)
+        return np.asanyarray(depth_frame.get_data())
+
+    @property
+    def conversion(self):
+        """depth units to meters (metric) or feet"""
+        return self.__conversion
+
     @property
     def scale(self):
         """camera scale getter"""
@@ -404,6 +443,7 @@ class CameraOptions():
         self.__profile = profile
         self.__config = config
         self.__camera_options = []
+        self.__option_index = {}
         self.__user_options = []
         self.__depth_sensor = self.__profile.get_device().first_depth_sensor()
 
@@ -416,15 +456,24 @@ class CameraOptions():
         self.set_options()
 
     def get_camera_options(self):
-        """queries depth sensor and retrieves all supported options
+        """queries depth sensor once and builds an index of every supported
+        option (pyrealsense2.option, range, default and read only flag). All
+        later option lookups use the index and do not reach the device
 
         :return: camera options
         :rtype: list
         """
-        cam_ops = self.__depth_sensor.get_supported_options()
-        for op in cam_ops:
-            op = op.name
-            self.__camera_options.append(op)
+        self.__option_index = {}
+        for op in self.__depth_sensor.get_supported_options():
+            try:
+                value_range = self.__depth_sensor.get_option_range(op)
+                read_only = self.__depth_sensor.is_option_read_only(op)
+                info = OptionInfo(op, value_range.min, value_range.max,
+                                  value_range.step, value_range.default, read_only)
+            except RuntimeError:
+                info = OptionInfo(op, None, None, None, None, True)
+            self.__option_index[op.name] = info
+        self.__camera_options = list(self.__option_index)
         return self.__camera_options
 
     def get_user_options(self):
@@ -434,18 +483,24 @@ class CameraOptions():
         which do not pertain to 'pyrealsense2.option'
         :rtype: list
         """
+        self.__user_options = []
         usr_ops = self.__config['camera']
-        cam_ops = self.__camera_options
         for op in usr_ops:
-            if op in cam_ops:
+            if op in self.__option_index:
                 self.__user_options.append(op)
         return self.__user_options
 
     def get_option_range(self, option):
-        if hasattr(rs.option, option):
-            option = getattr(rs.option, option)
-            option_range = self.__depth_sensor.get_option_range(option)
-            return (True, option_range)
+        """looks up the cached range of 'option'
+
+        :param option: pyrealsense2.option name
+        :type option: string
+        :return: (True, OptionInfo) if the option is supported, else (False, None)
+        :rtype: tuple
+        """
+        info = self.__option_index.get(option)
+        if info is not None and info.min is not None:
+            return (True, info)
         return (False, None)
 
     def set_options(self):
@@ -455,14 +510,12 @@ class CameraOptions():
         method attempts to find the closest match. The closest match will NOT be
         attempted to set, but logged as a warning
         """
-        cam_ops = self.__camera_options
         usr_ops = self.__user_options
 
         for set_op in usr_ops:
-            if cam_ops.count(set_op) > 0:
-                if hasattr(rs.option, set_op):
-                    if self.writable(set_op):
-                        self.set_rs_option(set_op)
+            if set_op in self.__option_index:
+                if self.writable(set_op):
+                    self.set_rs_option(set_op)
             else:
                 closest_match = diff.get_close_matches(
                     set_op, self.__camera_options, cutoff=0.7)
@@ -480,8 +533,7 @@ class CameraOptions():
         :return: true if option is writable, false if readonly
         :rtype: bool
         """
-        option = getattr(rs.option, option)
-        return not self.__depth_sensor.is_option_read_only(option)
+        return not self.__option_index[option].read_only
 
     def constrain_option_value(self, option, set_val):
         """constrains a desired set value to the pyrealsense2.option range while
@@ -494,9 +546,8 @@ class CameraOptions():
         :return: constrained set point
         :rtype: float
         """
-        value_range = self.__depth_sensor.get_option_range(
-            getattr(rs.option, option))
-        min_val, max_val, step_size = value_range.min, value_range.max, value_range.step
+        info = self.__option_index[option]
+        min_val, max_val, step_size = info.min, info.max, info.step
         # round set value to nearest step size
         set_val = step_size * round(set_val / step_size)
         # constrain set_value within value_range
@@ -516,7 +567,7 @@ class CameraOptions():
         :param set_option: pyrealsense2.option name
         :type set_option: string
         """
-        rs_option = getattr(rs.option, set_option)
+        rs_option = self.__option_index[set_option].option
         raw_val = float(self.__config['camera'][set_option])
         set_val = self.constrain_option_value(set_option, raw_val)
         self.__depth_sensor.set_option(rs_option, set_val)
@@ -532,14 +583,13 @@ class CameraOptions():
         :rtype: bool
         """
 
-        if self.__camera_options.count(option_name) > 0:
-            if hasattr(rs.option, option_name):
-                if self.writable(option_name):
-                    rs_option = getattr(rs.option, option_name)
-                    set_value = self.constrain_option_value(
-                        option_name, set_value)
-                    self.__depth_sensor.set_option(rs_option, set_value)
-                    return True
+        if option_name in self.__option_index:
+            if self.writable(option_name):
+                rs_option = self.__option_index[option_name].option
+                set_value = self.constrain_option_value(
+                    option_name, set_value)
+                self.__depth_sensor.set_option(rs_option, set_value)
+                return True
         return False
 
     def get_camera_value(self, option):
@@ -550,11 +600,9 @@ class CameraOptions():
         :return: returns setting value or None 
         :rtype: float or None
         """
-        if self.__camera_options.count(option) > 0:
-            if hasattr(rs.option, option):
-                rs_option = getattr(rs.option, option)
-                value = self.__depth_sensor.get_option(rs_option)
-                return value
+        info = self.__option_index.get(option)
+        if info is not None:
+            return self.__depth_sensor.get_option(info.option)
         return None
 
     def log_settings(self):
@@ -0,0 +1,169 @@
+"""
+title:   RealSenseOPC ROI Utility render worker
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Colorizing the depth frame, drawing the region of interest overlay and
+rotating the image happen on a worker thread. The Tk thread hands over what
+to draw with set_scene() and only shows the newest finished image, so it
+stays responsive while polygons are edited at the full frame rate.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+class RenderWorker():
+    def __init__(self, camera, framerate=30):
+        """render camera frames on a background thread
+
+        :param camera: Camera or BusCamera
+        :type camera: Camera
+        :param framerate: camera framerate, sets how often the camera is
+        checked for a new frame, defaults to 30
+        :type framerate: int, optional
+        """
+        self._camera = camera
+        self._period = 1 / max(framerate, 1) / 4
+        self._lock = threading.Lock()
+        self._masks = ()
+        self._rotated = False
+        self._paused = False
+        self._changed = False
+        self._frame_number = 0
+        self._image = None
+        self._sequence = 0
+        self._error = None
+        self._overlays = ()
+        self._layer = None
+        # the Tk thread may still be showing the last image, so images are
+        #   rendered into a few buffers in turn
+        self._buffers = [None] * 3
+        self._buffer = 0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """start rendering"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='render', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """stop rendering and wait for the worker to finish"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def set_scene(self, masks, rotated, paused=False):
+        """what to draw on the next frames. Call from the Tk thread, the
+        worker never touches Tk variables
+
+        :param masks: mask widgets to draw
+        :type masks: list
+        :param rotated: rotate the image 180 degrees
+        :type rotated: bool
+        :param paused: stop rendering new frames, defaults to False
+        :type paused: bool, optional
+        """
+        masks = tuple(masks)
+        with self._lock:
+            if masks != self._masks or rotated != self._rotated:
+                self._changed = True
+            self._masks = masks
+            self._rotated = rotated
+            self._paused = paused
+
+    def latest(self):
+        """newest rendered image
+
+        :return: sequence number (increases with every image) and rgb image
+        :rtype: tuple
+        """
+        with self._lock:
+            return self._sequence, self._image
+
+    @property
+    def error(self):
+        """last rendering error, None if the last frame rendered"""
+        return self._error
+
+    def _run(self):
+        while self._running:
+            with self._lock:
+                masks = self._masks
+                rotated = self._rotated
+                paused = self._paused
+                changed = self._changed
+                self._changed = False
+
+            depth_frame = self._camera.depth_frame
+            frame_number = self._camera.frame_number
+            if (paused or depth_frame is None
+                    or (frame_number == self._frame_number and not changed)):
+                time.sleep(self._period)
+                continue
+            self._frame_number = frame_number
+
+            try:
+                image = self.render(depth_frame, masks, rotated)
+                self._error = None
+            except Exception as e:
+                # camera stopped or restarted while rendering
+                self._error = e
+                time.sleep(self._period)
+                continue
+
+            with self._lock:
+                self._image = image
+                self._sequence += 1
+
+    def render(self, depth_frame, masks, rotated):
+        """colorize 'depth_frame', rotate and draw 'masks'
+
+        :return: contiguous rgb image
+        :rtype: numpy.ndarray
+        """
+        self._buffer = (self._buffer + 1) % len(self._buffers)
+        color_image = self._camera.to_color(depth_frame, out=self._buffers[self._buffer],
+                                            rotated=rotated)
+        self._buffers[self._buffer] = color_image
+
+        if masks:
+            colors, where, (y, x) = self._overlay_layer(masks, color_image.shape[:2], rotated)
+            height, width = colors.shape[:2]
+            np.copyto(color_image[y:y + height, x:x + width], colors, where=where)
+        return color_image
+
+    def _overlay_layer(self, masks, shape, rotated):
+        """every mask overlay pasted into one layer that covers all of them.
+        Rebuilt only when one of the mask overlays was redrawn
+
+        :return: rgb colors, where to copy them and the (y, x) of the layer's
+        top left corner in the image
+        :rtype: tuple
+        """
+        scale = self._camera.scale
+        overlays = tuple(mask.overlay(shape, scale, rotated) for mask in masks)
+        if (len(overlays) != len(self._overlays)
+                or any(a[0] is not b[0] for a, b in zip(overlays, self._overlays))):
+            drawn = [(overlay, y, x) for overlay, (y, x) in overlays if overlay.size > 0]
+            top = min([y for _, y, _ in drawn], default=0)
+            left = min([x for _, _, x in drawn], default=0)
+            bottom = max([y + overlay.shape[0] for overlay, y, _ in drawn], default=0)
+            right = max([x + overlay.shape[1] for overlay, _, x in drawn], default=0)
+            layer = np.zeros((bottom - top, right - left, 4), np.uint8)
+            for overlay, y, x in drawn:
+                y, x = y - top, x - left
+                height, width = overlay.shape[:2]
+                np.copyto(layer[y:y + height, x:x + width], overlay,
+                          where=overlay[..., 3:] > 0)
+            self._layer = (np.ascontiguousarray(layer[..., :3]), layer[..., 3:] > 0, (top, left))
+            self._overlays = overlays
+        return self._layer
@@ -0,0 +1,222 @@
+"""
+title:   RealSenseOPC ROI Utility snapshot export
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Snapshots are written by a worker thread so a slow disk never stalls the
+user interface. A snapshot '<name>' is saved as
+
+    <name>-depth.png    raw full resolution depth, 16 bit png
+    <name>-preview.jpg  colorized depth with the regions of interest
+    <name>-roi.png      regions of interest overlay (rgba)
+    <name>.json         settings, polygons and roi stats at the time
+
+and a sequence of frames as
+
+    <name>.npz          depth (frames x height x width, uint16),
+                        frame_number and time columns
+    <name>.json         settings, polygons and roi stats at the start
+
+Frames of a sequence go to a memory mapped .npy file next to the archive as
+they arrive and are compressed into the archive at the end, so a long
+sequence never has to fit in memory. Sequences can be replayed for offline
+benchmarking with load_sequence().
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+
+import cv2
+import numpy as np
+
+# CONSTANTS
+SEQUENCE_TIMEOUT = 10  # seconds without a new frame before a sequence is given up
+
+
+def depth_array(depth_frame):
+    """copy of a depth frame (pyrealsense2 frame or numpy array) as a uint16
+    array
+
+    :return: depth image, None if there is no frame
+    :rtype: numpy.ndarray
+    """
+    if depth_frame is None:
+        return None
+    if hasattr(depth_frame, 'get_data'):
+        depth_frame = np.asanyarray(depth_frame.get_data())
+    return np.array(depth_frame, dtype=np.uint16)
+
+
+def load_sequence(path):
+    """read a sequence written by SnapshotWriter.save_sequence()
+
+    :param path: .npz file
+    :type path: string
+    :return: depth images, frame numbers, times and the metadata (empty if
+    the .json sidecar is missing)
+    :rtype: tuple
+    """
+    with np.load(path) as data:
+        depth, frame_number, times = data['depth'], data['frame_number'], data['time']
+    metadata = {}
+    sidecar = os.path.splitext(path)[0] + '.json'
+    if os.path.exists(sidecar):
+        with open(sidecar) as file:
+            metadata = json.load(file)
+    return depth, frame_number, times, metadata
+
+
+class SnapshotWriter():
+    def __init__(self, report=None):
+        """write snapshots on a background thread
+
+        :param report: called with (message, error) when a snapshot is
+        done or failed, from the worker thread, defaults to None
+        :type report: callable, optional
+        """
+        self._report = report
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='snapshot', daemon=True)
+        self._thread.start()
+
+    def save(self, path, depth_image, colorizer, masks, metadata):
+        """queue a snapshot
+
+        :param path: file name without extension
+        :type path: string
+        :param depth_image: full resolution depth image, not changed afterwards
+        :type depth_image: numpy.ndarray
+        :param colorizer: colorizer for the preview
+        :type colorizer: DepthColorizer
+        :param masks: mask widgets drawn on the preview
+        :type masks: list
+        :param metadata: json serializable sidecar contents
+        :type metadata: dict
+        """
+        self._jobs.put((self._save, (path, depth_image, colorizer, masks, metadata)))
+
+    def save_sequence(self, path, camera, count, metadata):
+        """queue capturing the next 'count' frames of 'camera' into one archive
+
+        :param path: file name without extension
+        :type path: string
+        :param camera: Camera or BusCamera
+        :type camera: Camera
+        :param count: number of frames
+        :type count: int
+        :param metadata: json serializable sidecar contents
+        :type metadata: dict
+        """
+        self._jobs.put((self._save_sequence, (path, camera, count, metadata)))
+
+    def close(self):
+        """finish queued snapshots"""
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            function, args = job
+            try:
+                message = function(*args)
+            except (OSError, ValueError, RuntimeError, cv2.error) as e:
+                self._notify(f'Failed to save {args[0]}: {e}', True)
+            else:
+                self._notify(message, False)
+
+    def _notify(self, message, error):
+        if self._report is not None:
+            self._report(message, error)
+
+    def _save(self, path, depth_image, colorizer, masks, metadata):
+        height, width = depth_image.shape[:2]
+        overlay = np.zeros((height, width, 4), np.uint8)
+        for mask in masks:
+            layer, (y, x) = mask.draw_overlay((height, width), 1)
+            rows, cols = layer.shape[:2]
+            np.copyto(overlay[y:y + rows, x:x + cols], layer, where=layer[..., 3:] > 0)
+        preview = colorizer.colorize(depth_image)
+        np.copyto(preview, overlay[..., :3], where=overlay[..., 3:] > 0)
+
+        _write_image(f'{path}-depth.png', depth_image)
+        _write_image(f'{path}-preview.jpg', cv2.cvtColor(preview, cv2.COLOR_RGB2BGR))
+        _write_image(f'{path}-roi.png', cv2.cvtColor(overlay, cv2.COLOR_RGBA2BGRA))
+        _write_json(f'{path}.json', metadata)
+        return f'Saved image {path}'
+
+    def _save_sequence(self, path, camera, count, metadata):
+        frames = f'{path}-depth.npy.tmp'
+        temporary = f'{path}.npz.tmp'
+        depth = None
+        try:
+            frame_numbers = np.zeros(count, dtype=np.uint64)
+            times = np.zeros(count)
+            captured = 0
+            last = camera.frame_number
+            waited = time.time()
+            while captured < count:
+                frame_number = camera.frame_number
+                if frame_number == last:
+                    if time.time() - waited > SEQUENCE_TIMEOUT:
+                        raise RuntimeError(f'no new frame in {SEQUENCE_TIMEOUT} seconds, '
+                                           f'captured {captured} of {count}')
+                    time.sleep(0.002)
+                    continue
+                depth_image = depth_array(camera.depth_frame_raw)
+                if depth_image is None:
+                    continue
+                last = frame_number
+                waited = time.time()
+                if depth is None:
+                    depth = np.lib.format.open_memmap(frames, mode='w+', dtype=np.uint16,
+                                                      shape=(count,) + depth_image.shape)
+                depth[captured] = depth_image
+                frame_numbers[captured] = frame_number
+                times[captured] = waited
+                captured += 1
+            depth.flush()
+            # the memory map must be closed before the file is read or removed
+            depth = None
+
+            # the same layout as np.savez_compressed, the frames are
+            #   compressed straight from the file
+            with zipfile.ZipFile(temporary, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+                archive.write(frames, 'depth.npy')
+                for name, array in (('frame_number', frame_numbers), ('time', times)):
+                    with archive.open(f'{name}.npy', 'w', force_zip64=True) as file:
+                        np.lib.format.write_array(file, array)
+            os.replace(temporary, f'{path}.npz')
+        finally:
+            depth = None
+            for leftover in (frames, temporary):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        _write_json(f'{path}.json', metadata)
+        return f'Saved {count} frames to {path}.npz'
+
+
+def _write_image(path, image):
+    if not cv2.imwrite(path, image):
+        raise OSError(f'could not write "{path}"')
+
+
+def _write_json(path, data):
+    with open(path, 'w') as file:
+        json.dump(data, file, indent=2, default=_json_default)
+
+
+def _json_default(value):
+    """numpy values to plain python"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} is not json serializable')
@@ -0,0 +1,145 @@
+"""
+title:   RealSenseOPC ROI Utility statistics worker
+author:  Nicholas Loehrke
+date:    June 2022
+license: TODO
+
+Depth, invalid percentage and deviation of every region of interest are
+computed on a worker thread for every new frame, in one pass over the frame
+(RoiModel.roi_statistics). The Tk thread hands over the polygons with
+set_regions() and reads the newest result with latest().
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from camera.roi import RoiModel
+
+RoiStats = namedtuple('RoiStats', ['frame_number', 'depth', 'invalid', 'deviation', 'selected'])
+
+
+class StatsWorker():
+    def __init__(self, camera, framerate=30):
+        """compute region of interest statistics on a background thread
+
+        :param camera: Camera or BusCamera
+        :type camera: Camera
+        :param framerate: camera framerate, sets how often the camera is
+        checked for a new frame, defaults to 30
+        :type framerate: int, optional
+        """
+        self._camera = camera
+        self._period = 1 / max(framerate, 1) / 4
+        self._lock = threading.Lock()
+        self._polygons = ()
+        self._selection = ()
+        self._paused = False
+        self._changed = False
+        self._model = None
+        self._model_regions = None
+        self._frame_number = 0
+        self._stats = None
+        self._sequence = 0
+        self._error = None
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """start computing"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='roi-stats', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """stop computing and wait for the worker to finish"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def set_regions(self, polygons, selection, paused=False):
+        """regions of interest to compute. Call from the Tk thread
+
+        :param polygons: one polygon per roi in camera (unscaled)
+        coordinates, an empty list for rois that are not finished
+        :type polygons: list
+        :param selection: indices of the rois whose union is returned as
+        'selected'
+        :type selection: tuple
+        :param paused: stop computing, defaults to False
+        :type paused: bool, optional
+        """
+        polygons = tuple(tuple(tuple(point) for point in polygon) for polygon in polygons)
+        selection = tuple(selection)
+        with self._lock:
+            if polygons != self._polygons or selection != self._selection:
+                self._changed = True
+            self._polygons = polygons
+            self._selection = selection
+            self._paused = paused
+
+    def latest(self):
+        """newest statistics
+
+        :return: sequence number (increases with every result) and per roi
+        depth, invalid and deviation arrays plus the (depth, invalid,
+        deviation) of the selected rois, None before the first frame
+        :rtype: tuple
+        """
+        with self._lock:
+            return self._sequence, self._stats
+
+    @property
+    def error(self):
+        """last error, None if the last frame was computed"""
+        return self._error
+
+    def _run(self):
+        while self._running:
+            with self._lock:
+                polygons = self._polygons
+                selection = self._selection
+                paused = self._paused
+                changed = self._changed
+                self._changed = False
+
+            frame_number = self._camera.frame_number
+            if paused or (frame_number == self._frame_number and not changed):
+                time.sleep(self._period)
+                continue
+
+            try:
+                depth_image = self._camera.filtered_depth_image
+                if depth_image is None:
+                    time.sleep(self._period)
+                    continue
+                self._frame_number = frame_number
+                stats = self.compute(depth_image, polygons, selection)
+                self._error = None
+            except Exception as e:
+                # camera stopped or restarted while computing
+                self._error = e
+                time.sleep(self._period)
+                continue
+
+            with self._lock:
+                self._stats = stats
+                self._sequence += 1
+
+    def compute(self, depth_image, polygons, selection):
+        """statistics of every roi and of the selected rois
+
+        :return: statistics
+        :rtype: RoiStats
+        """
+        height, width = depth_image.shape[:2]
+        if self._model_regions != (polygons, width, height):
+            self._model = RoiModel(polygons, width=width, height=height)
+            self._model_regions = (polygons, width, height)
+        conversion = self._camera.conversion
+        depth, invalid, deviation = self._model.roi_statistics(depth_image, conversion)
+        selected = self._model.statistics(depth_image, selection, conversion)
+        return RoiStats(self._frame_number, depth, invalid, deviation, selected)
@@ -1,11 +1,11 @@
 import os
+import time
 import tkinter as tk
-from tkinter import filedialog
+from tkinter import filedialog, simpledialog
 import webbrowser
-import PIL
-import numpy as np
 from pathlib import Path
-import pyrealsense2 as rs
+
+from camera.snapshot import SnapshotWriter, depth_array
 
 
 DOC_URL = "https://dev.intelrealsense.com/docs/stereo-depth-camera-d400"
@@ -19,6 +19,9 @@ class AppMenu(tk.Menu):
 
         super().__init__(*args, **kwargs)
 
+        self._snapshots = SnapshotWriter(report=self._report)
+        self._sequence_length = 30
+
         self._create_widgets()
 
     def _create_widgets(self):
@@ -30,6 +33,8 @@ class AppMenu(tk.Menu):
                                     command=self.load_configuration)
         self.__filemenu.add_command(label="Save image as",
                                     command=self.save_image)
+        self.__filemenu.add_command(label="Save sequence as",
+                                    command=self.save_sequence)
         self.__filemenu.add_separator()
         self.__filemenu.add_command(label="Exit",
                                     command=self.exit,
@@ -65,21 +70,19 @@ class AppMenu(tk.Menu):
             self._root.settings.open(path)
 
     def save_image(self):
+        """save the newest full resolution frame, its preview, the roi
+        overlay and a settings sidecar. The files are written in the
+        background"""
         try:
-            path = filedialog.asksaveasfilename(
-                initialdir=self._root.path,
-                filetypes=(("image files", "*.jpg"),
-                           ("all files", "*.*")))
+            path = self._ask_path(("image files", "*.png"))
             if path != '':
-                depth_frame = self._root.camera.depth_frame
-                if isinstance(depth_frame, rs.depth_frame):
-                    color_frame = rs.colorizer().colorize(depth_frame)
-                    color_array = np.asanyarray(color_frame.get_data())
-                    for i in range(len(self._root.masks)):
-                        self._root.masks[i].draw(color_array)
-                    color_image = PIL.Image.fromarray(color_array)
-                    color_image = color_image.resize((848, 480))
-                    color_image.save(f'{path}.jpg')
+                depth_image = depth_array(self._root.camera.depth_frame_raw)
+                if depth_image is not None:
+                    self._snapshots.save(path,
+                                         depth_image,
+                                         self._root.camera.colorizer,
+                                         list(self._root.masks),
+                                         self._metadata())
                 else:
                     self._root.terminal.write_error(
                         'Failed to save image: '
@@ -87,6 +90,67 @@ class AppMenu(tk.Menu):
         except Exception as e:
             self._root.terminal.write_error(f'Failed to save image: {e}')
 
+    def save_sequence(self):
+        """capture the next frames into one archive in the background"""
+        try:
+            count = simpledialog.askinteger("Save sequence",
+                                            "Number of frames",
+                                            initialvalue=self._sequence_length,
+                                            minvalue=1,
+                                            maxvalue=10000,
+                                            parent=self._root)
+            if count is None:
+                return
+            path = self._ask_path(("sequence files", "*.npz"))
+            if path != '':
+                self._sequence_length = count
+                self._root.terminal.write_camera(f'Capturing {count} frames')
+                self._snapshots.save_sequence(path, self._root.camera, count, self._metadata())
+        except Exception as e:
+            self._root.terminal.write_error(f'Failed to save sequence: {e}')
+
+    def _ask_path(self, filetype):
+        """ask for a file name, returns it without extension"""
+        path = filedialog.asksaveasfilename(
+            initialdir=self._root.path,
+            filetypes=(filetype, ("all files", "*.*")))
+        return os.path.splitext(path)[0] if path else ''
+
+    def _metadata(self):
+        """settings, polygons and roi stats for a snapshot sidecar"""
+        camera = self._root.camera
+        polygons = {}
+        for i, mask in enumerate(self._root.masks):
+            ret, poly = mask.polygon()
+            if ret:
+                polygons[f'roi_{i + 1}'] = poly.tolist()
+        metadata = {
+            'time': time.time(),
+            'frame_number': camera.frame_number,
+            'width': camera.width,
+            'height': camera.height,
+            'conversion': camera.conversion,
+            'metric': bool(camera.metric),
+            'filter_level': camera.filter_level,
+            'roi': polygons,
+            'configuration': {section: dict(values) for section, values
+                              in self._root.configurator.data.items()},
+        }
+        _, stats = self._root.stats_worker.latest()
+        if stats is not None:
+            metadata['stats'] = {'frame_number': stats.frame_number,
+                                 'depth': stats.depth,
+                                 'invalid': stats.invalid,
+                                 'deviation': stats.deviation}
+        return metadata
+
+    def _report(self, message, error):
+        """snapshot writer callback, runs on the writer thread"""
+        if error:
+            self._root.terminal.write_error(message)
+        else:
+            self._root.terminal.write_camera(message)
+
     def exit(self):
         self._root.on_closing()
 
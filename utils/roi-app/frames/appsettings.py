@@ -149,13 +149,11 @@ class AppSettings(ttk.Labelframe):
             self._root.configurator = Config(path)
 
             # overwrite current roi's from configuration roi's
-            polygons = []
-            for key in self._root.configurator.data['roi']:
-                polygons.append(
-                    list(
-                        eval(
-                            self._root.configurator.get_value(
-                                'roi', key, fallback='[]'))))
+            settings = self._root.configurator.settings
+            for problem in settings.problems:
+                self._root.terminal.write_error(f'Ignored {problem}')
+            polygons = list(settings.roi.polygons)
+            self._root.set_mask_count(len(polygons))
             for _ in range(len(self._root.masks) - len(polygons)):
                 polygons.append([])
             for i in range(len(self._root.masks)):
@@ -181,15 +179,13 @@ class AppSettings(ttk.Labelframe):
             self._root.configurator = Config(path)
 
             # overwrite current roi's from configuration roi's
-            polygons = []
-            for key in self._root.configurator.data['roi']:
-                polygons.append(
-                    list(
-                        eval(
-                            self._root.configurator.get_value(
-                                'roi', key, fallback='[]'))))
+            settings = self._root.configurator.settings
+            for problem in settings.problems:
+                self._root.terminal.write_error(f'Ignored {problem}')
+            polygons = list(settings.roi.polygons)
+            self._root.set_mask_count(len(polygons))
             for _ in range(len(self._root.masks) - len(polygons)):
-                polygons.append('[]')
+                polygons.append([])
             for i in range(len(self._root.masks)):
                 self._root.masks[i].coordinates = polygons[i]
                 self._root.masks[i].complete()
@@ -220,12 +216,17 @@ class AppSettings(ttk.Labelframe):
             for entry in self._entries:
                 entry.save()
 
+            # keep the depth statistic configured in front of each polygon
+            statistics = self._root.configurator.settings.roi.statistics
             with open(path, 'w') as file:
                 for i in range(len(self._root.masks)):
+                    value = str(self._root.masks[i].coordinates)
+                    if i < len(statistics) and statistics[i] != 'mean':
+                        value = f'{statistics[i]} {value}'
                     self._root.configurator.set(
                         'roi',
                         f'roi_{i+1}',
-                        str(self._root.masks[i].coordinates)
+                        value
                     )
 
                 self._root.configurator.save(file)
@@ -266,10 +267,11 @@ class AppSettings(ttk.Labelframe):
             self._root.terminal.write_camera('Synced')
 
     def _sync_camera(self):
-        self._root.camera.filter_level = int(float(self._root.configurator.get_value(
-            'camera', 'spatial_filter_level', '0')))
-        self._root.camera.metric = bool(float(self._root.configurator.get_value(
-            'camera', 'metric', '0')))
+        settings = self._root.configurator.settings.camera
+        self._root.camera.filter_level = settings.spatial_filter_level
+        self._root.camera.metric = settings.metric
+        preview = self._root.configurator.settings.preview
+        self._root.camera.colorizer.set_range(preview.near, preview.far, preview.colormap)
 
     def mouse_click_callback(self, event):
         if self._root.focus_get() is not event.widget:
@@ -0,0 +1,68 @@
+from tkinter import ttk
+
+# constants
+VISIBLE_ROWS = 8  # more rois scroll
+COLUMNS = (('roi', 'roi', 40),
+           ('depth', 'depth', 90),
+           ('invalid', 'invalid %', 90),
+           ('deviation', 'std.', 90))
+
+
+class AppStats(ttk.Labelframe):
+    def __init__(self, *args, **kwargs):
+        """table of depth, invalid % and deviation of every roi. The values
+        come from the statistics worker, this only shows the newest ones"""
+        self._args = args
+        self._kwargs = kwargs
+        self._root = self._args[0]
+        super().__init__(*args, **kwargs)
+
+        self.configure(text='roi stats')
+
+        self._sequence = 0
+        self._rows = []
+        # refresh as fast as the camera makes frames
+        self._period = max(1000 // (self._root.framerate or 30), 1)
+
+        self._table = ttk.Treeview(self,
+                                   columns=[c[0] for c in COLUMNS[1:]],
+                                   height=VISIBLE_ROWS,
+                                   selectmode='browse')
+        for i, (name, heading, width) in enumerate(COLUMNS):
+            column = '#0' if i == 0 else name
+            self._table.heading(column, text=heading)
+            self._table.column(column, width=width, anchor='e', stretch=False)
+        self._table.grid(row=0, column=0, sticky='NSEW')
+
+        self._scrollbar = ttk.Scrollbar(self, orient='vertical', command=self._table.yview)
+        self._table.configure(yscrollcommand=self._scrollbar.set)
+        self._scrollbar.grid(row=0, column=1, sticky='NS')
+
+        self.after(self._period, self.refresh)
+
+    def refresh(self):
+        """show the newest statistics"""
+        masks = self._root.masks
+        while len(self._rows) < len(masks):
+            number = len(self._rows) + 1
+            self._rows.append(self._table.insert('', 'end', text=str(number),
+                                                 values=('-', '-', '-')))
+
+        sequence, stats = self._root.stats_worker.latest()
+        if stats is not None and sequence != self._sequence:
+            self._sequence = sequence
+            unit = 'm' if self._root.camera.metric else 'ft'
+            for i, row in enumerate(self._rows):
+                if i < len(stats.depth) and masks[i].ready:
+                    values = (f'{stats.depth[i]:.3f} {unit}',
+                              f'{stats.invalid[i]:.1f}',
+                              f'{stats.deviation[i]:.3f}')
+                else:
+                    values = ('-', '-', '-')
+                self._table.item(row, values=values)
+
+        self.after(self._period, self.refresh)
+
+    @property
+    def table(self):
+        return self._table
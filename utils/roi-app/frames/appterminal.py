@@ -1,9 +1,15 @@
 import tkinter as tk
+from collections import deque
 from tkinter import ttk
 from tkinter.scrolledtext import ScrolledText
 
 from widgets.tooltip import ButtonToolTip, CheckButtonToolTip
 
+# constants
+MAX_LINES = 1000  # older lines are removed
+TRIM_LINES = 200  # lines removed at once when there are too many
+FLUSH_PERIOD = 100  # milliseconds between terminal updates
+
 
 class AppTerminal(ttk.Labelframe):
     def __init__(self, *args, **kwargs):
@@ -14,6 +20,7 @@ class AppTerminal(ttk.Labelframe):
 
         self._paused = False
         self._lines = 0
+        self._pending = deque(maxlen=MAX_LINES)
         self._expanded = False
         self._camera_supress = False
         self._target_width = 895
@@ -30,6 +37,7 @@ class AppTerminal(ttk.Labelframe):
                                          * self._root.camera.scale)))
 
         self._create_widgets()
+        self.after(FLUSH_PERIOD, self._flush)
 
     def _create_widgets(self):
         # terminal text
@@ -92,13 +100,37 @@ class AppTerminal(ttk.Labelframe):
         self.sync_icons()
 
     def write(self, msg):
+        """queue a line, lines are added to the terminal together on the
+        next update. Safe to call from any thread
+
+        :param msg: line, anything else is written as str(msg)
+        :type msg: string
+        """
         if not self._paused:
-            self._scrolled_text.configure(state='normal')
-            self._scrolled_text.insert('end', f'{msg}\n')
-            self._lines += 1
-            self._scrolled_text.configure(state='disabled')
-            # Autoscroll to the bottom
-            self._scrolled_text.yview('end')
+            self._pending.append(str(msg))
+
+    def _flush(self):
+        """add queued lines with one insert and remove the oldest lines
+        once there are more than MAX_LINES"""
+        try:
+            if self._pending:
+                lines = []
+                while self._pending:
+                    lines.append(self._pending.popleft())
+                self._scrolled_text.configure(state='normal')
+                self._scrolled_text.insert('end', '\n'.join(lines) + '\n')
+                self._lines += sum(line.count('\n') + 1 for line in lines)
+                if self._lines > MAX_LINES + TRIM_LINES:
+                    excess = self._lines - MAX_LINES
+                    self._scrolled_text.delete('1.0', f'{excess + 1}.0')
+                    self._lines = MAX_LINES
+                self._scrolled_text.configure(state='disabled')
+                # Autoscroll to the bottom
+                if not self._paused:
+                    self._scrolled_text.yview('end')
+        finally:
+            # a failed update must not stop the next ones
+            self.after(FLUSH_PERIOD, self._flush)
 
     def write_error(self, msg):
         self.write(f'[Error] {msg}')
@@ -113,6 +145,7 @@ class AppTerminal(ttk.Labelframe):
         self._scrolled_text.configure(state="normal")
         self._scrolled_text.delete('1.0', tk.END)
         self._lines = 0
+        self._pending.clear()
         self._scrolled_text.configure(state="disabled")
 
     def on_scroll(self, evt):
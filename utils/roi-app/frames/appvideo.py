@@ -23,6 +23,12 @@ class AppVideo(ttk.Labelframe):
         self._roi_select_all = tk.BooleanVar()
         self._roi_select_all.set(False)
         self._rotated = False
+        self._image_sequence = 0
+        self._photo_image = None
+        self._photo_size = None
+        # show frames as fast as the camera makes them, framerate 0 is
+        #   picked by the camera
+        self._display_period = max(1000 // (self._root.framerate or 30), 1)
 
         # resize variables
         self._padx = 0
@@ -102,9 +108,19 @@ class AppVideo(ttk.Labelframe):
             width=1,
             takefocus=False
         )
-        values = [x+1 for x in range(len(self._root.masks))]
-        self._mask_select_combobox.configure(values=values, state='readonly')
+        self._mask_select_combobox.configure(state='readonly')
         self._mask_select_combobox.grid(row=0, column=5, padx=self._padx, pady=self._pady)
+        self.update_mask_select()
+
+        # add
+        self._mask_add_button = ButtonToolTip(
+            master=self._mask_control_frame,
+            text='+',
+            command=self.mask_add,
+            width=self._width,
+            helptext='Add a roi'
+        )
+        self._mask_add_button.grid(row=0, column=6, padx=self._padx, pady=self._pady)
 
         # PLAYBACK CONTROLS
         self._playback_controls_frame = ttk.Labelframe(
@@ -175,26 +191,32 @@ class AppVideo(ttk.Labelframe):
         self._video_label.bind("<Button-1>", self.get_coordinates)
         self._video_label.bind("<Button-3>", self.get_coordinates)
 
-        self.after(50, self.set_image)
+        self.after(self._display_period, self.set_image)
 
     def set_image(self):
+        """show the newest image from the render worker. The photo image is
+        kept and its pixels are replaced, a new one is only made when the
+        resolution changes"""
         if not self._paused:
-            color_image = self._root.color_image
-            if isinstance(color_image, np.ndarray):
+            sequence, color_image = self._root.renderer.latest()
+            if isinstance(color_image, np.ndarray) and sequence != self._image_sequence:
                 img_h = color_image.shape[0]
                 img_w = color_image.shape[1]
 
                 if (self._root.camera.width // img_w == self._root.camera.scale and
                         self._root.camera.height // img_h == self._root.camera.scale):
+                    self._image_sequence = sequence
                     img = PIL.Image.fromarray(color_image)
-                    imgtk = PIL.ImageTk.PhotoImage(image=img)
-
-                    self._video_label.imgtk = imgtk
-                    self._video_label.configure(image=imgtk)
-                    self._video_label.update()
+                    if self._photo_image is None or self._photo_size != img.size:
+                        self._photo_image = PIL.ImageTk.PhotoImage(image=img)
+                        self._photo_size = img.size
+                        self._video_label.imgtk = self._photo_image
+                        self._video_label.configure(image=self._photo_image)
+                    else:
+                        self._photo_image.paste(img)
                     self.set_active_mask()
 
-        self.after(50, self.set_image)
+        self.after(self._display_period, self.set_image)
 
     def pause(self):
         self._paused = True
@@ -248,6 +270,17 @@ class AppVideo(ttk.Labelframe):
     def mask_complete(self):
         self._root.masks[self.roi_select].complete()
 
+    def mask_add(self):
+        mask = self._root.add_mask()
+        self._roi_select.set(len(self._root.masks))
+        self.set_active_mask()
+        self._root.terminal.write(f'Added roi {len(self._root.masks)}')
+        return mask
+
+    def update_mask_select(self):
+        values = [x+1 for x in range(len(self._root.masks))]
+        self._mask_select_combobox.configure(values=values)
+
     def rotate(self):
         self._rotated = not self._rotated
 
@@ -299,6 +332,7 @@ class AppVideo(ttk.Labelframe):
         self._mask_complete_button.configure(width=self._width)
         self._mask_see_all_button.configure(width=self._width)
         self._mask_select_combobox.configure(width=self._width)
+        self._mask_add_button.configure(width=self._width)
 
         columns, rows = self._mask_control_frame.grid_size()
         for column in range(columns):
@@ -7,23 +7,26 @@ import tkinter.filedialog as tkFileDialog
 import webbrowser
 from tkinter import messagebox
 
-import numpy as np
-import pyrealsense2 as rs
 import sv_ttk
+from camera.buscamera import BusCamera
 from camera.config import Config
 from camera.mask import MaskWidget
 from camera.newcamera import Camera
+from camera.render import RenderWorker
+from camera.stats import StatsWorker
 
 import cv2
 
 from frames.appmenu import AppMenu
 from frames.appsettings import AppSettings
+from frames.appstats import AppStats
 from frames.appterminal import AppTerminal
 from frames.appvideo import AppVideo
 
 # constants
 HEIGHT = 480
 WIDTH = 848
+NUMBER_OF_ROI = 8  # shown even if the configuration has fewer
 METER_TO_FEET = 3.28084
 
 
@@ -38,12 +41,10 @@ class AppWindow(tk.Tk):
         # create main gui window
         self._title = window_title
         self.__title = window_title
-        self.title(self._title)
 
         self._drag_id = ''
 
         # camera/video variables
-        number_of_roi = 8
         self._roi_depth = 0
         self._roi_min = 0
         self._roi_max = 0
@@ -52,7 +53,6 @@ class AppWindow(tk.Tk):
         self._frame_number = 0
         self._loop_count = 0
         self._new_frame_count = 0
-        self._color_image = None
 
         # resize variables
         self._padx = 1
@@ -81,46 +81,56 @@ class AppWindow(tk.Tk):
                 "file located in the same directory as this program."
             )
 
-        # connect camera
+        # connect camera. if another program (the client) owns the camera
+        #   and publishes its frames, read them from the frame bus instead
         self._configurator = Config(config_filename)
-        self._framerate = int(self._configurator.get_value('camera', 'framerate', '30'))
-        try:
-            self._camera = Camera(width=WIDTH,
-                                  height=HEIGHT,
-                                  framerate=self._framerate,
-                                  config=self._configurator.data)
-            self._camera.options.get_camera_options()
-            self._camera.scale = 2
-            self._camera.start()
-        except RuntimeError as e:
-            if hasattr(self, '_camera'):
-                if self._camera.connected:
-                    self._camera.stop()
-            self.destroy()
-            raise RuntimeError("Could not connect to camera. Make sure camera "
-                               "is plugged in properly and not already in use.")
-            os._exit(1)
+        settings = self._configurator.settings
+        self._framerate = settings.camera.framerate
+        frame_bus = settings.application.frame_bus
+        self._camera = None
+        if frame_bus:
+            try:
+                self._camera = BusCamera(frame_bus, width=WIDTH, height=HEIGHT)
+                self._camera.scale = 2
+                self._camera.start()
+                self.__title = f'{window_title} [frame bus "{frame_bus}"]'
+            except FileNotFoundError:
+                self._camera = None
+        if self._camera is None:
+            try:
+                self._camera = Camera(width=WIDTH,
+                                      height=HEIGHT,
+                                      framerate=self._framerate,
+                                      config=self._configurator.data)
+                self._camera.options.get_camera_options()
+                self._camera.scale = 2
+                self._camera.start()
+            except RuntimeError as e:
+                if self._camera is not None:
+                    if self._camera.connected:
+                        self._camera.stop()
+                self.destroy()
+                raise RuntimeError("Could not connect to camera. Make sure camera "
+                                   "is plugged in properly and not already in use.")
+                os._exit(1)
 
         # set some camera settings
-        self._camera.filter_level = int(self._configurator.get_value(
-            'camera', 'spatial_filter_level', '0'))
-        self._camera.metric = bool(float(self._configurator.get_value(
-            'camera', 'metric', '0.0')))
+        self._camera.filter_level = settings.camera.spatial_filter_level
+        self._camera.metric = settings.camera.metric
 
+        # get region of interests from configuration. any number of roi's
+        #   are supported, there are never fewer than NUMBER_OF_ROI
         self._mask_widgets = []
-        for id in range(number_of_roi):
-            self._mask_widgets.append(MaskWidget(self, id=id+1))
-
-        # get region of interests from configuration
-        polygons = []
-        for key in self._configurator.data['roi']:
-            polygons.append(list(eval(self._configurator.get_value('roi', key, fallback='[]'))))
-        for _ in range(number_of_roi - len(polygons)):
+        polygons = list(settings.roi.polygons)
+        self.set_mask_count(len(polygons))
+        for _ in range(len(self._mask_widgets) - len(polygons)):
             polygons.append([])
-        for i in range(number_of_roi):
+        for i in range(len(self._mask_widgets)):
             self._mask_widgets[i].coordinates = polygons[i]
             self._mask_widgets[i].complete()
 
+        self.title(self.__title)
+
         # build frames
         self._menu = AppMenu(self, tearoff=0)
         self.configure(menu=self._menu)
@@ -138,23 +148,64 @@ class AppWindow(tk.Tk):
                                    padx=self._padx,
                                    pady=self._pady)
 
+        self._stats_widget = AppStats(self, border=self._border)
+        self._stats_widget.grid(row=2,
+                                column=1,
+                                padx=self._padx,
+                                pady=self._pady,
+                                sticky="EW")
+
         self._settings_widget = AppSettings(self, border=self._border)
         self._settings_widget.grid(row=0,
                                    column=3,
-                                   rowspan=2,
+                                   rowspan=3,
                                    padx=self._padx,
                                    pady=self._pady,
                                    sticky="NS")
 
+        for problem in settings.problems:
+            self._terminal_widget.write_error(f'Ignored {problem}')
+        try:
+            self._camera.colorizer.set_range(settings.preview.near,
+                                             settings.preview.far,
+                                             settings.preview.colormap)
+        except ValueError as e:
+            self._terminal_widget.write_error(f'Ignored [preview]: {e}')
+
         # bindings
         self.bind_all("<Control-q>", self.on_closing)
         self.bind_all("<Control-z>", self._video_widget.mask_undo)
         self.bind_all("<Control-r>", self._video_widget.mask_reset)
         self.bind_all("<Configure>", self.dragging)
 
+        # colorize, overlay and rotate on a worker thread
+        self._renderer = RenderWorker(self._camera, self._framerate)
+        self._renderer.start()
+        # roi stats of every roi on another
+        self._stats_worker = StatsWorker(self._camera, self._framerate)
+        self._stats_worker.start()
+
         self._start_time = time.time()
         self.after(20, self.loop)
 
+    def add_mask(self):
+        """add an empty region of interest
+
+        :return: new mask widget
+        :rtype: MaskWidget
+        """
+        mask = MaskWidget(self, id=len(self._mask_widgets) + 1)
+        self._mask_widgets.append(mask)
+        if hasattr(self, '_video_widget'):
+            self._video_widget.update_mask_select()
+        return mask
+
+    def set_mask_count(self, count):
+        """make sure there are at least 'count' (and NUMBER_OF_ROI) regions
+        of interest"""
+        while len(self._mask_widgets) < max(count, NUMBER_OF_ROI):
+            self.add_mask()
+
     @property
     def path(self):
         """root program path getter"""
@@ -192,8 +243,23 @@ class AppWindow(tk.Tk):
 
     @property
     def color_image(self):
-        """color image getter"""
-        return self._color_image
+        """newest rendered color image getter"""
+        return self._renderer.latest()[1]
+
+    @property
+    def renderer(self):
+        """render worker getter"""
+        return self._renderer
+
+    @property
+    def stats_worker(self):
+        """roi statistics worker getter"""
+        return self._stats_worker
+
+    @property
+    def stats(self):
+        """roi stats frame getter"""
+        return self._stats_widget
 
     @property
     def configurator(self):
@@ -221,38 +287,11 @@ class AppWindow(tk.Tk):
         self.title(' '.join((self.__title, title)))
         self._title = title
 
-    def update_roi_stats(self, depth_frame):
-        """computes roi data 
-
-        :param depth_frame: camera depth frame
-        :type depth_frame: pyrealsense2.depth_frame
-        """
-        # get frame and polygon
-        if self._video_widget.roi_select_all:
-            polygons = []
-            for i in range(len(self._mask_widgets)):
-                ret, poly = self._mask_widgets[i].polygon()
-                if ret:
-                    polygons.append(poly)
-
-            if isinstance(depth_frame, rs.depth_frame):
-                d, i, s = self._camera.ROI_datan(polygons)
-
-                self._roi_depth = d
-                self._roi_deviation = s
-                self._roi_invalid = i
-        else:
-            polygons = []
-            ret, poly = self._mask_widgets[self._video_widget.roi_select].polygon()
-            if ret:
-                polygons.append(poly)
-
-            if isinstance(depth_frame, rs.depth_frame):
-                d, i, s = self._camera.ROI_datan(polygons)
-
-                self._roi_depth = d
-                self._roi_deviation = s
-                self._roi_invalid = i
+    def update_roi_stats(self):
+        """takes the stats of the selected roi(s) from the statistics worker"""
+        _, stats = self._stats_worker.latest()
+        if stats is not None:
+            self._roi_depth, self._roi_invalid, self._roi_deviation = stats.selected
 
     @property
     def formatted_stats(self):
@@ -265,33 +304,33 @@ class AppWindow(tk.Tk):
                 f'[Invalid:\t{i:.1f}]')
 
     def loop(self):
-        """updates video and draws masks"""
-        # update video and roi stats()
+        """hands the masks to draw to the render worker, the regions of
+        interest to the statistics worker and writes roi stats"""
+        if self._video_widget.roi_select_all:
+            masks = self._mask_widgets
+        else:
+            masks = [self._mask_widgets[self._video_widget.roi_select]]
+        self._renderer.set_scene(masks,
+                                 self._video_widget.rotated,
+                                 self._video_widget.paused)
+
+        polygons = []
+        for mask in self._mask_widgets:
+            ret, poly = mask.polygon()
+            polygons.append(poly.tolist() if ret else [])
+        selection = [self._mask_widgets.index(mask) for mask in masks if mask.ready]
+        self._stats_worker.set_regions(polygons, selection, self._video_widget.paused)
+
         if not self._video_widget.paused:
-            depth_frame = self._camera.depth_frame
             frame_number = self._camera.frame_number
-            if isinstance(depth_frame, rs.depth_frame) and frame_number > self._frame_number:
+            if frame_number > self._frame_number:
                 self._new_frame_count += 1
                 self._frame_number = frame_number
 
-                depth_color_frame = self._camera.colorizer.colorize(depth_frame)
-                color_image: np.ndarray = np.asanyarray(depth_color_frame.get_data())
-
-                if self._video_widget.roi_select_all:
-                    for i in range(len(self._mask_widgets)):
-                        self._mask_widgets[i].draw(color_image)
-                else:
-                    self._mask_widgets[self._video_widget.roi_select].draw(color_image)
-
-                if self._video_widget.rotated:
-                    color_image = np.rot90(color_image, 2)
-
-                self._color_image = color_image
-
         if self._new_frame_count > self._framerate:
             if self._mask_widgets[self._video_widget.roi_select].ready:
                 if not self._terminal_widget.camera_supress:
-                    self.update_roi_stats(depth_frame)
+                    self.update_roi_stats()
                     self._terminal_widget.write(self.formatted_stats)
             self._new_frame_count = 0
         self.after(10, self.loop)
@@ -328,6 +367,7 @@ class AppWindow(tk.Tk):
 
         self._video_widget.configure(border=self._border)
         self._terminal_widget.configure(border=self._border)
+        self._stats_widget.configure(border=self._border)
         self._settings_widget.configure(border=self._border)
 
     def dragging(self, event):
@@ -349,6 +389,8 @@ class AppWindow(tk.Tk):
         """prompt user if they are sure they want to quit when they hit the 'x'"""
         try:
             if messagebox.askokcancel("Quit", "Do you want to quit?"):
+                self._renderer.stop()
+                self._stats_worker.stop()
                 if self._camera.connected:
                     self._camera.stop()
                 self.destroy()